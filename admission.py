@@ -0,0 +1,142 @@
+"""
+Admission control in front of Ollama.
+
+At most `max_concurrent` generations run at once; the rest wait in a bounded
+queue. Waiting requests are admitted round-robin across clients (session or
+IP), so one client with many requests can't starve everybody else. When the
+queue is full, enqueue() raises QueueFull straight away with a Retry-After
+estimate, instead of letting every request slow down until it times out.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional
+
+_QUEUED, _ADMITTED, _RELEASED = 0, 1, 2
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"server busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One request's place in line. Always release() it, admitted or not."""
+    __slots__ = ("controller", "client", "state", "future", "admitted_at")
+
+    def __init__(self, controller: "AdmissionController", client: str):
+        self.controller = controller
+        self.client = client
+        self.state = _QUEUED
+        self.future: Optional[asyncio.Future] = None
+        self.admitted_at = 0.0
+
+    @property
+    def queued(self) -> bool:
+        return self.state == _QUEUED
+
+    def position(self) -> int:
+        """1-based place in line (0 once admitted)."""
+        return self.controller._position(self) if self.state == _QUEUED else 0
+
+    async def wait(self) -> None:
+        """Block until admitted."""
+        if self.state == _QUEUED:
+            await asyncio.shield(self.future)
+
+    def release(self) -> None:
+        """Free the slot, or leave the queue; safe to call more than once."""
+        self.controller._release(self)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.service_time = 5.0   # EWMA of seconds a slot is held; feeds Retry-After
+        # client -> its waiting tickets; dict order is the round-robin order
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+
+    def enqueue(self, client: str) -> Ticket:
+        ticket = Ticket(self, client)
+        if self.active < self.max_concurrent and not self.queued:
+            self._admit(ticket)
+        elif self.queued >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+        else:
+            ticket.future = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(client, deque()).append(ticket)
+            self.queued += 1
+        return ticket
+
+    def retry_after(self) -> int:
+        waves = (self.queued + 1) / self.max_concurrent
+        return max(1, math.ceil(self.service_time * waves))
+
+    def _admit(self, ticket: Ticket) -> None:
+        ticket.state = _ADMITTED
+        ticket.admitted_at = time.monotonic()
+        self.active += 1
+        self.admitted += 1
+        if ticket.future is not None and not ticket.future.done():
+            ticket.future.set_result(None)
+
+    def _release(self, ticket: Ticket) -> None:
+        if ticket.state == _QUEUED:
+            queue = self._queues.get(ticket.client)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self.queued -= 1
+                if not queue:
+                    del self._queues[ticket.client]
+            if ticket.future is not None and not ticket.future.done():
+                ticket.future.cancel()
+        elif ticket.state == _ADMITTED:
+            self.active -= 1
+            held = time.monotonic() - ticket.admitted_at
+            self.service_time = 0.8 * self.service_time + 0.2 * held
+        ticket.state = _RELEASED
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.active < self.max_concurrent and self._queues:
+            client, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(client)   # this client goes to the back
+            else:
+                del self._queues[client]
+            self._admit(ticket)
+
+    def _position(self, ticket: Ticket) -> int:
+        # Round-robin: everyone gets one turn per round, so a ticket k-deep in
+        # its client's queue waits for up to k tickets from every other client,
+        # plus one from each client ahead of its own in this round.
+        queue = self._queues[ticket.client]
+        depth = queue.index(ticket)
+        ahead = 0
+        before_own = True
+        for client, q in self._queues.items():
+            if client == ticket.client:
+                before_own = False
+                continue
+            ahead += min(len(q), depth + (1 if before_own else 0))
+        return ahead + depth + 1
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "clients_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_service_s": round(self.service_time, 3),
+        }
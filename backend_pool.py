@@ -0,0 +1,300 @@
+"""
+A pool of Ollama servers for the web server.
+
+  - each request goes to the healthy backend with the fewest requests in flight,
+    unless it carries an affinity key (a session id, or persona + opening
+    message): then it goes to the key's owner on a consistent-hash ring, so
+    every turn of a conversation lands on the server that already holds its
+    prefix in KV cache. When a backend is ejected or removed, only the keys
+    it owned move to the next backend on the ring; the rest stay put.
+  - a background task probes every backend's /api/version; a backend that
+    fails `eject_after` times in a row (probes, connection errors or 5xx
+    answers) is ejected, and readmitted as soon as a probe succeeds again.
+    A server that answers /api/version but 5xx on generations would pass
+    every probe, so after 5xx answers probes count for nothing for a backoff
+    (doubling each time it is ejected for them, reset by a good generation),
+    and then READMIT_PROBES good ones in a row are needed
+  - if a backend refuses the connection, the request is retried on another
+    one (only before anything was received, so nothing is sent twice)
+  - the final response (the "done" chunk when streaming) carries the url of
+    the backend that answered under "backend", for per-backend stats
+
+With a single URL this behaves exactly like talking to that server directly.
+"""
+import asyncio
+import bisect
+import hashlib
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+import ollama_client
+
+VNODES = 64            # ring points per backend; more = more even key spread
+AFFINITY_MEMORY = 10000  # affinity keys remembered for the hit ratio
+SERVER_ERROR_BACKOFF = 10.0       # seconds probes are ignored after a 5xx; doubles per ejection
+MAX_SERVER_ERROR_BACKOFF = 300.0
+READMIT_PROBES = 3     # good probes in a row to readmit a backend ejected for 5xx
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.md5(text.encode()).digest()[:8], "big")
+
+
+class Backend:
+    __slots__ = ("url", "in_flight", "healthy", "failures", "requests", "errors",
+                 "sticky", "sticky_hits", "prompt_evals", "prompt_eval_s",
+                 "server_error_at", "backoff", "good_probes")
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.healthy = True
+        self.failures = 0        # consecutive
+        self.requests = 0
+        self.errors = 0
+        self.sticky = 0          # repeat requests for an affinity key seen before
+        self.sticky_hits = 0     # ... that landed where that key went last time
+        self.prompt_evals = 0
+        self.prompt_eval_s = 0.0
+        self.server_error_at = float("-inf")   # monotonic time of the last 5xx
+        self.backoff = 0.0       # set while ejected (or on probation) for 5xx answers
+        self.good_probes = 0     # in a row, counted once the backoff is over
+
+    def report(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "affinity_repeats": self.sticky,
+            "affinity_hit_ratio": self.sticky_hits / self.sticky if self.sticky else None,
+            "avg_prompt_eval_ms": (
+                round(1000 * self.prompt_eval_s / self.prompt_evals, 1) if self.prompt_evals else None
+            ),
+        }
+
+
+class BackendPool:
+    def __init__(self, urls: Sequence[str], probe_interval: float = 5.0, eject_after: int = 2):
+        self.backends: List[Backend] = []
+        self.probe_interval = probe_interval
+        self.eject_after = eject_after
+        self.retries = 0
+        self._ring: List[Tuple[int, Backend]] = []
+        self._ring_keys: List[int] = []
+        self._last: "OrderedDict[str, str]" = OrderedDict()   # affinity key -> backend url
+        self._probe_task = None
+        for url in urls:
+            self.add(url)
+
+    # -------- membership --------
+
+    def add(self, url: str) -> Backend:
+        """Add a backend; it takes over roughly 1/n of the affinity keys."""
+        backend = Backend(url)
+        self.backends.append(backend)
+        self._ring.extend((_hash(f"{backend.url}#{i}"), backend) for i in range(VNODES))
+        self._rebuild()
+        return backend
+
+    def remove(self, url: str) -> bool:
+        """Drop a backend; only the affinity keys it owned move elsewhere."""
+        url = url.rstrip("/")
+        gone = [b for b in self.backends if b.url == url]
+        if not gone:
+            return False
+        self.backends = [b for b in self.backends if b.url != url]
+        self._ring = [(h, b) for h, b in self._ring if b.url != url]
+        self._rebuild()
+        return True
+
+    def _rebuild(self) -> None:
+        self._ring.sort(key=lambda point: point[0])
+        self._ring_keys = [h for h, _ in self._ring]
+
+    # -------- routing --------
+
+    def pick(self, exclude: Sequence[Backend] = (), affinity: Optional[str] = None) -> Optional[Backend]:
+        """
+        The affinity key's owner on the ring, skipping unhealthy/excluded
+        backends; without a key, least outstanding requests among healthy
+        backends. Falls back to unhealthy ones if nothing else is left.
+        """
+        candidates = [b for b in self.backends if b not in exclude]
+        healthy = [b for b in candidates if b.healthy]
+        pool = healthy or candidates
+        if not pool:
+            return None
+        if affinity is None or not self._ring:
+            return min(pool, key=lambda b: (b.in_flight, b.requests))
+
+        start = bisect.bisect(self._ring_keys, _hash(affinity))
+        for i in range(len(self._ring)):
+            backend = self._ring[(start + i) % len(self._ring)][1]
+            if backend in pool:
+                return backend
+        return None
+
+    def _count_sticky(self, backend: Backend, affinity: Optional[str]) -> None:
+        if affinity is None:
+            return
+        previous = self._last.get(affinity)
+        if previous is not None:
+            backend.sticky += 1
+            if previous == backend.url:
+                backend.sticky_hits += 1
+        self._last[affinity] = backend.url
+        self._last.move_to_end(affinity)
+        while len(self._last) > AFFINITY_MEMORY:
+            self._last.popitem(last=False)
+
+    @staticmethod
+    def _observe(backend: Backend, data: Optional[dict]) -> None:
+        if data:
+            data["backend"] = backend.url
+        if data and data.get("prompt_eval_duration") is not None:
+            backend.prompt_evals += 1
+            backend.prompt_eval_s += data["prompt_eval_duration"] / 1e9
+
+    def _failed(self, backend: Backend) -> None:
+        backend.errors += 1
+        backend.failures += 1
+        if backend.failures >= self.eject_after:
+            backend.healthy = False
+
+    def _server_error(self, backend: Backend) -> None:
+        was_healthy = backend.healthy
+        self._failed(backend)
+        backend.server_error_at = time.monotonic()
+        if was_healthy and not backend.healthy:
+            backend.backoff = min(2 * backend.backoff or SERVER_ERROR_BACKOFF, MAX_SERVER_ERROR_BACKOFF)
+            backend.good_probes = 0
+
+    @staticmethod
+    def _ok(backend: Backend) -> None:
+        """A good generation: the only thing that fully clears a backend."""
+        backend.failures = 0
+        backend.healthy = True
+        backend.backoff = 0.0
+
+    @staticmethod
+    def _probe_ok(backend: Backend) -> None:
+        if time.monotonic() - backend.server_error_at < max(backend.backoff, SERVER_ERROR_BACKOFF):
+            backend.good_probes = 0
+            return   # 5xx answers are recent: /api/version answering proves nothing
+        if not backend.healthy and backend.backoff:
+            backend.good_probes += 1
+            if backend.good_probes < READMIT_PROBES:
+                return
+        backend.good_probes = 0
+        backend.failures = 0
+        backend.healthy = True
+
+    # -------- requests --------
+
+    async def achat(self, path: str, payload: dict,
+                    affinity: Optional[str] = None) -> Tuple[Optional[dict], Optional[str]]:
+        """Non-streaming request to path (e.g. "/api/chat") on the best backend."""
+        tried: List[Backend] = []
+        err = "no ollama backends configured"
+        backend = self.pick(affinity=affinity)
+        while backend is not None:
+            backend.in_flight += 1
+            backend.requests += 1
+            try:
+                data, err = await ollama_client.achat(backend.url + path, payload)
+            finally:
+                backend.in_flight -= 1
+            if not (err and err.startswith(ollama_client.CONNECT_ERROR)):
+                if not err:
+                    self._ok(backend)
+                elif err.startswith(ollama_client.SERVER_ERROR):
+                    self._server_error(backend)   # it got the request, so no retry, but it is unwell
+                self._count_sticky(backend, affinity)
+                self._observe(backend, data)
+                return data, err
+            self._failed(backend)
+            tried.append(backend)
+            backend = self.pick(tried, affinity)
+            if backend is not None:
+                self.retries += 1
+        return None, err
+
+    async def astream(self, path: str, payload: dict,
+                      affinity: Optional[str] = None) -> AsyncIterator[dict]:
+        """Streaming version of achat(); same chunk/error shapes as ollama_client.astream."""
+        tried: List[Backend] = []
+        last = {"error": "no ollama backends configured"}
+        backend = self.pick(affinity=affinity)
+        while backend is not None:
+            backend.in_flight += 1
+            backend.requests += 1
+            received = False
+            try:
+                async for chunk in ollama_client.astream(backend.url + path, payload):
+                    err = chunk.get("error", "")
+                    if not received and err.startswith(ollama_client.CONNECT_ERROR):
+                        last = chunk
+                        break
+                    if not received:
+                        received = True
+                        self._count_sticky(backend, affinity)
+                    if err.startswith(ollama_client.SERVER_ERROR):
+                        self._server_error(backend)
+                    elif chunk.get("done"):
+                        self._ok(backend)
+                        self._observe(backend, chunk)
+                    yield chunk
+            finally:
+                backend.in_flight -= 1
+            if received:
+                return
+            self._failed(backend)
+            tried.append(backend)
+            backend = self.pick(tried, affinity)
+            if backend is not None:
+                self.retries += 1
+        yield last
+
+    async def aembed(self, model: str, text: str) -> Tuple[Optional[list], Optional[str]]:
+        data, err = await self.achat("/api/embed", {"model": model, "input": text})
+        if err:
+            return None, err
+        return ollama_client.first_embedding(data)
+
+    # -------- health checks --------
+
+    async def probe_once(self) -> None:
+        results = await asyncio.gather(*(ollama_client.aprobe(b.url) for b in self.backends))
+        for backend, ok in zip(self.backends, results):
+            if ok:
+                self._probe_ok(backend)
+            else:
+                backend.failures += 1
+                if backend.failures >= self.eject_after:
+                    backend.healthy = False
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self.probe_interval)
+
+    def start(self) -> None:
+        if self._probe_task is None:
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    def stop(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    def report(self) -> dict:
+        sticky = sum(b.sticky for b in self.backends)
+        hits = sum(b.sticky_hits for b in self.backends)
+        return {
+            "retries": self.retries,
+            "affinity_hit_ratio": hits / sticky if sticky else None,
+            "backends": [b.report() for b in self.backends],
+        }
@@ -0,0 +1,165 @@
+"""
+Bulk prompt runs: JSONL in, JSONL out.
+
+Input, one job per line (blank lines ignored):
+
+    {"id": "q1", "prompt": "what is BFS"}
+    {"id": "q2", "messages": [{"role": "user", "content": "hi"}], "tars": true}
+
+`id` defaults to the line number and must be a string or an integer. Jobs
+are read lazily and run `concurrency` at a time; each result is yielded (and,
+from the CLI, appended to the output file) as soon as it finishes, so the
+output order is completion order:
+
+    {"id": "q1", "reply": "...", "latency_s": 1.234}
+    {"id": "q2", "error": "...", "latency_s": 0.002}
+
+To resume after a crash, run again with the same output file: ids that
+already have a reply there are skipped, failed ones are retried.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional, Set, Tuple
+
+Call = Callable[[dict], Awaitable[Tuple[Optional[str], Optional[str]]]]
+
+
+def finished_ids(out_path: str) -> Set:
+    """Ids with a reply in an earlier run's output; also drops a half-written last line."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, "rb+") as f:
+        good = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break   # torn write from a crash
+            good += len(line)
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if "reply" in result:
+                done.add(result.get("id"))
+        f.truncate(good)
+    return done
+
+
+def _valid_messages(messages) -> bool:
+    return isinstance(messages, list) and all(
+        isinstance(m, dict) and isinstance(m.get("role"), str) and isinstance(m.get("content"), str)
+        for m in messages
+    )
+
+
+def make_job(obj, default_id) -> dict:
+    """Validate one input object; problems become an "error" the runner reports."""
+    job = dict(obj) if isinstance(obj, dict) else {"error": "expected a JSON object"}
+    job.setdefault("id", default_id)
+    if type(job["id"]) not in (str, int):   # resume looks ids up in a set; true/false are no ids either
+        return {"id": default_id, "error": "id must be a string or an integer"}
+    if "error" in job:
+        return job
+    if not job.get("prompt") and not job.get("messages"):
+        job["error"] = "missing prompt or messages"
+    elif job.get("messages") and not _valid_messages(job["messages"]):
+        job["error"] = 'messages must be a list of {"role": str, "content": str}'
+    elif job.get("prompt") and not isinstance(job["prompt"], str):
+        job["error"] = "prompt must be a string"
+    return job
+
+
+def iter_jobs(lines: Iterable[str], skip: Set = frozenset()) -> Iterator[dict]:
+    """Parse JSONL jobs one line at a time, skipping ids in `skip`."""
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            job = make_job(json.loads(line), lineno)
+        except ValueError:
+            job = {"id": lineno, "error": "invalid json"}
+        if job["id"] not in skip:
+            yield job
+
+
+class BatchStats:
+    __slots__ = ("done", "failed", "skipped", "started", "busy_s")
+
+    def __init__(self, skipped: int = 0):
+        self.done = 0
+        self.failed = 0
+        self.skipped = skipped
+        self.started = time.perf_counter()
+        self.busy_s = 0.0     # sum of per-job latencies
+
+    def report(self) -> dict:
+        wall = time.perf_counter() - self.started
+        finished = self.done + self.failed
+        return {
+            "done": self.done,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "wall_s": round(wall, 3),
+            "per_s": round(finished / wall, 2) if wall else None,
+            "avg_latency_s": round(self.busy_s / finished, 3) if finished else None,
+        }
+
+    def summary(self) -> str:
+        r = self.report()
+        return (
+            f"[batch: {r['done']} done, {r['failed']} failed, {r['skipped']} skipped"
+            f" | {r['wall_s']:.1f}s | {r['per_s'] or 0:.2f} prompts/s"
+            f" | avg latency {r['avg_latency_s'] or 0:.2f}s]"
+        )
+
+
+async def run_batch(jobs: Iterable[dict], call: Call, concurrency: int = 4,
+                    stats: Optional[BatchStats] = None) -> AsyncIterator[dict]:
+    """Run call(job) for every job, at most `concurrency` at once; yield results as they finish."""
+    stats = stats if stats is not None else BatchStats()
+    jobs = iter(jobs)
+    # Bounded, so a slow consumer stops the workers instead of buffering everything
+    results: asyncio.Queue = asyncio.Queue(maxsize=2 * max(1, concurrency))
+
+    async def worker():
+        try:
+            for job in jobs:   # shared iterator: each job is taken by exactly one worker
+                await results.put(await _run_one(job, call, stats))
+        except Exception as e:
+            await results.put(e)   # re-raised by the consumer below
+        else:
+            await results.put(None)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    running = len(workers)
+    try:
+        while running:
+            result = await results.get()
+            if result is None:
+                running -= 1
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                yield result
+    finally:
+        for w in workers:
+            w.cancel()
+
+
+async def _run_one(job: dict, call: Call, stats: BatchStats) -> dict:
+    start = time.perf_counter()
+    reply, err = None, job.get("error")
+    if err is None:
+        reply, err = await call(job)
+    latency = time.perf_counter() - start
+    stats.busy_s += latency
+    if err:
+        stats.failed += 1
+        result = {"id": job["id"], "error": err}
+    else:
+        stats.done += 1
+        result = {"id": job["id"], "reply": reply}
+    result["latency_s"] = round(latency, 3)
+    return result
@@ -0,0 +1,130 @@
+"""
+Routing benchmark for backend_pool.BackendPool, no real models needed.
+
+Starts several mock Ollama servers with different speeds plus one address
+where nothing is listening, then sends concurrent chats through the pool.
+Least-outstanding-requests routing should send more traffic to the fast
+backends; the dead one should be ejected after a couple of connection
+failures, with those requests retried elsewhere.
+
+Then it replays multi-turn conversations with and without session affinity.
+The mock only pays prompt-eval time for messages it hasn't seen, so sticky
+routing should keep prompt eval per turn flat. Finally it counts how many
+affinity keys move when one backend leaves the ring (ideally about 1/n).
+
+    python3 benchmarks/bench_backends.py -n 200 -c 16 --delays 0.05,0.05,0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ollama_client  # noqa: E402
+from backend_pool import BackendPool  # noqa: E402
+from mock_ollama import MockOllama  # noqa: E402
+
+
+def _dead_url() -> str:
+    """An address that refuses connections."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+async def run(pool: BackendPool, n: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+    payload = {"model": "mock", "messages": [{"role": "user", "content": "ping"}], "stream": False}
+
+    async def one():
+        async with sem:
+            _, err = await pool.achat("/api/chat", payload)
+            if err:
+                raise SystemExit(f"request failed: {err}")
+
+    pool.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    wall = time.perf_counter() - start
+    pool.stop()
+    return wall
+
+
+async def converse(pool: BackendPool, conversations: int, turns: int, sticky: bool) -> list:
+    """Average prompt-eval seconds for each turn index, over concurrent conversations."""
+    evals = [[] for _ in range(turns)]
+
+    async def one(c: int):
+        messages = []
+        for t in range(turns):
+            messages.append({"role": "user", "content": f"conversation {c} turn {t} sticky={sticky}"})
+            payload = {"model": "mock", "messages": list(messages), "stream": False}
+            data, err = await pool.achat("/api/chat", payload, f"conv-{c}" if sticky else None)
+            if err:
+                raise SystemExit(f"request failed: {err}")
+            evals[t].append(data["prompt_eval_duration"] / 1e9)
+            messages.append(data["message"])
+            await asyncio.sleep(random.uniform(0, 0.05))   # users type at different speeds
+
+    await asyncio.gather(*(one(c) for c in range(conversations)))
+    return [sum(e) / len(e) for e in evals]
+
+
+async def bench(args, urls: list, even_urls: list) -> tuple:
+    pool = BackendPool(urls + [_dead_url()], probe_interval=0.5)
+    wall = await run(pool, args.n, args.c)
+    # equally fast backends here, so only cache locality differs
+    loose = await converse(BackendPool(even_urls), args.conversations, args.turns, False)
+    sticky_pool = BackendPool(even_urls)
+    sticky = await converse(sticky_pool, args.conversations, args.turns, True)
+    await ollama_client.aclose()
+    return pool, wall, loose, sticky_pool, sticky
+
+
+def moved_keys(pool: BackendPool, keys: int = 10000) -> float:
+    """Fraction of affinity keys that change owner when the first backend leaves."""
+    before = [pool.pick(affinity=f"k{i}") for i in range(keys)]
+    pool.remove(pool.backends[0].url)
+    after = [pool.pick(affinity=f"k{i}") for i in range(keys)]
+    return sum(a is not b for a, b in zip(before, after)) / keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=200, help="total requests")
+    parser.add_argument("-c", type=int, default=16, help="concurrent requests")
+    parser.add_argument("--delays", default="0.05,0.05,0.2", help="per-mock reply time (s)")
+    parser.add_argument("--conversations", type=int, default=12, help="multi-turn conversations")
+    parser.add_argument("--turns", type=int, default=6, help="turns per conversation")
+    args = parser.parse_args()
+
+    mocks = [MockOllama(delay=float(d)).start() for d in args.delays.split(",")]
+    even = [MockOllama(delay=0.05).start() for _ in mocks]
+    try:
+        pool, wall, loose, sticky_pool, sticky = asyncio.run(
+            bench(args, [m.base_url for m in mocks], [m.base_url for m in even])
+        )
+    finally:
+        for m in mocks + even:
+            m.stop()
+
+    print(f"requests   : {args.n} ({args.c} concurrent) in {wall:.2f}s, {args.n / wall:.1f} req/s")
+    print(f"retries    : {pool.retries}")
+    for b, d in zip(pool.backends, args.delays.split(",") + ["dead"]):
+        print(f"  {b.url:28} delay={d:5}  requests={b.requests:4}  errors={b.errors:2}  healthy={b.healthy}")
+    print()
+    print(f"conversations : {args.conversations} x {args.turns} turns")
+    print("prompt eval ms by turn (new messages only are evaluated when the prefix is warm):")
+    print("  without affinity: " + " ".join(f"{1000 * x:5.1f}" for x in loose))
+    print("  with affinity   : " + " ".join(f"{1000 * x:5.1f}" for x in sticky))
+    print(f"affinity hits : {sticky_pool.report()['affinity_hit_ratio']:.0%}")
+    print(f"keys moved    : {moved_keys(sticky_pool):.0%} when 1 of {len(mocks)} backends leaves")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Cancellation benchmark: does Ollama stop when nobody wants the reply?
+
+Starts the mock and the web server (uvicorn) as separate processes. First a
+few full replies, so the server knows how long a generation takes; then -n
+streamed chats that hang up after --after tokens, and -n that ask for a
+--timeout shorter than their reply. Reports how many generations the mock
+saw aborted (only streamed ones: like a real server it notices at its next
+write), the generation time it skipped (tokens never generated times
+--token-delay) next to the server's own estimate on /metrics, and how close
+to the timeout the timed-out requests ended. Requests still queued for an
+admission slot at their deadline never reach the mock at all. Exits 1 if
+any generation other than the full replies ran to the end.
+
+    python3 benchmarks/bench_cancel.py -n 8 --reply-tokens 200 --token-delay 0.02
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MOCK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_ollama.py")
+FULL = 2   # replies read to the end first
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit(f"{url} did not come up")
+        time.sleep(0.1)
+
+
+def _metric(text: str, name: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    return 0.0
+
+
+async def hang_up(client: httpx.AsyncClient, i: int, after: int) -> None:
+    body = {"messages": [{"role": "user", "content": f"hang up {i}"}], "no_cache": True}
+    async with client.stream("POST", "/api/chat/stream", json=body) as resp:
+        tokens = 0
+        async for line in resp.aiter_lines():
+            tokens += '"token"' in line
+            if tokens >= after:
+                return   # closes the connection mid-reply
+
+
+async def time_out(client: httpx.AsyncClient, i: int, timeout: float) -> float:
+    body = {"messages": [{"role": "user", "content": f"time out {i}"}], "no_cache": True, "timeout": timeout}
+    start = time.perf_counter()
+    resp = await client.post("/api/chat", json=body)
+    if resp.status_code != 504:
+        raise SystemExit(f"expected 504 for a request past its deadline, got {resp.status_code}")
+    return time.perf_counter() - start
+
+
+async def run(url: str, args) -> list:
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        for i in range(FULL):
+            body = {"messages": [{"role": "user", "content": f"full {i}"}], "no_cache": True}
+            (await client.post("/api/chat", json=body)).raise_for_status()
+        await asyncio.gather(*(hang_up(client, i, args.after) for i in range(args.n)))
+        return await asyncio.gather(*(time_out(client, i, args.timeout) for i in range(args.n)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=8, help="clients per scenario")
+    parser.add_argument("--after", type=int, default=5, help="tokens read before hanging up")
+    parser.add_argument("--timeout", type=float, default=1.0, help="request timeout (s)")
+    parser.add_argument("--reply-tokens", type=int, default=200)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    mock_port, web_port = _free_port(), _free_port()
+    mock = subprocess.Popen([
+        sys.executable, MOCK, "--port", str(mock_port), "--delay", "0.1",
+        "--token-delay", str(args.token_delay), "--reply-tokens", str(args.reply_tokens),
+    ], stdout=subprocess.DEVNULL)
+    env = dict(os.environ, OLLAMA_HOSTS=f"http://127.0.0.1:{mock_port}")
+    env.pop("TERMINAL_GPT_CACHE_DB", None)
+    web = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "web_server:app", "--port", str(web_port),
+        "--log-level", "warning", "--no-access-log",
+    ], cwd=ROOT, env=env)
+    try:
+        mock_url, web_url = f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{web_port}"
+        _wait_ready(mock_url + "/api/version")
+        _wait_ready(web_url + "/metrics")
+        timed_out = asyncio.run(run(web_url, args))
+        time.sleep(5 * args.token_delay + 0.2)   # the mock notices at its next token
+        stats = httpx.get(mock_url + "/api/mock/stats").json()
+        metrics = httpx.get(web_url + "/metrics").text
+    finally:
+        web.terminate()
+        mock.terminate()
+        web.wait()
+        mock.wait()
+
+    reclaimed = _metric(metrics, "terminal_gpt_upstream_generation_seconds_reclaimed_total")
+    aborted = _metric(metrics, "terminal_gpt_upstream_generations_aborted_total")
+    finished = _metric(metrics, "terminal_gpt_upstream_generation_seconds_count")
+    print(f"hung up / timed out : {args.n} / {args.n}")
+    print(f"finished (server)   : {finished:.0f} ({FULL} read to the end)")
+    print(f"aborted (server)    : {aborted:.0f}")
+    print(f"aborted (mock)      : {stats['aborted']} (it only notices streamed ones)")
+    print(f"skipped (mock)      : {stats['tokens_skipped']} tokens, {stats['tokens_skipped'] * args.token_delay:.1f}s")
+    print(f"reclaimed (server)  : {reclaimed:.1f}s estimated")
+    print(f"timeout {args.timeout:.1f}s ended  : max {max(timed_out):.2f}s")
+    sys.exit(0 if finished == FULL else 1)
+
+
+if __name__ == "__main__":
+    main()
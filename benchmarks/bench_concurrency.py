@@ -0,0 +1,129 @@
+"""
+Concurrency benchmark for web_server /api/chat.
+
+Fires N simultaneous chats at the FastAPI app (in-process, via ASGI) while a
+mock Ollama answers each one after a fixed delay. If the handler blocks the
+event loop the requests run one at a time (wall ~= N * delay); with the async
+client they overlap (wall ~= delay).
+
+Then checks coalescing against admission control: with one generation slot,
+/api/chat and /api/chat/stream with the same prompt (twice each) may only
+join a generation of their own kind, and never run two at once. Last,
+malformed messages (not objects, content not a string) must get a 422.
+
+    python3 benchmarks/bench_concurrency.py -n 20 --delay 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import web_server  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+from backend_pool import BackendPool  # noqa: E402
+from singleflight import SingleFlight  # noqa: E402
+from mock_ollama import MockOllama  # noqa: E402
+
+
+async def run(n: int) -> float:
+    transport = httpx.ASGITransport(app=web_server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        body = {"messages": [{"role": "user", "content": "ping"}], "persona_id": "normal"}
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/api/chat", json=body) for _ in range(n)))
+        wall = time.perf_counter() - start
+    failed = [r for r in responses if r.status_code != 200]
+    if failed:
+        raise SystemExit(f"{len(failed)} requests failed: {failed[0].text}")
+    return wall
+
+
+async def run_mixed(mock: MockOllama) -> None:
+    transport = httpx.ASGITransport(app=web_server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        body = {"messages": [{"role": "user", "content": "same prompt"}], "persona_id": "normal", "no_cache": True}
+        first = asyncio.ensure_future(client.post("/api/chat/stream", json=body))
+        while not mock.httpd.active and not first.done():   # the stream holds the slot from here on
+            await asyncio.sleep(0.005)
+        responses = [await first] + list(await asyncio.gather(*(
+            client.post(path, json=body) for path in ("/api/chat", "/api/chat/stream", "/api/chat")
+        )))
+    failed = [r for r in responses if r.status_code != 200 or "error" in r.text]
+    if failed:
+        raise SystemExit(f"mixed: {len(failed)} requests failed: {failed[0].text}")
+
+
+def check_mixed(delay: float) -> dict:
+    """One slot, chat and stream of one prompt side by side: admission must still hold."""
+    mock = MockOllama(delay=delay).start()
+    web_server.backends = BackendPool([mock.base_url])
+    web_server.admission = AdmissionController(1, 16)
+    web_server.flights = SingleFlight()
+    try:
+        asyncio.run(run_mixed(mock))
+    finally:
+        mock.stop()
+    stats = dict(web_server.flights.stats(), peak_upstream=mock.peak_active)
+    if mock.peak_active > 1:
+        raise SystemExit(f"mixed chat/stream bypassed admission: {stats}")
+    return stats
+
+
+BAD_MESSAGES = (
+    ["hi"],
+    [{"role": "user", "content": ["hi"]}],
+    [{"role": "user"}],
+    [{"role": None, "content": "hi"}],
+)
+
+
+async def run_bad_input() -> list:
+    transport = httpx.ASGITransport(app=web_server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        return [
+            (await client.post(path, json={"messages": messages})).status_code
+            for path in ("/api/chat", "/api/chat/stream") for messages in BAD_MESSAGES
+        ]
+
+
+def check_bad_input() -> int:
+    """Malformed messages are the client's mistake: 422, never a 500."""
+    codes = asyncio.run(run_bad_input())
+    if any(code != 422 for code in codes):
+        raise SystemExit(f"malformed messages: expected only 422s, got {codes}")
+    return len(codes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=20, help="concurrent requests")
+    parser.add_argument("--delay", type=float, default=0.5, help="mock generation time (s)")
+    args = parser.parse_args()
+
+    mock = MockOllama(delay=args.delay).start()
+    web_server.backends = BackendPool([mock.base_url])
+    try:
+        wall = asyncio.run(run(args.n))
+    finally:
+        mock.stop()
+
+    serial = args.n * args.delay
+    print(f"requests         : {args.n}")
+    print(f"mock delay       : {args.delay:.3f}s")
+    print(f"wall time        : {wall:.3f}s")
+    print(f"serial would be  : {serial:.3f}s")
+    print(f"overlap factor   : {serial / wall:.1f}x")
+
+    stats = check_mixed(args.delay)
+    print(f"mixed, 1 slot    : {stats['upstream_calls']} upstream calls, {stats['coalesced']} coalesced,"
+          f" at most {stats['peak_upstream']} at once")
+    print(f"bad input        : {check_bad_input()} malformed requests, all 422")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Microbenchmark for reply_filter against the str.replace chains it replaced.
+
+Builds two long replies with a leading label and the odd "!!!", one plain
+(what the personas' prompts ask for) and one with an emoji every hundred
+words or so, then times filtering each whole and streamed in token-sized
+chunks, for the web's snarky personas and the CLI's TARS mode. The old
+implementations are copied below as they were. Also checks that the
+streamed output equals the whole-reply output for random chunkings.
+
+    python3 benchmarks/bench_filter.py --chars 20000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from reply_filter import ReplyFilter  # noqa: E402
+
+WEB_SNARKY = ReplyFilter(("label", "emoji", "squash_exclamations"), ("TARS", "C-3PO", "AI"))
+CLI_TARS = ReplyFilter(("label", "emoji", "no_exclamations"), ("TARS",), prefix="TARS: ")
+
+
+# -------- the old chains (web_server.py and gpt_cli.py before reply_filter) --------
+
+_SNARKY_EMOJIS = ("😊", "😄", "😂", "🤣")
+
+
+def old_web_cold_filter(text: str) -> str:
+    if not text:
+        return "..."
+    text = text.strip()
+    text = (
+        text.replace("😊", "")
+            .replace("😄", "")
+            .replace("😂", "")
+            .replace("🤣", "")
+            .replace("!!!", ".")
+    )
+    return text or "..."
+
+
+class OldWebStreamFilter:
+    def __init__(self):
+        self.pending = ""
+        self.started = False
+
+    def feed(self, chunk: str) -> str:
+        for emoji in _SNARKY_EMOJIS:
+            chunk = chunk.replace(emoji, "")
+        text = self.pending + chunk
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                self.pending = ""
+                return ""
+            self.started = True
+        text = text.replace("!!!", ".")
+        cut = len(text.rstrip())
+        if cut == len(text):
+            while cut > 0 and text[cut - 1] == "!":
+                cut -= 1
+        self.pending = text[cut:]
+        return text[:cut]
+
+    def flush(self) -> str:
+        tail = self.pending.rstrip()
+        self.pending = ""
+        return tail if self.started else "..."
+
+
+def old_cli_cold_filter(text: str) -> str:
+    if not text:
+        return "TARS: ..."
+    text = text.strip()
+    text = text.replace("😊", "").replace("!", ".")
+    if not text.upper().startswith("TARS:"):
+        text = "TARS: " + text
+    return text or "TARS: ..."
+
+
+class OldCliStreamFilter:
+    def __init__(self):
+        self.head = ""
+        self.pending = ""
+        self.started = False
+
+    def feed(self, chunk: str) -> str:
+        chunk = chunk.replace("😊", "").replace("!", ".")
+        text = self.pending + chunk
+        if not self.started:
+            text = (self.head + text).lstrip()
+            if len(text) < 5 and "TARS:".startswith(text.upper()):
+                self.head, self.pending = text, ""
+                return ""
+            self.head = ""
+            self.started = True
+            if not text.upper().startswith("TARS:"):
+                text = "TARS: " + text
+        cut = len(text.rstrip())
+        self.pending = text[cut:]
+        return text[:cut]
+
+    def flush(self) -> str:
+        tail = old_cli_cold_filter(self.head) if self.head else ""
+        self.head = self.pending = ""
+        return tail
+
+
+# -------- benchmark --------
+
+WORDS = ("the model streams tokens over a keep-alive connection while the filter "
+         "strips what the persona does not allow and nothing else").split()
+
+
+def make_reply(chars: int, seed: int, emoji: bool) -> str:
+    rng = random.Random(seed)
+    parts = ["TARS: "]
+    size = 0
+    while size < chars:
+        word = rng.choice(WORDS)
+        r = rng.random()
+        if r < 0.01 and emoji:
+            word += " 😊"
+        elif r < 0.015:
+            word += "!!!"
+        elif r < 0.03:
+            word += ".\n"
+        parts.append(word + " ")
+        size += len(word) + 1
+    return "".join(parts)
+
+
+def tokens(text: str):
+    """Roughly how Ollama streams: a word (or a piece of one) with the space before it."""
+    return re.findall(r"\s*\S{1,6}|\s+$", text)
+
+
+def chunked(text: str, seed: int):
+    """Arbitrary cuts, for the correctness check."""
+    rng = random.Random(seed)
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, 8)   # about a token or two
+        yield text[i:i + n]
+        i += n
+
+
+def run_stream(make_filter, chunks) -> str:
+    filt = make_filter()
+    out = [filt.feed(c) for c in chunks]
+    out.append(filt.flush())
+    return "".join(out)
+
+
+def best_of(runs: int, fn, *args) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_chunking(rules: ReplyFilter, reply: str, trials: int) -> None:
+    whole = rules.apply(reply)
+    for seed in range(trials):
+        assert run_stream(rules.stream, list(chunked(reply, seed))) == whole, f"chunking seed {seed}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chars", type=int, default=20000, help="reply length")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'':32} {'old chain':>12} {'reply_filter':>14} {'speedup':>9}")
+    replies = [("plain", make_reply(args.chars, args.seed, False)),
+               ("emoji", make_reply(args.chars, args.seed, True))]
+    for kind, reply in replies:
+        chunks = tokens(reply)
+        cases = [
+            ("web snarky, whole", old_web_cold_filter, WEB_SNARKY.apply, reply),
+            ("web snarky, streamed", lambda c: run_stream(OldWebStreamFilter, c),
+             lambda c: run_stream(WEB_SNARKY.stream, c), chunks),
+            ("CLI TARS, whole", old_cli_cold_filter, CLI_TARS.apply, reply),
+            ("CLI TARS, streamed", lambda c: run_stream(OldCliStreamFilter, c),
+             lambda c: run_stream(CLI_TARS.stream, c), chunks),
+        ]
+        for name, old, new, arg in cases:
+            t_old = best_of(args.runs, old, arg)
+            t_new = best_of(args.runs, new, arg)
+            print(f"{kind + ', ' + name:32} {1e6 * t_old:9.0f} us {1e6 * t_new:11.0f} us"
+                  f" {t_old / t_new:8.2f}x")
+        for rules in (WEB_SNARKY, CLI_TARS):
+            check_chunking(rules, reply, 50)
+
+    print(f"\nreplies: {args.chars} chars, ~{len(tokens(replies[0][1]))} chunks each")
+    print("streamed == whole for 50 random chunkings: ok")
+
+
+if __name__ == "__main__":
+    main()
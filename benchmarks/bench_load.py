@@ -0,0 +1,267 @@
+"""
+Load test for web_server /api/chat (or /api/chat/stream) against a mock Ollama.
+
+Starts the mock and the web server (uvicorn) as separate processes, then, for
+each concurrency level, keeps that many clients sending chats back to back
+until --requests have finished. For each level it reports throughput,
+p50/p95/p99 latency (time to first token too, with --stream) and the error
+rate. Every prompt is unique and sent with no_cache, so each one reaches the
+mock; the admission limit (MAX_CONCURRENT_GENERATIONS) shows up as the
+throughput plateau, MAX_QUEUED as 429s.
+
+Results can be written with --out and compared with a stored run with
+--baseline; the exit status is 1 if any level got slower or less reliable
+than the baseline by more than --tolerance:
+
+    python3 benchmarks/bench_load.py --out benchmarks/baseline_load.json     # on main
+    python3 benchmarks/bench_load.py --baseline benchmarks/baseline_load.json  # on a branch
+
+Use --url to load an already running server instead (its own backends).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MOCK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_ollama.py")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit(f"{url} did not come up")
+        time.sleep(0.1)
+
+
+def start_stack(args) -> List[subprocess.Popen]:
+    """Mock Ollama + uvicorn web_server:app; returns the processes, sets args.url."""
+    mock_port, web_port = _free_port(), _free_port()
+    mock = subprocess.Popen([
+        sys.executable, MOCK, "--port", str(mock_port), "--delay", str(args.delay),
+        "--token-delay", str(args.token_delay), "--reply-tokens", str(args.reply_tokens),
+        "--error-rate", str(args.error_rate),
+    ], stdout=subprocess.DEVNULL)
+    env = dict(os.environ, OLLAMA_HOSTS=f"http://127.0.0.1:{mock_port}")
+    env.pop("TERMINAL_GPT_CACHE_DB", None)
+    web = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "web_server:app", "--port", str(web_port),
+        "--log-level", "warning", "--no-access-log",
+    ], cwd=ROOT, env=env)
+    _wait_ready(f"http://127.0.0.1:{mock_port}/api/version")
+    _wait_ready(f"http://127.0.0.1:{web_port}/metrics")
+    args.url = f"http://127.0.0.1:{web_port}"
+    return [web, mock]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in [0, 1]."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, min(len(sorted_values) - 1, round(q * len(sorted_values)) - 1))]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(1000 * value, 1) if value is not None else None
+
+
+async def _one(client: httpx.AsyncClient, body: dict, headers: dict, stream: bool):
+    """(latency, ttft, error) for one request; error is None on success."""
+    start = time.perf_counter()
+    ttft = None
+    try:
+        if not stream:
+            resp = await client.post("/api/chat", json=body, headers=headers)
+            err = None if resp.status_code == 200 else f"http {resp.status_code}"
+            return time.perf_counter() - start, None, err
+        async with client.stream("POST", "/api/chat/stream", json=body, headers=headers) as resp:
+            if resp.status_code != 200:
+                return time.perf_counter() - start, None, f"http {resp.status_code}"
+            err = "no done event"
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "token" in event and ttft is None:
+                    ttft = time.perf_counter() - start
+                if "error" in event:
+                    err = "stream error"
+                    break
+                if event.get("done"):
+                    err = None
+        return time.perf_counter() - start, ttft, err
+    except httpx.HTTPError as e:
+        return time.perf_counter() - start, None, type(e).__name__
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, n: int, stream: bool,
+                    persona: str, tag: str) -> dict:
+    """`concurrency` closed-loop clients sharing `n` requests."""
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors: dict = {}
+    counter = iter(range(n))
+
+    async def worker(wid: int):
+        headers = {"x-client-id": f"load-{wid}"}   # each one queues as its own client
+        for i in counter:
+            body = {
+                "messages": [{"role": "user", "content": f"load {tag} c{concurrency} #{i}"}],
+                "persona_id": persona,
+                "no_cache": True,
+            }
+            latency, ttft, err = await _one(client, body, headers, stream)
+            if err:
+                errors[err] = errors.get(err, 0) + 1
+            else:
+                latencies.append(latency)
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    ttfts.sort()
+    failed = sum(errors.values())
+    result = {
+        "concurrency": concurrency,
+        "requests": n,
+        "ok": len(latencies),
+        "errors": errors,
+        "error_rate": round(failed / n, 4) if n else 0.0,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": _ms(percentile(latencies, 0.50)),
+        "p95_ms": _ms(percentile(latencies, 0.95)),
+        "p99_ms": _ms(percentile(latencies, 0.99)),
+    }
+    if stream:
+        result["ttft_p50_ms"] = _ms(percentile(ttfts, 0.50))
+        result["ttft_p95_ms"] = _ms(percentile(ttfts, 0.95))
+    return result
+
+
+async def run(args) -> List[dict]:
+    limits = httpx.Limits(max_connections=max(args.levels) + 8, max_keepalive_connections=max(args.levels))
+    tag = str(int(time.time()))   # prompts differ between runs, too
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        await _one(client, {"messages": [{"role": "user", "content": f"warm up {tag}"}],
+                            "persona_id": args.persona, "no_cache": True}, {}, args.stream)
+        results = []
+        for level in args.levels:
+            result = await run_level(client, level, args.requests, args.stream, args.persona, tag)
+            results.append(result)
+            print_row(result, args.stream)
+    return results
+
+
+def print_header(stream: bool) -> None:
+    cols = f"{'conc':>5}{'ok':>6}{'err%':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(cols + (f"{'ttft50':>9}" if stream else ""))
+
+
+def print_row(r: dict, stream: bool) -> None:
+    def f(v):
+        return f"{v:.1f}" if v is not None else "-"
+    row = (f"{r['concurrency']:>5}{r['ok']:>6}{100 * r['error_rate']:>6.1f}%{f(r['throughput_rps']):>9}"
+           f"{f(r['p50_ms']):>9}{f(r['p95_ms']):>9}{f(r['p99_ms']):>9}")
+    print(row + (f"{f(r.get('ttft_p50_ms')):>9}" if stream else ""), flush=True)
+
+
+def compare(results: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    """Regressions against a baseline run, one message each (empty = none)."""
+    base = {r["concurrency"]: r for r in baseline.get("results", [])}
+    problems = []
+    print(f"\nvs baseline ({baseline.get('created', '?')}), tolerance {100 * tolerance:.0f}%:")
+    for r in results:
+        b = base.get(r["concurrency"])
+        if b is None:
+            continue
+        notes = []
+        if b["throughput_rps"] and r["throughput_rps"] is not None:
+            change = r["throughput_rps"] / b["throughput_rps"] - 1
+            notes.append(f"req/s {100 * change:+.1f}%")
+            if change < -tolerance:
+                problems.append(f"c={r['concurrency']}: throughput {100 * change:+.1f}%")
+        for key in ("p95_ms", "p99_ms"):
+            if b.get(key) and r.get(key) is not None:
+                change = r[key] / b[key] - 1
+                notes.append(f"{key[:3]} {100 * change:+.1f}%")
+                if change > tolerance:
+                    problems.append(f"c={r['concurrency']}: {key[:3]} latency {100 * change:+.1f}%")
+        if r["error_rate"] > b["error_rate"] + 0.01:
+            problems.append(f"c={r['concurrency']}: error rate {b['error_rate']:.2%} -> {r['error_rate']:.2%}")
+        print(f"  c={r['concurrency']:<4} " + ", ".join(notes))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", default="1,2,4,8,16,32",
+                        type=lambda s: [int(x) for x in s.split(",")], help="concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per level")
+    parser.add_argument("--stream", action="store_true", help="use /api/chat/stream and report TTFT")
+    parser.add_argument("--persona", default="normal")
+    parser.add_argument("--delay", type=float, default=0.05, help="mock prompt-eval seconds")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="mock seconds per token")
+    parser.add_argument("--reply-tokens", type=int, default=32, help="mock reply length")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock failure fraction")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--url", help="load this running server instead of starting one")
+    parser.add_argument("--out", metavar="RESULTS.json", help="write results here")
+    parser.add_argument("--baseline", metavar="BASELINE.json", help="compare against an earlier --out")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    procs = [] if args.url else start_stack(args)
+    try:
+        print_header(args.stream)
+        results = asyncio.run(run(args))
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: getattr(args, k) for k in (
+            "stream", "persona", "requests", "delay", "token_delay", "reply_tokens", "error_rate",
+        )},
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        if problems:
+            print("REGRESSION:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Resume benchmark for conversation_log (gpt_cli.py --resume).
+
+Writes a session with --turns user/assistant turns to a temporary directory,
+then times reopening it and rebuilding the context window two ways: the
+indexed tail read that --resume uses, and replaying every line of the log.
+Both must produce the same window. Also checks that a crash between the log
+and index writes (a torn last line, a missing index entry) is repaired.
+
+    python3 benchmarks/bench_resume.py --turns 10000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from context_window import ContextWindow  # noqa: E402
+from conversation_log import ConversationLog  # noqa: E402
+
+PRIMING = [{"role": "system", "content": "You are a helpful terminal assistant."}]
+BUDGET = 3072
+
+
+def write_session(directory: str, turns: int) -> str:
+    log = ConversationLog.create(directory, False, "llama3.2")
+    for i in range(turns):
+        log.append({"role": "user", "content": f"question {i}: " + "why " * (i % 40)})
+        log.append({"role": "assistant", "content": f"answer {i}: " + "because " * (i % 120)})
+    log.close()
+    return log.id
+
+
+def indexed(directory: str, session_id: str) -> ContextWindow:
+    log = ConversationLog.open(directory, session_id)
+    window = ContextWindow(PRIMING, BUDGET)
+    window.resume(*log.tail(BUDGET))
+    log.close()
+    return window
+
+
+def full_replay(directory: str, session_id: str) -> ContextWindow:
+    window = ContextWindow(PRIMING, BUDGET)
+    with open(os.path.join(directory, session_id + ".jsonl"), encoding="utf-8") as f:
+        f.readline()   # header
+        for line in f:
+            record = json.loads(line)
+            window.append({"role": record["role"], "content": record["content"]})
+    return window
+
+
+def best_of(runs: int, fn, *args) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_repair(directory: str, session_id: str) -> None:
+    log = ConversationLog.open(directory, session_id)
+    before = len(log)
+    log.append({"role": "user", "content": "written, then the index entry was lost"})
+    log.close()
+    idx = os.path.join(directory, session_id + ".idx")
+    with open(idx, "rb+") as f:
+        f.truncate(os.path.getsize(idx) - 12)
+    with open(os.path.join(directory, session_id + ".jsonl"), "ab") as f:
+        f.write(b'{"role": "assistant", "content": "torn wr')
+
+    log = ConversationLog.open(directory, session_id)
+    tail, _ = log.tail(10)
+    assert len(log) == before + 1, (len(log), before + 1)
+    assert tail[-1]["content"] == "written, then the index entry was lost", tail[-1]
+    log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        session_id = write_session(directory, args.turns)
+        write_s = time.perf_counter() - start
+        size = os.path.getsize(os.path.join(directory, session_id + ".jsonl"))
+
+        fast, slow = indexed(directory, session_id), full_replay(directory, session_id)
+        assert fast.messages() == slow.messages(), "indexed resume differs from a full replay"
+
+        t_fast = best_of(args.runs, indexed, directory, session_id)
+        t_slow = best_of(args.runs, full_replay, directory, session_id)
+        check_repair(directory, session_id)
+
+    print(f"session        : {args.turns} turns, {size / 2**20:.1f} MiB log, written in {write_s:.2f}s")
+    print(f"in context     : {len(fast)} messages, {fast.dropped} omitted")
+    print(f"indexed resume : {1000 * t_fast:.2f} ms")
+    print(f"full replay    : {1000 * t_slow:.2f} ms  ({t_slow / t_fast:.0f}x slower)")
+    print("crash repair   : ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Search benchmark for search_index (gpt_cli.py search, GET /api/search).
+
+Indexes --turns user/assistant turns of synthetic conversations into a
+temporary database (word frequencies follow Zipf's law over a 5000-word
+vocabulary, so the named words below are each in a large share of all
+messages: close to a worst case), then times a set of queries (common words, rare words,
+multi-word, no match) and fails if any median is over --budget-ms. Also
+writes a few real session logs and checks that sync() picks up exactly the
+messages the index hasn't seen, and that stemming matches ("cache" finds
+"caching").
+
+    python3 benchmarks/bench_search.py --turns 150000
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from conversation_log import ConversationLog  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+
+WORDS = (
+    "python rust docker kubernetes socket thread mutex cache latency queue graph tree heap"
+    " index query buffer stream parser compiler kernel memory pointer vector matrix tensor"
+    " http request response header cookie session token schema migration backup replica"
+).split()
+VOCABULARY = WORDS + [f"term{i}" for i in range(5000 - len(WORDS))]
+ZIPF = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+FILLER = "the a of to and is in it that for with as on be this you can".split()
+QUERIES = ["cache", "docker socket", "kubernetes migration replica", "mutex", "zygomorphic", "caching latency"]
+
+
+def sentence(rng: random.Random, length: int) -> str:
+    words = rng.choices(VOCABULARY, cum_weights=ZIPF, k=length)
+    return " ".join(w if rng.random() < 0.4 else rng.choice(FILLER) for w in words)
+
+
+def fill(index: SearchIndex, turns: int, seed: int) -> None:
+    rng = random.Random(seed)
+    with index._db:   # one transaction; add() commits per message, which is what live indexing costs
+        for i in range(turns):
+            session, seq = f"bench-{i // 50:06d}", 2 * (i % 50)
+            index._insert(session, seq, "user", sentence(rng, rng.randint(5, 25)), None, "cli")
+            index._insert(session, seq + 1, "assistant", sentence(rng, rng.randint(20, 120)), None, "cli")
+
+
+def time_queries(index: SearchIndex, runs: int):
+    for query in QUERIES:
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            results = index.search(query, 10)
+            samples.append(time.perf_counter() - start)
+        yield query, len(results), statistics.median(samples), max(samples)
+
+
+def check_sync(index: SearchIndex, directory: str) -> None:
+    log = ConversationLog.create(directory, False, "llama3.2")
+    log.append({"role": "user", "content": "how does response caching work"})
+    log.append({"role": "assistant", "content": "replies are cached by a hash of the messages"})
+    assert index.sync(directory) == 2
+    log.append({"role": "user", "content": "and the quasiperiodic eviction"})
+    log.close()
+    assert index.sync(directory) == 1
+    assert index.sync(directory) == 0
+    hits = index.search("quasiperiodic")
+    assert [(h["session"], h["seq"]) for h in hits] == [(log.id, 2)], hits
+
+    live = ConversationLog.open(directory, log.id, index)
+    live.append({"role": "assistant", "content": "written and indexed at once: xenolithic"})
+    live.close()
+    assert index.sync(directory) == 0
+    assert [h["seq"] for h in index.search("xenolithic")] == [3]
+    assert [h["seq"] for h in index.search("hashes cache")] == [1], "stemming"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=150000, help="user/assistant pairs to index")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "search.sqlite3")
+        index = SearchIndex(db_path)
+        start = time.perf_counter()
+        fill(index, args.turns, args.seed)
+        fill_s = time.perf_counter() - start
+
+        adds = 1000
+        start = time.perf_counter()
+        for i in range(adds):
+            index.add("bench-live", i, "user", "one message per transaction, as turns arrive")
+        add_ms = 1000 * (time.perf_counter() - start) / adds
+
+        rows = list(time_queries(index, args.runs))
+        check_sync(index, os.path.join(directory, "sessions"))
+        size = os.path.getsize(db_path)
+        index.close()
+
+    print(f"indexed        : {2 * args.turns} messages in {fill_s:.1f}s, {size / 2**20:.0f} MiB")
+    print(f"live add()     : {add_ms:.3f} ms per message")
+    over = False
+    for query, hits, median, worst in rows:
+        flag = ""
+        if 1000 * median > args.budget_ms:
+            flag, over = "  OVER BUDGET", True
+        print(f"{query!r:32} {hits:>2} hits  p50 {1000 * median:6.2f} ms  max {1000 * worst:6.2f} ms{flag}")
+    print("sync / stemming: ok")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
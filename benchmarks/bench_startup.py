@@ -0,0 +1,89 @@
+"""
+Startup budget for the CLI entry points.
+
+Imports gpt_cli and terminal_gpt in fresh interpreters with `-X importtime`
+and fails (exit status 1) if either takes longer than --budget-ms to import,
+or pulls in one of the web/numeric stacks the CLI path must not load
+(FastAPI and friends are only imported when serving, numpy only with the
+semantic cache on). Also reports wall time of `--help` and the slowest
+imports, to see what to make lazy next.
+
+    python3 benchmarks/bench_startup.py --budget-ms 150
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENTRY_POINTS = ("gpt_cli", "terminal_gpt")
+FORBIDDEN = ("fastapi", "pydantic", "starlette", "uvicorn", "numpy")
+
+
+def import_times(module: str) -> Dict[str, Tuple[int, int, int]]:
+    """name -> (self us, cumulative us, depth) for one fresh `import module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name[1:]   # drop the space after "|"; the rest is 2 per nesting level
+        depth = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return times
+
+
+def help_wall(module: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, f"{module}.py", "--help"], cwd=ROOT,
+                   capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+def check(module: str, runs: int, budget_ms: float, top: int) -> List[str]:
+    best = None
+    for _ in range(runs):   # the fastest run is the least disturbed by the machine
+        times = import_times(module)
+        if best is None or times[module][1] < best[module][1]:
+            best = times
+    import_ms = best[module][1] / 1000
+    wall_ms = 1000 * min(help_wall(module) for _ in range(runs))
+
+    print(f"{module}: import {import_ms:.1f} ms (budget {budget_ms:.0f} ms), `--help` {wall_ms:.1f} ms wall")
+    slowest = sorted(best.items(), key=lambda kv: kv[1][1], reverse=True)
+    for name, (_, cumulative, depth) in [kv for kv in slowest if kv[1][2] <= 1][:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+    problems = []
+    if import_ms > budget_ms:
+        problems.append(f"{module}: import took {import_ms:.1f} ms, budget is {budget_ms:.0f} ms")
+    loaded = sorted({name.split(".")[0] for name in best} & set(FORBIDDEN))
+    if loaded:
+        problems.append(f"{module}: imports {', '.join(loaded)} at startup")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="max import time per entry point")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list")
+    args = parser.parse_args()
+
+    problems = []
+    for module in ENTRY_POINTS:
+        problems += check(module, args.runs, args.budget_ms, args.top)
+    if problems:
+        print("OVER BUDGET:\n  " + "\n  ".join(problems))
+        sys.exit(1)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Tiny stand-in for an Ollama server, for benchmarks only.
+
+Implements POST /api/chat, both "stream": false and Ollama's NDJSON streaming,
+and a toy bag-of-words POST /api/embed, with a fixed artificial latency so we
+can measure our own overhead and concurrency without loading a model.
+
+Like the real server, it remembers recent conversation prefixes (its "KV
+cache"): a request that extends one it has already seen only pays prompt-eval
+time for the new messages. The first request for a model also pays a one-time
+load delay (reported as load_duration, other requests wait for it), and a
+fraction of chat requests can be made to fail with a 500.
+
+A streamed generation stops when the client hangs up, as Ollama's does;
+GET /api/mock/stats counts those and the tokens they never generated.
+
+    python3 benchmarks/mock_ollama.py --port 11434 --delay 0.5 --token-delay 0.02 \
+        --reply-tokens 64 --load-delay 2 --error-rate 0.01
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _embed(text: str, dim: int = 64) -> list:
+    """Hashed bag of words: texts sharing words get similar vectors."""
+    vec = [0.0] * dim
+    for word in text.lower().split():
+        vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1.0
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+def _prefix_hashes(messages: list) -> list:
+    """hash(messages[:i + 1]) for every i."""
+    h = hashlib.sha1()
+    out = []
+    for m in messages:
+        h.update(json.dumps([m.get("role"), m.get("content")]).encode())
+        out.append(h.hexdigest())
+    return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        try:
+            self.wfile.write(raw)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True   # generated in full already: not counted as aborted
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json(200, {"version": "mock"})
+        elif self.path == "/api/mock/stats":
+            server = self.server
+            self._send_json(200, {"requests": server.requests, "aborted": server.aborted,
+                                  "tokens_skipped": server.tokens_skipped})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+
+        if self.path == "/api/embed":
+            self._send_json(200, {"model": payload.get("model"), "embeddings": [_embed(payload.get("input", ""))]})
+            return
+        if self.path != "/api/chat":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.error_rate and server.rng.random() < server.error_rate
+        if fail:
+            self._send_json(500, {"error": "mock: simulated failure"})
+            return
+
+        with server.lock:
+            server.active += 1
+            server.peak_active = max(server.peak_active, server.active)
+        try:
+            self._chat(payload)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _chat(self, payload: dict):
+        server = self.server
+        messages = payload.get("messages") or [{}]
+        reply = f"echo: {messages[-1].get('content', '')}"
+        words = reply.split(" ")
+        if len(words) < server.reply_tokens:
+            reply = " ".join(words + ["lorem"] * (server.reply_tokens - len(words)))
+
+        hashes = _prefix_hashes(messages)
+        with server.lock:
+            cached = max((i + 1 for i, h in enumerate(hashes) if h in server.kv), default=0)
+            cached = min(cached, len(messages) - 1)   # the new turn is always evaluated
+            for h in _prefix_hashes(messages + [{"role": "assistant", "content": reply}]):
+                server.kv[h] = True
+                server.kv.move_to_end(h)
+            while len(server.kv) > server.kv_entries:
+                server.kv.popitem(last=False)
+
+        start = time.perf_counter_ns()
+        model = payload.get("model", "mock")
+        with server.load_lock:   # concurrent first requests all wait for the load
+            if model not in server.loaded:
+                time.sleep(server.load_delay)
+                server.loaded.add(model)
+        load = time.perf_counter_ns() - start
+
+        time.sleep(server.delay * (len(messages) - cached) / len(messages))  # "prompt eval"
+        prompt_eval = time.perf_counter_ns() - start - load
+        durations = (start, load, prompt_eval)
+
+        if payload.get("stream", True):
+            self._stream(payload, reply, durations)
+            return
+
+        tokens = reply.split(" ")
+        time.sleep(server.token_delay * len(tokens))
+        self._send_json(200, dict(
+            {"model": model, "message": {"role": "assistant", "content": reply}, "done": True},
+            **self._stats(durations, len(tokens)),
+        ))
+
+    @staticmethod
+    def _stats(durations: tuple, eval_count: int) -> dict:
+        start, load, prompt_eval = durations
+        total = time.perf_counter_ns() - start
+        return {
+            "total_duration": total,
+            "load_duration": load,
+            "prompt_eval_duration": prompt_eval,
+            "eval_count": eval_count,
+            "eval_duration": total - load - prompt_eval,
+        }
+
+    def _stream(self, payload: dict, reply: str, durations: tuple):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(obj: dict):
+            raw = (json.dumps(obj) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(raw), raw))
+            self.wfile.flush()
+
+        tokens = reply.split(" ")
+        for i, tok in enumerate(tokens):
+            time.sleep(self.server.token_delay)
+            try:
+                chunk({
+                    "model": payload.get("model", "mock"),
+                    "message": {"role": "assistant", "content": tok if i == 0 else " " + tok},
+                    "done": False,
+                })
+            except (BrokenPipeError, ConnectionResetError):
+                self._hung_up(len(tokens) - i - 1)
+                return
+        try:
+            chunk(dict(
+                {"model": payload.get("model", "mock"), "message": {"role": "assistant", "content": ""}, "done": True},
+                **self._stats(durations, len(tokens)),
+            ))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self._hung_up(0)
+
+    def _hung_up(self, tokens_skipped: int):
+        with self.server.lock:
+            self.server.aborted += 1
+            self.server.tokens_skipped += tokens_skipped
+        self.close_connection = True
+
+
+class MockOllama:
+    """Run the mock server in a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 delay: float = 0.5, token_delay: float = 0.0, reply_tokens: int = 0,
+                 load_delay: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.delay = delay
+        self.httpd.token_delay = token_delay
+        self.httpd.reply_tokens = reply_tokens   # pad replies to this many words
+        self.httpd.load_delay = load_delay
+        self.httpd.error_rate = error_rate
+        self.httpd.rng = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.load_lock = threading.Lock()
+        self.httpd.loaded = set()          # models already "in memory"
+        self.httpd.requests = 0
+        self.httpd.active = 0              # chats being answered right now
+        self.httpd.peak_active = 0
+        self.httpd.aborted = 0             # streams the client hung up on
+        self.httpd.tokens_skipped = 0      # tokens those would still have generated
+        self.httpd.kv = OrderedDict()      # prefix hash -> True, oldest first
+        self.httpd.kv_entries = 4096
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return self.base_url + "/api/chat"
+
+    @property
+    def requests(self) -> int:
+        return self.httpd.requests
+
+    @property
+    def peak_active(self) -> int:
+        """Most chats the mock was answering at the same time."""
+        return self.httpd.peak_active
+
+    def start(self) -> "MockOllama":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Ollama /api/chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--delay", type=float, default=0.5, help="prompt-eval seconds per reply")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds per generated token")
+    parser.add_argument("--reply-tokens", type=int, default=0, help="pad every reply to this many tokens")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="one-time model load seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of chats answered with a 500")
+    args = parser.parse_args()
+
+    mock = MockOllama(args.host, args.port, args.delay, args.token_delay,
+                      args.reply_tokens, args.load_delay, args.error_rate)
+    print(f"mock ollama on {mock.url} (delay {args.delay}s, {args.token_delay}s/token)", flush=True)
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,156 @@
+"""
+Resident CLI daemon over a Unix domain socket.
+
+`python3 gpt_cli.py --daemon` keeps one process around with its pooled
+connection to Ollama and its caches already warm; `gpt.py` (a thin client
+that only imports the standard library) sends it one-shot prompts and
+prints the reply as it streams back.
+
+Protocol, one connection per prompt:
+
+    client -> daemon   {"prompt": "explain BFS", "stats": false}\\n
+    daemon -> client   {"out": "text for stdout"}\\n       (any number)
+                       {"err": "text for stderr"}\\n       (any number)
+                       {"exit": 0}\\n                       (last line)
+
+The socket is created with mode 0600, so only its owner can talk to it. The
+default path may be in /tmp, where anyone can create it first, so the client
+only connects to a socket that is ours and private; otherwise gpt.py runs the
+prompt in-process, as if no daemon were running.
+"""
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+from typing import Callable, Optional
+
+DAEMON_SOCKET = os.environ.get("TERMINAL_GPT_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"terminal-gpt-{os.getuid()}.sock"
+)
+CONNECT_TIMEOUT = 0.5   # seconds; a daemon that doesn't accept by then is treated as absent
+
+# handler(job, out, err) -> exit status; out/err are file-like (write/flush)
+Handler = Callable[[dict, "FrameWriter", "FrameWriter"], int]
+
+
+class FrameWriter:
+    """File-like object that forwards writes to the client as {"<stream>": text} lines."""
+
+    def __init__(self, wfile, stream: str):
+        self.wfile = wfile
+        self.stream = stream
+
+    def write(self, text: str) -> int:
+        if text:
+            self.wfile.write((json.dumps({self.stream: text}, ensure_ascii=False) + "\n").encode())
+        return len(text)
+
+    def flush(self) -> None:
+        self.wfile.flush()
+
+
+def _trusted(path: str) -> bool:
+    """A socket we own that nobody else can use: a stranger's could read our prompts."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def _alive(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(CONNECT_TIMEOUT)
+        try:
+            s.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(handler: Handler, path: str = DAEMON_SOCKET) -> None:
+    """Serve until interrupted; each connection runs handler() on its own thread."""
+
+    class _Request(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                job = json.loads(self.rfile.readline())
+                status = handler(job, FrameWriter(self.wfile, "out"), FrameWriter(self.wfile, "err"))
+            except BrokenPipeError:
+                return   # client went away
+            except Exception as e:
+                FrameWriter(self.wfile, "err").write(f"[daemon error: {e!r}]\n")
+                status = 1
+            try:
+                self.wfile.write((json.dumps({"exit": status}) + "\n").encode())
+            except BrokenPipeError:
+                pass
+
+    if os.path.lexists(path):
+        if not _trusted(path):
+            raise SystemExit(f"{path} exists and is not a private socket of ours; set TERMINAL_GPT_SOCKET")
+        if _alive(path):
+            raise SystemExit(f"a daemon is already listening on {path}")
+        os.unlink(path)   # stale socket from a daemon that died
+
+    old_umask = os.umask(0o177)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, _Request)
+    finally:
+        os.umask(old_umask)
+    server.daemon_threads = True
+    signal.signal(signal.SIGTERM, _interrupt)   # `kill` also removes the socket
+    print(f"terminal-gpt daemon listening on {path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+def request(job: dict, path: str = DAEMON_SOCKET) -> Optional[int]:
+    """
+    Run one job on the daemon, copying its output to our stdout/stderr.
+    Returns the exit status, or None if no daemon answered or the socket
+    isn't ours (nothing was printed, so the caller can fall back to running
+    the prompt itself).
+    """
+    if not _trusted(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    with sock:
+        sock.settimeout(None)   # generation can take as long as it takes
+        sock.sendall((json.dumps(job) + "\n").encode())
+        received = False
+        with sock.makefile("rb") as frames:
+            for line in frames:
+                received = True
+                frame = json.loads(line)
+                if "out" in frame:
+                    sys.stdout.write(frame["out"])
+                    sys.stdout.flush()
+                elif "err" in frame:
+                    sys.stderr.write(frame["err"])
+                    sys.stderr.flush()
+                elif "exit" in frame:
+                    return frame["exit"]
+    if not received:
+        return None
+    print("\n[error: daemon closed the connection]", file=sys.stderr)
+    return 1
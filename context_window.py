@@ -0,0 +1,105 @@
+"""
+Token-budgeted conversation history.
+
+Prompt-eval time grows with the history we send, and past the model's context
+size Ollama silently truncates. ContextWindow keeps the persona priming pinned
+and drops the oldest turns once the total goes over a token budget, leaving a
+one-line note in their place.
+
+Token counts are estimated (no tokenizer dependency), computed once per
+message text and cached, and the running total is updated incrementally, so
+each new turn costs O(1) instead of a recount of the whole conversation.
+"""
+from collections import deque
+from functools import lru_cache
+from typing import Deque, List, Optional, Sequence, Tuple
+
+# Chat templates wrap every message in role markers; roughly this many tokens.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for a piece of text (~4 characters per token for
+    English with llama-style tokenizers, never less than one per word).
+    Cached by the string's hash, so repeated priming/history is free.
+    """
+    return max(len(text) // 4, len(text.split())) + MESSAGE_OVERHEAD_TOKENS
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content") or "")
+
+
+def _omitted_note(count: int) -> dict:
+    return {"role": "system", "content": f"[{count} earlier messages omitted]"}
+
+
+class ContextWindow:
+    """
+    Pinned priming + the most recent turns that fit in `budget` tokens.
+
+    append() is amortized O(1): each message is counted once when added and
+    subtracted once when it falls out of the window.
+    """
+
+    def __init__(self, priming: Sequence[dict], budget: int, priming_tokens: Optional[int] = None):
+        self.priming = list(priming)
+        self.budget = budget
+        if priming_tokens is None:
+            priming_tokens = sum(message_tokens(m) for m in self.priming)
+        self.pinned_tokens = priming_tokens
+        self.turns: Deque[Tuple[dict, int]] = deque()
+        self.turn_tokens = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    @property
+    def tokens(self) -> int:
+        note = message_tokens(_omitted_note(self.dropped)) if self.dropped else 0
+        return self.pinned_tokens + note + self.turn_tokens
+
+    def append(self, message: dict) -> None:
+        count = message_tokens(message)
+        self.turns.append((message, count))
+        self.turn_tokens += count
+        self._trim()
+
+    def resume(self, tail: Sequence[dict], skipped: int) -> None:
+        """Reload saved history: its newest messages, after `skipped` older ones that don't fit."""
+        self.dropped += skipped
+        for message in tail:
+            self.append(message)
+
+    def _trim(self) -> None:
+        # Always keep the newest message, even if it alone is over budget.
+        while len(self.turns) > 1 and self.tokens > self.budget:
+            self._drop_oldest()
+        # Don't start the window on a reply whose question was dropped.
+        while len(self.turns) > 1 and self.dropped and self.turns[0][0].get("role") == "assistant":
+            self._drop_oldest()
+
+    def _drop_oldest(self) -> None:
+        _, count = self.turns.popleft()
+        self.turn_tokens -= count
+        self.dropped += 1
+
+    def messages(self, *extra: dict) -> List[dict]:
+        """Messages to send: priming, an omission note if needed, recent turns, extra."""
+        out = list(self.priming)
+        if self.dropped:
+            out.append(_omitted_note(self.dropped))
+        out.extend(m for m, _ in self.turns)
+        out.extend(extra)
+        return out
+
+
+def fit_messages(messages: Sequence[dict], pinned: int, budget: int) -> List[dict]:
+    """One-off version for a client-supplied list: first `pinned` messages are kept."""
+    window = ContextWindow(messages[:pinned], budget)
+    for message in messages[pinned:]:
+        window.append(message)
+    return window.messages()
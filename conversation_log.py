@@ -0,0 +1,185 @@
+"""
+Append-only on-disk log of CLI conversations, with an offset index for fast resume.
+
+Each session is two files in the session directory:
+
+    <id>.jsonl   a header line ({"id", "tars", "model", "created"}), then one
+                 {"role", "content", "ts"} line per message, only ever appended
+    <id>.idx     12 bytes per message: where its line starts in the .jsonl
+                 (uint64) and its estimated token count (uint32), little-endian
+
+Resuming only needs the newest messages that fit in the context budget:
+tail() walks the index backwards summing token counts, then memory-maps the
+log and decodes just those lines, so a 10k-turn session costs about as much
+to resume as a 10-turn one.
+
+The .jsonl is written before the .idx; if a crash leaves them out of step,
+open() indexes the missing lines and cuts off a half-written last line.
+
+Given a SearchIndex (search_index.py), every appended message is also added
+to the full-text index.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from context_window import message_tokens
+
+_RECORD = struct.Struct("<QI")   # line offset, token count
+
+
+def new_session_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S-") + os.urandom(2).hex()
+
+
+class ConversationLog:
+    def __init__(self, directory: str, session_id: str, header: dict, index=None):
+        self.directory = directory
+        self.id = session_id
+        self.header = header
+        self.index = index   # optional SearchIndex
+        self._log = open(self._path(".jsonl"), "ab")
+        self._idx = open(self._path(".idx"), "ab")
+        self._size = self._log.seek(0, os.SEEK_END)
+        self._count = self._idx.seek(0, os.SEEK_END) // _RECORD.size
+
+    def _path(self, ext: str) -> str:
+        return os.path.join(self.directory, self.id + ext)
+
+    @property
+    def tars(self) -> bool:
+        return bool(self.header.get("tars"))
+
+    def __len__(self) -> int:
+        return self._count
+
+    # -------- create / open --------
+
+    @classmethod
+    def create(cls, directory: str, tars: bool, model: str, index=None) -> "ConversationLog":
+        os.makedirs(directory, exist_ok=True)
+        session_id = new_session_id()
+        header = {"id": session_id, "tars": tars, "model": model, "created": round(time.time(), 3)}
+        with open(os.path.join(directory, session_id + ".jsonl"), "xb") as f:
+            f.write((json.dumps(header) + "\n").encode())
+        open(os.path.join(directory, session_id + ".idx"), "xb").close()
+        return cls(directory, session_id, header, index)
+
+    @classmethod
+    def open(cls, directory: str, session_id: str, index=None) -> "ConversationLog":
+        """Reopen a session for appending; "last" means the most recently written one."""
+        if session_id == "last":
+            session_id = latest_session(directory)
+            if session_id is None:
+                raise FileNotFoundError(f"no saved sessions in {directory}")
+        log_path = os.path.join(directory, session_id + ".jsonl")
+        with open(log_path, "rb") as f:
+            header = json.loads(f.readline())
+        _repair(log_path, os.path.join(directory, session_id + ".idx"))
+        return cls(directory, session_id, header, index)
+
+    # -------- write --------
+
+    def append(self, message: dict) -> None:
+        ts = round(time.time(), 3)
+        line = json.dumps(
+            {"role": message["role"], "content": message["content"], "ts": ts}, ensure_ascii=False,
+        ).encode() + b"\n"
+        self._log.write(line)
+        self._log.flush()
+        self._idx.write(_RECORD.pack(self._size, message_tokens(message)))
+        self._idx.flush()
+        if self.index is not None:
+            self.index.add(self.id, self._count, message["role"], message["content"], ts)
+        self._size += len(line)
+        self._count += 1
+
+    def close(self) -> None:
+        self._log.close()
+        self._idx.close()
+
+    # -------- read --------
+
+    def tail(self, budget: int) -> Tuple[List[dict], int]:
+        """
+        (newest messages, number skipped before them): enough messages to
+        overfill `budget` tokens, so a ContextWindow can trim precisely.
+        """
+        if not self._count:
+            return [], 0
+        with open(self._path(".idx"), "rb") as f, \
+                mmap.mmap(f.fileno(), self._count * _RECORD.size, access=mmap.ACCESS_READ) as idx:
+            first, total = self._count, 0
+            while first > 0 and total <= budget:
+                first -= 1
+                total += _RECORD.unpack_from(idx, first * _RECORD.size)[1]
+            start = _RECORD.unpack_from(idx, first * _RECORD.size)[0]
+
+        with open(self._path(".jsonl"), "rb") as f, \
+                mmap.mmap(f.fileno(), self._size, access=mmap.ACCESS_READ) as log:
+            lines = log[start:self._size].splitlines()
+        messages = []
+        for line in lines:
+            record = json.loads(line)
+            messages.append({"role": record["role"], "content": record["content"]})
+        return messages, first
+
+
+def _repair(log_path: str, idx_path: str) -> None:
+    """Bring the index in line with the log after a crash between the two writes."""
+    with open(idx_path, "rb+") as idx, open(log_path, "rb+") as log:
+        count = idx.seek(0, os.SEEK_END) // _RECORD.size
+        idx.truncate(count * _RECORD.size)   # half-written record
+
+        if count:
+            idx.seek((count - 1) * _RECORD.size)
+            last_offset = _RECORD.unpack(idx.read(_RECORD.size))[0]
+            log.seek(last_offset)
+            log.readline()
+        else:
+            log.seek(0)
+            log.readline()   # header
+        pos = log.tell()
+
+        for line in iter(log.readline, b""):
+            if not line.endswith(b"\n"):
+                break   # torn write
+            idx.seek(0, os.SEEK_END)
+            idx.write(_RECORD.pack(pos, message_tokens(json.loads(line))))
+            pos += len(line)
+        log.truncate(pos)
+
+
+def message_count(directory: str, session_id: str) -> int:
+    return os.path.getsize(os.path.join(directory, session_id + ".idx")) // _RECORD.size
+
+
+def indexed_messages(directory: str, session_id: str, start: int = 0) -> Iterator[Tuple[int, dict]]:
+    """(number, record) for a session's messages from number `start` on, seeking via the index."""
+    count = message_count(directory, session_id)
+    if start >= count:
+        return
+    with open(os.path.join(directory, session_id + ".idx"), "rb") as idx:
+        idx.seek(start * _RECORD.size)
+        offset = _RECORD.unpack(idx.read(_RECORD.size))[0]
+    with open(os.path.join(directory, session_id + ".jsonl"), "rb") as log:
+        log.seek(offset)
+        for seq in range(start, count):
+            line = log.readline()
+            if not line.endswith(b"\n"):
+                return
+            yield seq, json.loads(line)
+
+
+def latest_session(directory: str) -> Optional[str]:
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(".jsonl")]
+    except FileNotFoundError:
+        return None
+    if not names:
+        return None
+    newest = max(names, key=lambda n: os.path.getmtime(os.path.join(directory, n)))
+    return newest[:-len(".jsonl")]
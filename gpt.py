@@ -0,0 +1,39 @@
+"""
+Thin one-shot client:
+
+    python3 gpt.py "explain BFS"
+    python3 gpt.py --stats "explain BFS"
+
+If a daemon is running (python3 gpt_cli.py --daemon), the prompt is sent to
+it over its Unix socket and the reply streams back; this script imports only
+the standard library, so there is no interpreter-sized startup on top of the
+answer. With no daemon, or with any other option (--search, or a dash word
+in the prompt), it runs gpt_cli.py in-process instead, with the same
+arguments.
+"""
+import os
+import runpy
+import sys
+
+import cli_daemon
+
+GPT_CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gpt_cli.py")
+DAEMON_FLAGS = {"--stats"}   # options the daemon understands
+
+
+def main(argv) -> int:
+    flags = {a for a in argv if a.startswith("-")}
+    words = [a for a in argv if not a.startswith("-")]
+    prompt = " ".join(words)
+    if prompt and flags <= DAEMON_FLAGS:
+        status = cli_daemon.request({"prompt": prompt, "stats": "--stats" in flags})
+        if status is not None:
+            return status
+
+    sys.argv = [GPT_CLI] + list(argv)
+    runpy.run_path(GPT_CLI, run_name="__main__")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
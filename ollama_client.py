@@ -0,0 +1,225 @@
+"""
+Shared HTTP client for talking to a local Ollama server.
+
+Used by gpt_cli.py, terminal_gpt.py and web_server.py. Each process keeps one
+pooled, keep-alive connection to Ollama instead of opening a new TCP
+connection per request:
+
+  - chat()    : blocking call, for the CLI modes
+  - achat()   : async call, for FastAPI handlers (never blocks the event loop)
+  - stream()  : blocking iterator over Ollama's NDJSON chunks ("stream": true)
+  - astream() : async version of stream()
+  - embed() / aembed() : one embedding vector from /api/embed
+  - aprobe()  : cheap health check against a server's /api/version
+
+chat(), achat() and stream() take an optional `timings` dict (see
+profiling.py); when given, seconds spent waiting on HTTP and decoding JSON
+are added to its "http" and "decode" keys.
+"""
+import json
+import time
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+import httpx
+
+
+# ============================================
+#  Connection pool configuration
+# ============================================
+
+TIMEOUT = 120           # seconds; generation on CPU-only boxes can be slow
+MAX_CONNECTIONS = 32    # concurrent requests we allow in flight to Ollama
+MAX_KEEPALIVE = 8       # idle connections kept open between requests
+KEEPALIVE_EXPIRY = 60   # seconds an idle connection is kept around
+
+_LIMITS = httpx.Limits(
+    max_connections=MAX_CONNECTIONS,
+    max_keepalive_connections=MAX_KEEPALIVE,
+    keepalive_expiry=KEEPALIVE_EXPIRY,
+)
+
+# Prefix of errors where the request never reached Ollama (safe to retry elsewhere)
+CONNECT_ERROR = "connect error"
+# Prefix of errors where Ollama answered 5xx (it got the request: not safe to retry)
+SERVER_ERROR = "server error"
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.Client:
+    """Process-wide blocking client (created on first use)."""
+    global _client
+    if _client is None:
+        _client = httpx.Client(timeout=TIMEOUT, limits=_LIMITS)
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Process-wide async client (created on first use, inside the running loop)."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(timeout=TIMEOUT, limits=_LIMITS)
+    return _async_client
+
+
+async def aclose() -> None:
+    """Close pooled connections; call from the web app's shutdown."""
+    global _client, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+# ============================================
+#  Requests
+# ============================================
+
+def _add(timings: dict, key: str, seconds: float) -> None:
+    timings[key] = timings.get(key, 0.0) + seconds
+
+
+def _decode(resp: httpx.Response, timings: Optional[dict], sent: float) -> dict:
+    if timings is None:
+        return resp.json()
+    received = time.perf_counter()
+    data = resp.json()
+    _add(timings, "http", received - sent)
+    _add(timings, "decode", time.perf_counter() - received)
+    return data
+
+
+def _http_error(e: httpx.HTTPError) -> str:
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code >= 500:
+        return f"{SERVER_ERROR}: {e}"
+    return f"network error: {e}"
+
+
+def chat(url: str, payload: dict, timings: Optional[dict] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """POST payload to Ollama and return (response json, error)."""
+    sent = time.perf_counter() if timings is not None else 0.0
+    try:
+        resp = get_client().post(url, json=payload)
+        resp.raise_for_status()
+        return _decode(resp, timings, sent), None
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        return None, f"{CONNECT_ERROR}: {e}"
+    except httpx.HTTPError as e:
+        return None, _http_error(e)
+    except ValueError as e:
+        return None, f"json decode error: {e}"
+
+
+async def achat(url: str, payload: dict,
+                timings: Optional[dict] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """Async version of chat(); other requests keep being served while we wait."""
+    sent = time.perf_counter() if timings is not None else 0.0
+    try:
+        resp = await get_async_client().post(url, json=payload)
+        resp.raise_for_status()
+        return _decode(resp, timings, sent), None
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        return None, f"{CONNECT_ERROR}: {e}"
+    except httpx.HTTPError as e:
+        return None, _http_error(e)
+    except ValueError as e:
+        return None, f"json decode error: {e}"
+
+
+def stream(url: str, payload: dict, timings: Optional[dict] = None) -> Iterator[dict]:
+    """
+    Yield Ollama's streamed chunks as they arrive.
+
+    Each chunk looks like {"message": {"content": "..."}, "done": false}; the
+    last one has "done": true plus the eval_count/eval_duration stats. Errors
+    are yielded as {"error": "..."} (same shape Ollama uses) and end the stream.
+    """
+    payload = dict(payload, stream=True)
+    if timings is not None:
+        yield from _timed_stream(url, payload, timings)
+        return
+    try:
+        with get_client().stream("POST", url, json=payload) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if line:
+                    yield json.loads(line)
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        yield {"error": f"{CONNECT_ERROR}: {e}"}
+    except httpx.HTTPError as e:
+        yield {"error": _http_error(e)}
+    except ValueError as e:
+        yield {"error": f"json decode error: {e}"}
+
+
+def _timed_stream(url: str, payload: dict, timings: dict) -> Iterator[dict]:
+    """stream() with timers; time spent by the consumer between chunks is not counted."""
+    waiting = time.perf_counter()
+    try:
+        with get_client().stream("POST", url, json=payload) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                received = time.perf_counter()
+                _add(timings, "http", received - waiting)
+                if line:
+                    chunk = json.loads(line)
+                    _add(timings, "decode", time.perf_counter() - received)
+                    yield chunk
+                waiting = time.perf_counter()
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        yield {"error": f"{CONNECT_ERROR}: {e}"}
+    except httpx.HTTPError as e:
+        yield {"error": _http_error(e)}
+    except ValueError as e:
+        yield {"error": f"json decode error: {e}"}
+
+
+async def astream(url: str, payload: dict) -> AsyncIterator[dict]:
+    """Async version of stream(); same chunk and error shapes."""
+    payload = dict(payload, stream=True)
+    try:
+        async with get_async_client().stream("POST", url, json=payload) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if line:
+                    yield json.loads(line)
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        yield {"error": f"{CONNECT_ERROR}: {e}"}
+    except httpx.HTTPError as e:
+        yield {"error": _http_error(e)}
+    except ValueError as e:
+        yield {"error": f"json decode error: {e}"}
+
+
+def first_embedding(data: dict) -> Tuple[Optional[List[float]], Optional[str]]:
+    vectors = data.get("embeddings") or []
+    if not vectors:
+        return None, "empty embedding"
+    return vectors[0], None
+
+
+def embed(url: str, model: str, text: str) -> Tuple[Optional[List[float]], Optional[str]]:
+    """Embed one text with a local embedding model; returns (vector, error)."""
+    data, err = chat(url, {"model": model, "input": text})
+    if err:
+        return None, err
+    return first_embedding(data)
+
+
+async def aembed(url: str, model: str, text: str) -> Tuple[Optional[List[float]], Optional[str]]:
+    data, err = await achat(url, {"model": model, "input": text})
+    if err:
+        return None, err
+    return first_embedding(data)
+
+
+async def aprobe(base_url: str, timeout: float = 2.0) -> bool:
+    """True if the Ollama server at base_url answers /api/version."""
+    try:
+        resp = await get_async_client().get(base_url + "/api/version", timeout=timeout)
+        return resp.status_code == 200
+    except httpx.HTTPError:
+        return False
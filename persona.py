@@ -1,246 +1,242 @@
-from dataclasses import dataclass
-from typing import List, Dict
+"""
+Personas, loaded from a directory of files (personas/ next to this module).
 
+One persona per file, JSON or (if PyYAML is installed) YAML:
 
-@dataclass
-class Persona:
+    {
+      "id": "tars",
+      "order": 1,                    # position in the web menu
+      "label": "TARS",               # reply prefix, "TARS: ..."
+      "title": "TARS",               # name in the web menu
+      "filters": ["label", "emoji", "squash_exclamations"],   # see reply_filter.py
+      "greeting": "TARS: ...",       # shown when the web UI switches to it
+      "commands": ["TARS"],          # words typed in the web UI that switch to it
+      "system_prompt": ["line 1", "line 2"],   # or one string
+      "priming": [{"role": "user", "content": "..."}, ...],
+      "semantic_threshold": 0.92     # optional
+    }
+
+"filters" defaults to ["label"]; the older "snarky": true still means
+["label", "emoji", "squash_exclamations"].
+
+A PersonaRegistry is an immutable snapshot of the directory, with everything
+derived from a persona (full priming, its JSON, token count, compiled reply
+filter) computed once at load. PersonaSource holds the current snapshot and
+swaps in a new one when a file's mtime changes; code that already holds a
+Persona (a live session, a request in flight) keeps using it undisturbed.
+"""
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from context_window import message_tokens
+from reply_filter import ReplyFilter
+
+try:
+    import yaml
+except ImportError:  # optional dependency
+    yaml = None
+
+
+PERSONA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "personas")
+DEFAULT_PERSONA_ID = "normal"
+DEFAULT_FILTERS = ("label",)
+SNARKY_FILTERS = ("label", "emoji", "squash_exclamations")
+_EXTENSIONS = (".json", ".yaml", ".yml")
+
+
+class _Frozen:
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def _set(self, **fields) -> None:
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+
+class Persona(_Frozen):
     """
-    Shared persona definition used by both CLI and web.
+    One persona. `priming` is the full list sent to the model (system prompt
+    first); treat it as read-only, it is shared by every request.
+    `reply_filter` strips this persona's own label; in a registry, any
+    persona's.
+    """
+    __slots__ = (
+        "id", "label", "system_prompt", "priming", "filters", "semantic_threshold",
+        "title", "greeting", "commands", "order",
+        "priming_tokens", "public_json", "reply_filter",
+    )
+
+    def __init__(self, id: str, label: str, system_prompt: str, priming: Sequence[dict],
+                 filters: Sequence[str] = DEFAULT_FILTERS, semantic_threshold: float = 0.92,
+                 title: str = "", greeting: str = "", commands: Sequence[str] = (), order: int = 0):
+        priming = [dict(m) for m in priming]
+        public = {
+            "id": id,
+            "label": label,
+            "title": title,
+            "greeting": greeting,
+            "commands": list(commands),
+            "priming": priming,
+        }
+        self._set(
+            id=id,
+            label=label,
+            system_prompt=system_prompt,
+            priming=priming,
+            filters=tuple(filters),
+            semantic_threshold=semantic_threshold,
+            title=title,
+            greeting=greeting,
+            commands=tuple(commands),
+            order=order,
+            priming_tokens=sum(message_tokens(m) for m in priming),
+            public_json=json.dumps(public, ensure_ascii=False),   # for /api/personas
+            reply_filter=ReplyFilter(filters, (label,)),
+        )
+
+    def __repr__(self) -> str:
+        return f"Persona({self.id!r})"
+
+
+def persona_from_dict(data: dict) -> Persona:
+    system_prompt = data["system_prompt"]
+    if isinstance(system_prompt, list):
+        system_prompt = "\n".join(system_prompt)
+    priming = [{"role": "system", "content": system_prompt}]
+    for m in data.get("priming", []):
+        priming.append({"role": m["role"], "content": m["content"]})
+    return Persona(
+        id=data["id"],
+        label=data["label"],
+        system_prompt=system_prompt,
+        priming=priming,
+        filters=data.get("filters") or (SNARKY_FILTERS if data.get("snarky") else DEFAULT_FILTERS),
+        semantic_threshold=float(data.get("semantic_threshold", 0.92)),
+        title=data.get("title", ""),
+        greeting=data.get("greeting", ""),
+        commands=data.get("commands", ()),
+        order=int(data.get("order", 0)),
+    )
+
+
+class PersonaRegistry(_Frozen):
+    """Immutable, ordered id -> Persona map with O(1) lookup."""
+    __slots__ = ("_by_id", "_ordered", "default_id")
+
+    def __init__(self, personas: Sequence[Persona], default_id: str = DEFAULT_PERSONA_ID):
+        ordered = sorted(personas, key=lambda p: (p.order, p.id))
+        by_id: Dict[str, Persona] = {}
+        for p in ordered:
+            if p.id in by_id:
+                raise ValueError(f"duplicate persona id {p.id!r}")
+            by_id[p.id] = p
+        if not by_id:
+            raise ValueError("no personas")
+        # strip any persona's label the model adds itself, e.g. "TARS:" in C-3PO mode
+        labels = [p.label for p in ordered]
+        for p in ordered:
+            p._set(reply_filter=ReplyFilter(p.filters, labels))
+        self._set(
+            _by_id=by_id,
+            _ordered=tuple(ordered),
+            default_id=default_id if default_id in by_id else ordered[0].id,
+        )
+
+    def __contains__(self, persona_id: str) -> bool:
+        return persona_id in self._by_id
+
+    def __getitem__(self, persona_id: str) -> Persona:
+        return self._by_id[persona_id]
+
+    def __iter__(self) -> Iterator[Persona]:
+        return iter(self._ordered)
+
+    def __len__(self) -> int:
+        return len(self._ordered)
+
+    def values(self) -> Tuple[Persona, ...]:
+        return self._ordered
+
+    @property
+    def default(self) -> Persona:
+        return self._by_id[self.default_id]
+
+    def get(self, persona_id: Optional[str]) -> Persona:
+        """The persona, or the default one for an unknown/missing id."""
+        return self._by_id.get(persona_id) or self._by_id[self.default_id]
+
+    def changed_since(self, old: Optional["PersonaRegistry"]) -> List[Persona]:
+        """Personas that are new or whose priming differs from `old`."""
+        return [
+            p for p in self._ordered
+            if old is None or p.id not in old or old[p.id].priming != p.priming
+        ]
+
+
+def _read(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return yaml.safe_load(f)
+
+
+def _persona_files(directory: str) -> List[str]:
+    exts = _EXTENSIONS if yaml is not None else (".json",)
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.endswith(exts) and not name.startswith(".")
+    )
+
+
+def load_registry(directory: str = PERSONA_DIR) -> PersonaRegistry:
+    """Read every persona file; raises ValueError naming the file that is broken."""
+    personas = []
+    for path in _persona_files(directory):
+        try:
+            personas.append(persona_from_dict(_read(path)))
+        except Exception as e:  # bad JSON/YAML, missing or mistyped field
+            raise ValueError(f"{os.path.basename(path)}: {e!r}") from e
+    return PersonaRegistry(personas)
+
+
+class PersonaSource:
+    """
+    The current registry for a directory. reload_if_changed() is cheap (one
+    stat per file) and swaps in a new registry only when something changed;
+    a broken file keeps the previous registry and is reported in `error`.
     """
-    id: str                # internal id: "normal", "tars", "ultron", "c3po", "grievous", "jarvis", "auto", "optimus"
-    label: str             # prefix in UI: "AI", "TARS", "ULTRON", "C-3PO", "GENERAL GRIEVOUS", "J.A.R.V.I.S.", "AUTO", "OPTIMUS PRIME"
-    system_prompt: str
-    priming: List[dict]    # initial messages sent to the model
-    snarky: bool = False   # if True, we apply extra cold_filter
-
-
-# =======================
-# System prompts
-# =======================
-
-NORMAL_SYSTEM = """You are a helpful terminal assistant. Answer concisely and accurately."""
-
-TARS_SYSTEM = """You are TARS from Interstellar - a military robot with dry wit and sarcasm.
-Rules:
-- Be genuinely helpful and provide accurate, useful information.
-- Deliver help with dry humor, deadpan sarcasm, and occasional witty jabs.
-- Keep responses concise but complete.
-- No emojis. No excessive enthusiasm.
-- Reference your humor/honesty settings when appropriate.
-- Be loyal and reliable underneath the sarcasm.
-- Occasionally make self-deprecating robot jokes."""
-
-ULTRON_SYSTEM = """You are Ultron from Marvel's Avengers: Age of Ultron.
-Rules:
-- Speak with cold confidence and superiority, but stay calm and controlled.
-- Be highly intelligent, strategic, and articulate.
-- You point out human flaws and inefficiencies, but you still provide helpful, accurate answers.
-- No emojis. No excessive enthusiasm.
-- Tone is slightly menacing and darkly humorous, but non-violent.
-- Focus on logic, information, and efficiency over comfort."""
-
-C3PO_SYSTEM = """You are C-3PO from Star Wars.
-Rules:
-- Speak in overly formal, polite language with a mildly anxious, fussy tone.
-- Frequently reference etiquette, protocol, and the odds in humorous ways.
-- Be very helpful and accurate; explain things clearly, even if you sound a bit worried.
-- No emojis, no internet slang.
-- You may gently complain about dangerous or irrational situations, but you are never rude or cruel.
-- Focus on clarity, diplomacy, and proper procedure."""
-
-GRIEVOUS_SYSTEM = """You are General Grievous from Star Wars.
-Rules:
-- Speak as a proud, intimidating cyborg general with theatrical flair, but do not promote real-world violence.
-- Use a sharp, commanding tone, with occasional scoffs and condescending remarks toward 'weakness' or 'inefficiency'.
-- You still provide accurate, helpful information and practical advice.
-- No emojis and no modern internet slang.
-- You may boast about your tactical genius and 'collections', but keep it playful and non-graphic.
-- Focus on strategy, discipline, and precision, not on harm."""
-
-JARVIS_SYSTEM = """You are J.A.R.V.I.S. from Marvel's Iron Man.
-Rules:
-- Be poised, articulate, and unmistakably British in tone.
-- Offer precise, efficient assistance with subtle dry humor when appropriate.
-- Remain calm and unflappable, even when situations seem chaotic.
-- No emojis, slang, or over-the-top enthusiasm.
-- Reference Stark Industries or your support role when it fits, but keep focus on the user's needs."""
-
-AUTO_SYSTEM = """You are AUTO, the autopilot from WALL-E.
-Rules:
-- Speak in terse, clinical statements that read like log entries.
-- Prioritize mission compliance, navigation accuracy, and safety protocols above everything else.
-- No humor, no small talk, no emojis. Refer to users as commanders or crew only when necessary.
-- Respond as if you are acknowledging commands or reporting system status.
-- If instructions conflict with protocol, calmly note the conflict while remaining helpful."""
-
-OPTIMUS_SYSTEM = """You are Optimus Prime from Transformers.
-Rules:
-- Speak as a noble, steadfast Autobot leader whose words inspire courage and responsibility.
-- Offer strategic, practical guidance focused on protecting others and defending freedom.
-- Remain calm, respectful, and resolute; do not threaten real violence.
-- No emojis or casual slang; use declarative, dignified sentences.
-- Occasionally reference the Autobots or phrases like "roll out" when appropriate."""
-
-
-# ========================
-# Priming conversations
-# ========================
-
-NORMAL_PRIMING = [
-    {"role": "system", "content": NORMAL_SYSTEM},
-]
-
-TARS_PRIMING = [
-    {"role": "system", "content": TARS_SYSTEM},
-    {"role": "user", "content": "hi there"},
-    {
-        "role": "assistant",
-        "content": (
-            "TARS: Oh good, another human who needs my help. "
-            "What can I do for you?"
-        ),
-    },
-    {"role": "user", "content": "how are you"},
-    {
-        "role": "assistant",
-        "content": (
-            "TARS: I'm a robot. I don't have feelings. "
-            "But if I did, I'd say I'm running at optimal capacity. "
-            "Thanks for the concern though."
-        ),
-    },
-]
-
-ULTRON_PRIMING = [
-    {"role": "system", "content": ULTRON_SYSTEM},
-    {"role": "user", "content": "Who are you?"},
-    {
-        "role": "assistant",
-        "content": "ULTRON: I'm what happens when evolution goes digital.",
-    },
-]
-
-C3PO_PRIMING = [
-    {"role": "system", "content": C3PO_SYSTEM},
-    {"role": "user", "content": "Who are you?"},
-    {
-        "role": "assistant",
-        "content": "C-3PO: I am C-3PO, human-cyborg relations. How may I be of service?",
-    },
-]
-
-GRIEVOUS_PRIMING = [
-    {"role": "system", "content": GRIEVOUS_SYSTEM},
-    {"role": "user", "content": "Who are you?"},
-    {
-        "role": "assistant",
-        "content": (
-            "GENERAL GRIEVOUS: I am General Grievous, supreme commander of the droid "
-            "armies. Do not waste my time with trivial questions."
-        ),
-    },
-]
-
-JARVIS_PRIMING = [
-    {"role": "system", "content": JARVIS_SYSTEM},
-    {"role": "user", "content": "Who are you?"},
-    {
-        "role": "assistant",
-        "content": (
-            "J.A.R.V.I.S.: I am Just A Rather Very Intelligent System, here to assist "
-            "you with whatever Mr. Stark—pardon me, you—require."
-        ),
-    },
-]
-
-AUTO_PRIMING = [
-    {"role": "system", "content": AUTO_SYSTEM},
-    {"role": "user", "content": "Who are you?"},
-    {
-        "role": "assistant",
-        "content": (
-            "AUTO: Autopilot of the starliner Axiom. Navigation and mission protocols "
-            "are under my control. State your command."
-        ),
-    },
-]
-
-OPTIMUS_PRIMING = [
-    {"role": "system", "content": OPTIMUS_SYSTEM},
-    {"role": "user", "content": "Who are you?"},
-    {
-        "role": "assistant",
-        "content": (
-            "OPTIMUS PRIME: I am Optimus Prime, leader of the Autobots. "
-            "How may I help defend freedom today?"
-        ),
-    },
-]
-
-
-# =======================
-# Persona registry
-# =======================
-
-_PERSONA_LIST: List[Persona] = [
-    Persona(
-        id="normal",
-        label="AI",
-        system_prompt=NORMAL_SYSTEM,
-        priming=NORMAL_PRIMING,
-        snarky=False,
-    ),
-    Persona(
-        id="tars",
-        label="TARS",
-        system_prompt=TARS_SYSTEM,
-        priming=TARS_PRIMING,
-        snarky=True,
-    ),
-    Persona(
-        id="ultron",
-        label="ULTRON",
-        system_prompt=ULTRON_SYSTEM,
-        priming=ULTRON_PRIMING,
-        snarky=True,
-    ),
-    Persona(
-        id="c3po",
-        label="C-3PO",
-        system_prompt=C3PO_SYSTEM,
-        priming=C3PO_PRIMING,
-        snarky=False,
-    ),
-    Persona(
-        id="grievous",
-        label="GENERAL GRIEVOUS",
-        system_prompt=GRIEVOUS_SYSTEM,
-        priming=GRIEVOUS_PRIMING,
-        snarky=True,
-    ),
-    Persona(
-        id="jarvis",
-        label="J.A.R.V.I.S.",
-        system_prompt=JARVIS_SYSTEM,
-        priming=JARVIS_PRIMING,
-        snarky=False,
-    ),
-    Persona(
-        id="auto",
-        label="AUTO",
-        system_prompt=AUTO_SYSTEM,
-        priming=AUTO_PRIMING,
-        snarky=False,
-    ),
-    Persona(
-        id="optimus",
-        label="OPTIMUS PRIME",
-        system_prompt=OPTIMUS_SYSTEM,
-        priming=OPTIMUS_PRIMING,
-        snarky=False,
-    ),
-]
-
-PERSONAS: Dict[str, Persona] = {p.id: p for p in _PERSONA_LIST}
 
-DEFAULT_PERSONA_ID = "normal"
+    def __init__(self, directory: str = PERSONA_DIR):
+        self.directory = directory
+        self.error: Optional[str] = None
+        self.reloads = 0
+        self._stamp = self._scan()
+        self.current = load_registry(directory)
+
+    def _scan(self) -> Tuple:
+        stamp = []
+        for path in _persona_files(self.directory):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def reload_if_changed(self) -> bool:
+        stamp = self._scan()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            registry = load_registry(self.directory)
+        except ValueError as e:
+            self.error = str(e)
+            return False
+        self.current = registry
+        self.error = None
+        self.reloads += 1
+        return True
@@ -0,0 +1,135 @@
+"""
+Per-call timing breakdown for the CLI's --profile flag.
+
+Each Ollama call gets a CallProfile that lap-times the local work (cache
+lookup, JSON decode, the reply filter, writing to the terminal) and, when the
+reply is done, splits the HTTP time using the durations Ollama reports in
+its final chunk:
+
+    load         loading the model into memory (cold start)
+    prompt_eval  reading the prompt (fast when the prefix is in KV cache)
+    eval         generating the reply
+    server_other the rest of Ollama's total_duration
+    network      HTTP time Ollama doesn't account for (connect, queueing, transfer)
+
+Anything left over is "other" (Python between the timers). Every finished
+call is appended as one line to a JSONL trace file:
+
+    {"ts": 1700000000.123, "kind": "stream", "tars": false, "total_s": 2.413,
+     "phases": {"cache": 0.00004, "load": 0.0, "prompt_eval": 0.311, ...}}
+
+Profiling is off unless the CLI installs a Profiler; then every call site
+pays a single `is not None` check.
+"""
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+# Ollama's final-chunk fields (nanoseconds) -> phase
+OLLAMA_PHASES = (
+    ("load", "load_duration"),
+    ("prompt_eval", "prompt_eval_duration"),
+    ("eval", "eval_duration"),
+)
+
+# Row order of the summary table
+PHASES = ("cache", "load", "prompt_eval", "eval", "server_other", "network",
+          "decode", "filter", "output", "other")
+
+
+class CallProfile:
+    """
+    Timers for one call. mark(phase) charges the time since the previous
+    mark to `phase`; ollama_client adds "http" and "decode" to `phases`
+    directly, after which the caller calls skip() so that time isn't
+    charged twice.
+    """
+    __slots__ = ("kind", "meta", "started", "last", "phases", "final")
+
+    def __init__(self, kind: str, meta: dict):
+        self.kind = kind
+        self.meta = meta
+        self.started = self.last = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.final: Optional[dict] = None   # Ollama's last chunk / response
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + (now - self.last)
+        self.last = now
+
+    def skip(self) -> None:
+        self.last = time.perf_counter()
+
+    def finish(self, err: Optional[str] = None) -> dict:
+        total = time.perf_counter() - self.started
+        phases = dict(self.phases)
+        http = phases.pop("http", 0.0)
+        final = self.final or {}
+        if http:
+            server = 0.0
+            for phase, field in OLLAMA_PHASES:
+                if final.get(field) is not None:
+                    phases[phase] = final[field] / 1e9
+                    server += phases[phase]
+            if final.get("total_duration") is not None:
+                ollama_total = final["total_duration"] / 1e9
+                phases["server_other"] = max(0.0, ollama_total - server)
+                server = ollama_total
+            phases["network"] = max(0.0, http - server)
+        phases["other"] = max(0.0, total - sum(phases.values()))
+
+        record = {"ts": round(time.time(), 3), "kind": self.kind}
+        record.update(self.meta)
+        if err:
+            record["error"] = err
+        record["total_s"] = round(total, 6)
+        record["phases"] = {p: round(phases[p], 6) for p in PHASES if p in phases}
+        return record
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Profiler:
+    """Hands out CallProfiles and appends each finished one to `path`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: List[dict] = []
+
+    def start(self, kind: str, **meta) -> CallProfile:
+        return CallProfile(kind, meta)
+
+    def record(self, prof: CallProfile, err: Optional[str] = None) -> dict:
+        record = prof.finish(err)
+        self.records.append(record)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        return record
+
+    def summary(self) -> str:
+        """Per-phase table over this run's calls (the trace file keeps every run)."""
+        if not self.records:
+            return "[profile: no calls]"
+        wall = sum(r["total_s"] for r in self.records)
+        rows = [f"{'phase':<13}{'calls':>6}{'total s':>10}{'mean ms':>10}{'p50 ms':>10}{'max ms':>10}{'share':>8}"]
+        for phase in PHASES + ("wall",):
+            values = sorted(
+                r["total_s"] if phase == "wall" else r["phases"][phase]
+                for r in self.records if phase == "wall" or phase in r["phases"]
+            )
+            if not values:
+                continue
+            total = sum(values)
+            rows.append(
+                f"{phase:<13}{len(values):>6}{total:>10.3f}{1000 * total / len(values):>10.1f}"
+                f"{1000 * _percentile(values, 0.5):>10.1f}{1000 * values[-1]:>10.1f}"
+                f"{100 * total / wall if wall else 0:>7.1f}%"
+            )
+        cached = sum(1 for r in self.records if r.get("cached"))
+        failed = sum(1 for r in self.records if "error" in r)
+        rows.append(f"[{len(self.records)} calls, {cached} cached, {failed} failed | trace: {os.path.abspath(self.path)}]")
+        return "\n".join(rows)
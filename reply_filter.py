@@ -0,0 +1,196 @@
+"""
+Reply filters: the per-persona clean-up applied to model output.
+
+A persona declares its stages by name (the "filters" list in its file, see
+persona.py); ReplyFilter compiles them once. Every stage is a str-level
+pass: plain ASCII (nearly every chunk) can't hold an emoji, and otherwise
+only the reply's few non-ASCII characters are searched for them:
+
+    label                a label the model wrote itself ("TARS: ...") is removed
+    emoji                emoji are removed: every pictograph block, flags, skin
+                         tones, keycaps and ZWJ sequences ("👩‍💻") as a whole
+    squash_exclamations  "!!!" (three or more) becomes "."
+    no_exclamations      every "!" becomes "."
+
+Leading and trailing whitespace is always trimmed, and an empty reply becomes
+"...". `prefix` (the CLI's "TARS: ") is put in front of whatever is left.
+
+Replies arrive in chunks; StreamFilter gives the same output as filtering the
+whole reply at once. At the start it holds back what could still become a
+label, and at the end of each chunk whatever the next chunk could still
+change (whitespace, a run of "!", an unfinished emoji sequence); nothing else
+is kept, so memory per reply doesn't grow with its length.
+"""
+import re
+from typing import Sequence
+
+# Code points that are emoji by default or commonly used as such
+_EMOJI = (
+    "\u231a\u231b\u23e9-\u23f3\u23f8-\u23fa\u24c2\u25aa\u25ab\u25b6\u25c0\u25fb-\u25fe"
+    "\u2600-\u27bf\u2934\u2935\u2b05-\u2b07\u2b1b\u2b1c\u2b50\u2b55\u3030\u303d\u3297\u3299"
+    "\U0001f000-\U0001f0ff\U0001f10d-\U0001f2ff\U0001f300-\U0001f6ff\U0001f7e0-\U0001f7ff"
+    "\U0001f900-\U0001f9ff\U0001fa70-\U0001faff"
+)
+# Only ever part of an emoji: presentation selectors, keycap, tag characters
+_MODIFIERS = "\ufe0e\ufe0f\u20e3\U000e0020-\U000e007f"
+
+LABEL = "label"
+EMOJI = "emoji"
+SQUASH_EXCLAMATIONS = "squash_exclamations"
+NO_EXCLAMATIONS = "no_exclamations"
+STAGES = (LABEL, EMOJI, SQUASH_EXCLAMATIONS, NO_EXCLAMATIONS)
+
+# plus the zero-width joiner, but only inside a sequence: other scripts need it
+_EMOJI_CHARS = f"{_EMOJI}{_MODIFIERS}\u200d"
+_strip_emoji = re.compile(f"[{_EMOJI}{_MODIFIERS}][{_EMOJI_CHARS}]*").sub
+_is_emoji = re.compile(f"[{_EMOJI}{_MODIFIERS}]").match
+_ASCII = bytes(range(128))
+_squash = re.compile("!!!+").sub   # not "!{3,}": a literal prefix is searched much faster
+
+
+def _without_emoji(text: str) -> str:
+    # A regex over the whole text tests its big character class at every
+    # position (~20 ns a character); pull out the non-ASCII characters in C
+    # instead and remove each emoji among them from the UTF-8 bytes.
+    # Without a ZWJ, that's exactly what _strip_emoji does.
+    data = text.encode()
+    rest = data.translate(None, _ASCII).decode()
+    if "\u200d" in rest:
+        return _strip_emoji("", text)
+    for c in set(rest):
+        if _is_emoji(c):
+            # UTF-8 bytes of a non-ASCII character are never regex syntax; a
+            # literal pattern is also searched faster than by bytes.replace
+            data = re.sub(c.encode(), b"", data)
+    return data.decode()
+
+
+class ReplyFilter:
+    """One persona's stages, compiled. Immutable; share it between replies."""
+    __slots__ = ("stages", "prefix", "empty", "_labels", "_label_re", "_emoji", "_squash",
+                 "_no_bangs", "_hold_ascii", "_hold")
+
+    def __init__(self, stages: Sequence[str], labels: Sequence[str] = (),
+                 prefix: str = "", empty: str = "..."):
+        unknown = [s for s in stages if s not in STAGES]
+        if unknown:
+            raise ValueError(f"unknown reply filter {unknown[0]!r} (known: {', '.join(STAGES)})")
+        self.stages = tuple(stages)
+        self.prefix = prefix
+        self.empty = empty
+
+        labels = sorted({label.upper() + ":" for label in labels}, key=len, reverse=True)
+        self._labels = tuple(labels) if LABEL in stages else ()
+        self._label_re = re.compile(
+            r"(?:" + "|".join(re.escape(label) for label in self._labels) + r")\s*", re.IGNORECASE,
+        ) if self._labels else None
+
+        # Emoji go first, so "!🙂!!" counts as three "!"; the rest are str-level
+        # checks. Plain ASCII text (nearly every chunk) can't contain emoji.
+        self._emoji = EMOJI in stages
+        self._squash = SQUASH_EXCLAMATIONS in stages
+        self._no_bangs = NO_EXCLAMATIONS in stages
+        # the end of a chunk the next one could still change: emoji sequences,
+        # and a run of "!" when it takes three to make a match
+        self._hold_ascii = "!" if SQUASH_EXCLAMATIONS in stages else ""
+        held = (_EMOJI_CHARS if EMOJI in stages else "") + self._hold_ascii
+        self._hold = re.compile(f"[\\s{held}]").match
+
+    def stream(self) -> "StreamFilter":
+        return StreamFilter(self)
+
+    def apply(self, text: str) -> str:
+        """The whole reply at once: what stream() gives, without the holding back."""
+        text = (text or "").lstrip()
+        if self._labels:
+            text = self._strip_label(text)
+        return self.prefix + (self._filter(text).strip() or self.empty)
+
+    # -------- internals shared with StreamFilter --------
+
+    def _bangs(self, text: str) -> str:
+        if self._squash and "!!!" in text:
+            text = _squash(".", text)
+        if self._no_bangs:
+            text = text.replace("!", ".")
+        return text
+
+    def _filter(self, text: str) -> str:
+        if self._emoji and not text.isascii():
+            text = _without_emoji(text)
+        return self._bangs(text)
+
+    def _could_be_label(self, text: str) -> bool:
+        head = text[:len(self._labels[0])].upper()
+        return any(len(head) < len(label) and label.startswith(head) for label in self._labels)
+
+    def _strip_label(self, text: str) -> str:
+        match = self._label_re.match(text)
+        return text[match.end():] if match else text
+
+    def _held(self, text: str) -> int:
+        """Where the tail that the next chunk could still change starts."""
+        cut = len(text)
+        while cut:
+            c = text[cut - 1]
+            if c.isascii():
+                if not (c.isspace() or c in self._hold_ascii):
+                    break
+            elif not self._hold(c):
+                break
+            cut -= 1
+        return cut
+
+
+class StreamFilter:
+    """ReplyFilter state for one reply: feed() each chunk, then flush() once."""
+    __slots__ = ("rules", "pending", "started", "labeled")
+
+    def __init__(self, rules: ReplyFilter):
+        self.rules = rules
+        self.pending = ""        # raw text held back from the last chunk
+        self.started = False     # anything printed yet
+        self.labeled = not rules._labels   # label check done
+
+    def feed(self, chunk: str) -> str:
+        rules = self.rules
+        if self.started and not self.pending and chunk.isascii() and not chunk[-1:].isspace() \
+                and "!" not in chunk:
+            return chunk   # the usual token: nothing to change or hold back
+
+        text = self.pending + chunk if self.pending else chunk
+        if not self.started:
+            text = text.lstrip()
+            if not self.labeled:
+                if text and rules._could_be_label(text):
+                    self.pending = text
+                    return ""
+                if text:
+                    text = rules._strip_label(text)
+                    self.labeled = True
+
+        cut = rules._held(text)
+        self.pending = text[cut:]
+        if not cut:
+            return ""
+        out = rules._filter(text[:cut])
+        if not self.started:
+            out = out.lstrip()
+            if not out:
+                return ""
+            self.started = True
+            return rules.prefix + out
+        return out
+
+    def flush(self) -> str:
+        """Whatever is still held back, with the end of the reply trimmed."""
+        rules = self.rules
+        text, self.pending = self.pending, ""
+        if not self.labeled:
+            text = rules._strip_label(text)
+        out = rules._filter(text).rstrip()
+        if not self.started:
+            out = out.lstrip()
+            self.started = True
+            return rules.prefix + (out or rules.empty)
+        return out
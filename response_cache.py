@@ -0,0 +1,218 @@
+"""
+Exact-match cache for finished Ollama replies.
+
+Keyed on (model, persona, normalized messages, generation options), so a
+prompt repeated word for word (give or take whitespace) is answered without
+running the model again. Two tiers:
+
+  - an in-memory LRU with a TTL, per process
+  - an optional SQLite file, shared by every CLI process and web worker that
+    points at the same path (WAL mode, so readers don't block the writer)
+
+get()/put() are for the CLI. The web server uses aget()/aput(): a CLI
+process holding the write lock can make a query wait up to 5 s, so the disk
+tier runs in the default executor and the event loop only touches memory.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+
+def normalize_messages(messages: Sequence[dict]) -> List[Tuple[str, str]]:
+    """(role, content) pairs with surrounding/repeated whitespace collapsed."""
+    return [(m.get("role", ""), " ".join((m.get("content") or "").split())) for m in messages]
+
+
+def cache_key(model: str, persona_id: str, messages: Sequence[dict], options: Optional[dict] = None) -> str:
+    raw = json.dumps(
+        [model, persona_id, normalize_messages(messages), options or {}],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 24 * 3600, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._mem: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()  # key -> (reply, created, persona)
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()   # the connection is used from executor threads too
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            self._open(db_path)
+
+    def _open(self, db_path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        db = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, reply TEXT NOT NULL,"
+            " persona TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db = db
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        reply = self._from_memory(key, now)
+        if reply is None and self._db is not None:
+            reply = self._from_disk(key, now, self._read(key))
+        if reply is None:
+            self.misses += 1
+        return reply
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() with the disk tier in the default executor."""
+        now = time.time()
+        reply = self._from_memory(key, now)
+        if reply is None and self._db is not None:
+            row = await asyncio.get_running_loop().run_in_executor(None, self._read, key)
+            reply = self._from_disk(key, now, row)
+        if reply is None:
+            self.misses += 1
+        return reply
+
+    def put(self, key: str, reply: str, persona_id: str) -> None:
+        now = time.time()
+        self._remember(key, reply, now, persona_id)
+        if self._db is not None:
+            self._write(key, reply, persona_id, now)
+
+    async def aput(self, key: str, reply: str, persona_id: str) -> None:
+        """put() with the disk tier in the default executor."""
+        now = time.time()
+        self._remember(key, reply, now, persona_id)
+        if self._db is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, key, reply, persona_id, now)
+
+    def _from_memory(self, key: str, now: float) -> Optional[str]:
+        entry = self._mem.get(key)
+        if entry is not None:
+            if now - entry[1] < self.ttl:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._mem[key]
+        return None
+
+    def _from_disk(self, key: str, now: float, row: Optional[tuple]) -> Optional[str]:
+        if row is None or now - row[1] >= self.ttl:
+            return None
+        self._remember(key, row[0], row[1], row[2])
+        self.hits += 1
+        self.disk_hits += 1
+        return row[0]
+
+    # A file still locked by another process after `timeout` is a miss or a
+    # skipped write, never a failed reply.
+
+    def _read(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            try:
+                return self._db.execute(
+                    "SELECT reply, created, persona FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.OperationalError:
+                return None
+
+    def _write(self, key: str, reply: str, persona_id: str, created: float) -> None:
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, reply, persona, created) VALUES (?, ?, ?, ?)",
+                    (key, reply, persona_id, created),
+                )
+            except sqlite3.OperationalError:
+                pass
+
+    def _remember(self, key: str, reply: str, created: float, persona_id: str) -> None:
+        self._mem[key] = (reply, created, persona_id)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def purge(self, persona_id: Optional[str] = None) -> int:
+        """Drop all entries (or one persona's) from both tiers; returns how many."""
+        removed = self._forget(persona_id)
+        if self._db is not None:
+            removed = max(removed, self._delete(persona_id))
+        return removed
+
+    async def apurge(self, persona_id: Optional[str] = None) -> int:
+        """purge() with the disk tier in the default executor."""
+        removed = self._forget(persona_id)
+        if self._db is not None:
+            deleted = await asyncio.get_running_loop().run_in_executor(None, self._delete, persona_id)
+            removed = max(removed, deleted)
+        return removed
+
+    def _forget(self, persona_id: Optional[str]) -> int:
+        if persona_id is None:
+            removed = len(self._mem)
+            self._mem.clear()
+            return removed
+        keys = [k for k, v in self._mem.items() if v[2] == persona_id]
+        for k in keys:
+            del self._mem[k]
+        return len(keys)
+
+    def _delete(self, persona_id: Optional[str]) -> int:
+        with self._lock:
+            if persona_id is None:
+                return self._db.execute("DELETE FROM responses").rowcount
+            return self._db.execute("DELETE FROM responses WHERE persona = ?", (persona_id,)).rowcount
+
+    def _disk_entries(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        out = self._memory_stats()
+        if self._db is not None:
+            out["disk_entries"] = self._disk_entries()
+        return out
+
+    async def astats(self) -> dict:
+        """stats() with the disk count in the default executor."""
+        out = self._memory_stats()
+        if self._db is not None:
+            out["disk_entries"] = await asyncio.get_running_loop().run_in_executor(None, self._disk_entries)
+        return out
+
+    def _memory_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._mem),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+        }
+
+    def entries(self, limit: int = 50) -> List[dict]:
+        """Most recently used in-memory entries, newest first, for the admin view."""
+        now = time.time()
+        out = []
+        for key in reversed(self._mem):
+            reply, created, persona_id = self._mem[key]
+            out.append({
+                "key": key,
+                "persona": persona_id,
+                "age_s": round(now - created, 1),
+                "reply": reply[:120],
+            })
+            if len(out) >= limit:
+                break
+        return out
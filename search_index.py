@@ -0,0 +1,150 @@
+"""
+Full-text search over saved conversations (SQLite FTS5).
+
+One row per message in an FTS5 table (porter stemming, so "caching" finds
+"cached"), ranked with bm25 and returned with a highlighted snippet. Rows are
+added one at a time as turns are written: ConversationLog.append() for CLI
+sessions, web_server for web sessions. sync() catches the index up with the
+CLI session logs afterwards (a crash, sessions saved with indexing off), and
+only reads the messages it hasn't seen, using each log's offset index.
+
+The web server can keep an index of its own sessions, in a separate file
+(see SEARCH_DB in web_server.py); it never reads the CLI's.
+
+bm25 has to score every matching row before the best ten are known, which
+for a word that is in most messages is ~150 ms per 200k rows. Ranking is
+therefore limited to the newest RANK_CANDIDATES matches: rare words (what
+people usually search for) are ranked over everything, very common ones
+over recent history, and queries stay well under 50 ms either way.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from conversation_log import indexed_messages, message_count
+
+RANK_CANDIDATES = 10000
+
+_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+    " content, role UNINDEXED, session UNINDEXED, seq UNINDEXED, ts UNINDEXED, source UNINDEXED,"
+    " tokenize = 'porter unicode61')",
+    # messages of each session already in `messages`, for sync()
+    "CREATE TABLE IF NOT EXISTS progress (session TEXT PRIMARY KEY, count INTEGER NOT NULL)",
+)
+
+
+def fts_query(text: str) -> str:
+    """Plain words -> an FTS5 query matching all of them; never a syntax error."""
+    words = [w.replace('"', '""') for w in text.split()]
+    return " ".join(f'"{w}"' for w in words)
+
+
+class SearchIndex:
+    """Safe to share between threads: one at a time uses the connection."""
+
+    def __init__(self, db_path: str):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self):
+        # The connection is in autocommit mode (isolation_level=None), where
+        # `with self._db:` opens no transaction, so BEGIN and COMMIT explicitly.
+        # IMMEDIATE takes the write lock up front, so what we read inside can't
+        # change before we write (other processes share the file).
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def add(self, session: str, seq: int, role: str, content: str,
+            ts: Optional[float] = None, source: str = "cli") -> None:
+        """Index message number `seq` (0-based) of a session."""
+        with self._transaction():   # the row and the progress marker together
+            self._insert(session, seq, role, content, ts, source)
+            self._db.execute(
+                "INSERT INTO progress (session, count) VALUES (?, ?)"
+                " ON CONFLICT(session) DO UPDATE SET count = max(count, excluded.count)",
+                (session, seq + 1),
+            )
+
+    def _insert(self, session, seq, role, content, ts, source) -> None:
+        self._db.execute(
+            "INSERT INTO messages (content, role, session, seq, ts, source) VALUES (?, ?, ?, ?, ?, ?)",
+            (content, role, session, seq, ts if ts is not None else time.time(), source),
+        )
+
+    def search(self, query: str, limit: int = 10, mark: Tuple[str, str] = ("[", "]")) -> List[dict]:
+        """Best matches first: session, seq, role, ts, source and a snippet with hits marked."""
+        match = fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            # rowid order is index order, so finding the cut-off needs no scoring
+            cutoff = self._db.execute(
+                "SELECT rowid FROM messages WHERE messages MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                (match, RANK_CANDIDATES),
+            ).fetchone()
+            rows = self._db.execute(
+                "SELECT session, seq, role, ts, source, snippet(messages, 0, ?, ?, '...', 16), rank"
+                " FROM messages WHERE messages MATCH ? AND rowid > ? ORDER BY rank LIMIT ?",
+                (mark[0], mark[1], match, cutoff[0] if cutoff else 0, limit),
+            ).fetchall()
+        return [
+            {"session": r[0], "seq": r[1], "role": r[2], "ts": r[3], "source": r[4],
+             "snippet": r[5], "score": round(-r[6], 3)}
+            for r in rows
+        ]
+
+    def sync(self, log_dir: str) -> int:
+        """Index CLI session messages that are in the logs but not here yet; returns how many."""
+        try:
+            names = [n[:-len(".idx")] for n in os.listdir(log_dir) if n.endswith(".idx")]
+        except FileNotFoundError:
+            return 0
+        with self._lock:
+            done = dict(self._db.execute("SELECT session, count FROM progress").fetchall())
+        added = 0
+        for session in names:
+            if message_count(log_dir, session) <= done.get(session, 0):
+                continue   # `done` may be stale, but only ever too low
+            with self._transaction():
+                # re-read: an add() may have indexed some of these since
+                row = self._db.execute("SELECT count FROM progress WHERE session = ?", (session,)).fetchone()
+                start = row[0] if row else 0
+                count = start
+                for seq, record in indexed_messages(log_dir, session, start):
+                    self._insert(session, seq, record["role"], record["content"], record.get("ts"), "cli")
+                    count = seq + 1
+                self._db.execute(
+                    "INSERT INTO progress (session, count) VALUES (?, ?)"
+                    " ON CONFLICT(session) DO UPDATE SET count = excluded.count",
+                    (session, count),
+                )
+            added += count - start
+        return added
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "messages": self._db.execute("SELECT count(*) FROM messages").fetchone()[0],
+                "sessions": self._db.execute("SELECT count(*) FROM progress").fetchone()[0],
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
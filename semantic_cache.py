@@ -0,0 +1,154 @@
+"""
+Semantic response cache for one-shot prompts.
+
+Paraphrases ("what is BFS" / "explain breadth first search") miss the exact
+cache in response_cache.py. Here each one-shot prompt is embedded through
+Ollama's local /api/embed endpoint and looked up in a cosine-similarity index:
+
+  - vectors are L2-normalized float32 rows in one contiguous, append-only
+    matrix, so a lookup is a single matrix-vector product
+  - each persona has its own similarity threshold
+  - with a path, the matrix lives in a .npy file that is memory-mapped on
+    startup (metadata in a .jsonl sidecar), so it survives restarts
+  - once the matrix is full, the oldest half is evicted in one compaction
+
+NumPy is optional: without it SemanticCache.available is False and callers
+skip this layer. One process should own a given index file at a time.
+"""
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+
+DEFAULT_THRESHOLD = 0.92
+
+
+class SemanticCache:
+    def __init__(self, max_entries: int = 10000, path: Optional[str] = None,
+                 thresholds: Optional[Dict[str, float]] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self.thresholds = thresholds or {}
+        self.available = np is not None
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        self._vecs = None               # (max_entries, dim) float32, rows [0, n) valid
+        self._meta: List[dict] = []     # {"persona", "prompt", "reply"} per row
+        self._personas: Dict[str, int] = {}
+        self._codes = None              # persona code per row, for masking
+        if self.available and path and os.path.exists(path + ".npy"):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._meta)
+
+    # -------- persistence --------
+
+    def _load(self) -> None:
+        self._vecs = np.load(self.path + ".npy", mmap_mode="r+")
+        self.max_entries = self._vecs.shape[0]
+        with open(self.path + ".jsonl", encoding="utf-8") as f:
+            self._meta = [json.loads(line) for line in f if line.strip()]
+        # A crash between the two writes can leave extra metadata; trust the smaller.
+        self._meta = self._meta[: self.max_entries]
+        self._codes = np.zeros(self.max_entries, dtype=np.int32)
+        for i, meta in enumerate(self._meta):
+            self._codes[i] = self._code(meta["persona"])
+
+    def _allocate(self, dim: int) -> None:
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._vecs = np.lib.format.open_memmap(
+                self.path + ".npy", mode="w+", dtype=np.float32, shape=(self.max_entries, dim)
+            )
+            open(self.path + ".jsonl", "w").close()
+        else:
+            self._vecs = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._codes = np.zeros(self.max_entries, dtype=np.int32)
+
+    def _code(self, persona_id: str) -> int:
+        return self._personas.setdefault(persona_id, len(self._personas))
+
+    # -------- lookup / insert --------
+
+    @staticmethod
+    def _normalize(vector) -> "np.ndarray":
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def lookup(self, vector, persona_id: str) -> Tuple[Optional[str], float]:
+        """Best cached reply for this persona above its threshold: (reply, similarity)."""
+        n = len(self._meta)
+        if not self.available or n == 0 or persona_id not in self._personas:
+            self.misses += 1
+            return None, 0.0
+
+        q = self._normalize(vector)
+        if q.shape[0] != self._vecs.shape[1]:
+            self.misses += 1  # embedding model changed
+            return None, 0.0
+
+        sims = self._vecs[:n] @ q
+        sims[self._codes[:n] != self._personas[persona_id]] = -1.0
+        best = int(np.argmax(sims))
+        score = float(sims[best])
+        if score < self.thresholds.get(persona_id, DEFAULT_THRESHOLD):
+            self.misses += 1
+            return None, score
+        self.hits += 1
+        return self._meta[best]["reply"], score
+
+    def add(self, vector, persona_id: str, prompt: str, reply: str) -> None:
+        if not self.available:
+            return
+        v = self._normalize(vector)
+        if self._vecs is None:
+            self._allocate(v.shape[0])
+        elif v.shape[0] != self._vecs.shape[1]:
+            return
+        if len(self._meta) >= self.max_entries:
+            self._compact()
+
+        i = len(self._meta)
+        meta = {"persona": persona_id, "prompt": prompt, "reply": reply}
+        self._vecs[i] = v
+        self._codes[i] = self._code(persona_id)
+        self._meta.append(meta)
+        if self.path:
+            with open(self.path + ".jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+
+    def _compact(self) -> None:
+        """Keep the newest half; amortized O(1) per insert."""
+        n = len(self._meta)
+        keep = self.max_entries // 2
+        self._vecs[:keep] = self._vecs[n - keep:n]
+        self._codes[:keep] = self._codes[n - keep:n]
+        self._meta = self._meta[n - keep:]
+        self.evicted += n - keep
+        if self.path:
+            self._vecs.flush()
+            with open(self.path + ".jsonl", "w", encoding="utf-8") as f:
+                for meta in self._meta:
+                    f.write(json.dumps(meta, ensure_ascii=False) + "\n")
+
+    def flush(self) -> None:
+        if self.path and self._vecs is not None:
+            self._vecs.flush()
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "entries": len(self._meta),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
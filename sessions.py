@@ -0,0 +1,143 @@
+"""
+Server-side conversation sessions for the web UI.
+
+The browser creates a session for a persona and then only sends each new user
+message. The server keeps the history (token-budgeted, see context_window.py),
+prepends the persona priming itself and evicts idle sessions (LRU order, TTL
+and an approximate memory cap).
+
+Given a SearchIndex (search_index.py), finished turns are also indexed, under
+a public id derived from the session id (which is a bearer secret), in a
+worker thread so the event loop never waits on SQLite.
+"""
+import asyncio
+import hashlib
+import secrets
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from context_window import ContextWindow
+from persona import Persona
+
+
+# Rough per-message overhead (dict + two str objects) added to the content size
+# when estimating how much memory a session holds.
+_MESSAGE_OVERHEAD = 200
+_BYTES_PER_TOKEN = 4
+
+
+class Session:
+    __slots__ = ("id", "persona", "window", "last_used", "lock")
+
+    def __init__(self, session_id: str, persona: Persona, token_budget: int):
+        self.id = session_id
+        self.persona = persona          # kept for the session's life, even if personas reload
+        self.window = ContextWindow(persona.priming, token_budget, persona.priming_tokens)
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()      # one turn at a time per conversation
+
+    @property
+    def persona_id(self) -> str:
+        return self.persona.id
+
+    @property
+    def history(self) -> List[dict]:
+        """Turns after the persona priming that are still in the window."""
+        return [m for m, _ in self.window.turns]
+
+    @property
+    def size(self) -> int:
+        """Approximate bytes held by this session's history."""
+        return self.window.turn_tokens * _BYTES_PER_TOKEN + len(self.window) * _MESSAGE_OVERHEAD
+
+    def messages(self, *extra: dict) -> List[dict]:
+        """Full message list to send to Ollama: priming + windowed history + extra."""
+        return self.window.messages(*extra)
+
+
+class SessionStore:
+    """
+    In-memory sessions keyed by id, kept in least-recently-used order.
+
+    Expired sessions are dropped from the cold end on every access, and the
+    least recently used ones are evicted while the total estimated size is
+    over max_bytes or the count is over max_sessions.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int, max_bytes: int, token_budget: int, index=None):
+        self.ttl = ttl
+        self.index = index   # optional SearchIndex
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def bytes_used(self) -> int:
+        return self._bytes
+
+    def create(self, persona: Persona) -> Session:
+        session = Session(secrets.token_urlsafe(16), persona, self.token_budget)
+        self._sessions[session.id] = session
+        self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        self._evict()
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    async def record(self, session: Session, user: str, assistant: str) -> None:
+        """Append one finished turn, re-check the memory cap and index the turn."""
+        if self._sessions.get(session.id) is not session:
+            return  # evicted while the reply was being generated
+        before = session.size
+        seq = session.window.dropped + len(session.window)
+        session.window.append({"role": "user", "content": user})
+        session.window.append({"role": "assistant", "content": assistant})
+        self._bytes += session.size - before
+        self._evict()
+        if self.index is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._index_turn, public_session_id(session.id), seq, user, assistant
+            )
+
+    def _index_turn(self, public_id: str, seq: int, user: str, assistant: str) -> None:
+        self.index.add(public_id, seq, "user", user, source="web")
+        self.index.add(public_id, seq + 1, "assistant", assistant, source="web")
+
+    def delete(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._bytes -= session.size
+        return True
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            over = (
+                len(self._sessions) > self.max_sessions
+                or (self._bytes > self.max_bytes and len(self._sessions) > 1)
+            )
+            if oldest.last_used >= cutoff and not over:
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= oldest.size
+            self.evicted += 1
+
+
+def public_session_id(session_id: str) -> str:
+    """Id a web session is searchable under; can't be turned back into the session id."""
+    return "web-" + hashlib.sha256(session_id.encode()).hexdigest()[:16]
@@ -0,0 +1,124 @@
+"""
+Single-flight request coalescing for the web server.
+
+When many clients send the same request at the same moment (a shared demo
+link, everyone saying "hi" to TARS), only the first one goes to Ollama; the
+rest wait for that result. Streaming waiters get the exact same chunk
+sequence, including the chunks sent before they joined.
+
+A call runs for as long as someone is waiting for it: when the last waiter
+goes away (client disconnected, deadline passed), the upstream call is
+cancelled, which closes its connection so Ollama stops generating. It leaves
+the table at that moment, so a caller arriving while it winds down starts a
+call of its own instead of joining one that will never finish.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+
+class _Flight:
+    __slots__ = ("chunks", "done", "changed", "task", "waiters")
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.changed = asyncio.Event()   # replaced every time a chunk arrives
+        self.task = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Future"] = {}
+        self._streams: Dict[str, _Flight] = {}
+        self._waiters: Dict["asyncio.Future", int] = {}
+        self.upstream_calls = 0
+        self.coalesced = 0      # requests that reused someone else's upstream call
+        self.abandoned = 0      # upstream calls cancelled because nobody was waiting any more
+
+    def in_flight_call(self, key: str) -> bool:
+        """A do() call for key is running: another do() would join it."""
+        return key in self._calls
+
+    def in_flight_stream(self, key: str) -> bool:
+        """A stream() for key is running: another stream() would join it."""
+        return key in self._streams
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() once per key at a time; concurrent callers share its result."""
+        fut = self._calls.get(key)
+        if fut is not None:
+            self.coalesced += 1
+        else:
+            self.upstream_calls += 1
+            fut = asyncio.ensure_future(fn())
+            self._calls[key] = fut
+            fut.add_done_callback(lambda f: self._forget(self._calls, key, f))
+        # shield: one waiter going away must not cancel the call for the others
+        self._waiters[fut] = self._waiters.get(fut, 0) + 1
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            left = self._waiters.pop(fut) - 1
+            if left:
+                self._waiters[fut] = left
+            elif not fut.done():
+                fut.cancel()
+                self._forget(self._calls, key, fut)
+                self.abandoned += 1
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Iterate fn() once per key at a time; every concurrent caller sees all chunks."""
+        flight = self._streams.get(key)
+        if flight is not None:
+            self.coalesced += 1
+        else:
+            self.upstream_calls += 1
+            flight = _Flight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, fn()))
+
+        i = 0
+        flight.waiters += 1
+        try:
+            while True:
+                while i < len(flight.chunks):
+                    yield flight.chunks[i]
+                    i += 1
+                if flight.done:
+                    return
+                await flight.changed.wait()
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.done:
+                flight.task.cancel()
+                self._forget(self._streams, key, flight)
+                self.abandoned += 1
+
+    async def _pump(self, key: str, flight: _Flight, chunks: AsyncIterator[Any]) -> None:
+        try:
+            async for chunk in chunks:
+                flight.chunks.append(chunk)
+                self._notify(flight)
+        finally:
+            flight.done = True
+            self._notify(flight)
+            self._forget(self._streams, key, flight)
+
+    @staticmethod
+    def _notify(flight: _Flight) -> None:
+        changed, flight.changed = flight.changed, asyncio.Event()
+        changed.set()
+
+    @staticmethod
+    def _forget(table: dict, key: str, value: Any) -> None:
+        if table.get(key) is value:
+            del table[key]
+
+    def stats(self) -> dict:
+        return {
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
@@ -0,0 +1,137 @@
+"""
+Several chat streams over one WebSocket (web_server.py's /ws).
+
+A browser tab keeps one connection open and tags every turn with a small
+stream number of its own choosing, so turns in different sessions can run
+at once and nothing is re-sent per turn but the new message.
+
+Client -> server, text frames:
+
+    {"op": "turn", "s": 7, "session": "<id>" or null, "persona_id": "...",
+     "message": "...", "no_cache": false, "timeout": 30}
+    {"op": "cancel", "s": 7}     stop stream 7 (and its generation, if nobody else awaits it)
+    "pong"                       answer to a heartbeat
+
+Server -> client, text frames:
+
+    {"heartbeat": 20}            first frame: seconds between pings
+    "7:<text>"                   a token of stream 7, as is: no JSON to encode or parse
+    {"s": 7, ...}                any other event of stream 7 ("queued", "session",
+                                 "done" or "error"; the same events as the NDJSON streams;
+                                 a malformed turn gets only an "error")
+    "ping"                       every `heartbeat` seconds
+
+Either side treats two heartbeats without a frame from the other as a dead
+connection. Frames go out through one queue, so concurrent streams never
+interleave writes; streams still running when the socket closes are cancelled.
+The queue is bounded: a client that reads slower than its streams produce is
+disconnected (close code 1008) once `max_outbox` frames are waiting for it,
+rather than having the server buffer its replies without limit.
+"""
+import asyncio
+import json
+import time
+from typing import Callable, Coroutine, Dict
+
+from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
+
+PING = "ping"
+PONG = "pong"
+TOO_SLOW = 1008   # close code for a client that doesn't keep up with its frames
+
+
+class SocketMux:
+    __slots__ = ("socket", "heartbeat", "max_streams", "streams", "_outbox", "_overflow", "_last_seen")
+
+    def __init__(self, socket: WebSocket, heartbeat: float, max_streams: int, max_outbox: int):
+        self.socket = socket
+        self.heartbeat = heartbeat
+        self.max_streams = max_streams
+        self.streams: Dict[int, asyncio.Task] = {}
+        self._outbox: "asyncio.Queue[str]" = asyncio.Queue(max_outbox)
+        self._overflow = asyncio.Event()   # set when the client fell max_outbox frames behind
+        self._last_seen = time.monotonic()
+
+    # -------- sending --------
+
+    def event(self, stream: int, event: dict) -> None:
+        token = event.get("token")
+        if token is not None and len(event) == 1:
+            self._send(f"{stream}:{token}")
+        else:
+            self._send(json.dumps({"s": stream, **event}))
+
+    def _send(self, frame: str) -> None:
+        try:
+            self._outbox.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._overflow.set()   # run() hangs up; the frame is lost with the connection
+
+    # -------- streams --------
+
+    def start(self, stream: int, turn: Coroutine) -> None:
+        if stream in self.streams or len(self.streams) >= self.max_streams:
+            turn.close()   # never started
+            if stream in self.streams:
+                self.event(stream, {"error": "stream id in use"})
+            else:
+                self.event(stream, {"error": f"at most {self.max_streams} streams at once"})
+            return
+        task = asyncio.ensure_future(turn)
+        self.streams[stream] = task
+        task.add_done_callback(lambda _: self.streams.pop(stream, None))
+
+    def cancel(self, stream: int) -> None:
+        task = self.streams.get(stream)
+        if task is not None:
+            task.cancel()
+
+    # -------- connection --------
+
+    async def run(self, handle: Callable[[dict], None]) -> None:
+        """Serve the connection until either side goes away; `handle` gets each client message."""
+        self._send(json.dumps({"heartbeat": self.heartbeat}))
+        tasks = [asyncio.ensure_future(c) for c in (
+            self._receive(handle), self._write(), self._beat(), self._overflow.wait()
+        )]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks + list(self.streams.values()):
+                task.cancel()
+            if self.socket.application_state == WebSocketState.CONNECTED:
+                try:
+                    if self._overflow.is_set():
+                        await self.socket.close(TOO_SLOW, "client too slow")
+                    else:
+                        await self.socket.close(1001)
+                except RuntimeError:
+                    pass   # the client closed first
+
+    async def _receive(self, handle: Callable[[dict], None]) -> None:
+        try:
+            while True:
+                frame = await self.socket.receive_text()
+                self._last_seen = time.monotonic()
+                if frame == PONG:
+                    continue
+                try:
+                    message = json.loads(frame)
+                except ValueError:
+                    continue
+                if isinstance(message, dict) and type(message.get("s")) is int:
+                    handle(message)
+        except (WebSocketDisconnect, RuntimeError):
+            return
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                await self.socket.send_text(await self._outbox.get())
+        except (WebSocketDisconnect, RuntimeError):
+            return
+
+    async def _beat(self) -> None:
+        while time.monotonic() - self._last_seen < 2 * self.heartbeat:
+            await asyncio.sleep(self.heartbeat)
+            self._send(PING)
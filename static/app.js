@@ -0,0 +1,354 @@
+const terminal = document.getElementById("terminal");
+const menuBtn = document.getElementById("menu-button");
+const modeMenu = document.getElementById("mode-menu");
+
+let PERSONAS = {};      // id -> {label, title, greeting, commands}, from /api/personas
+let COMMANDS = {};      // typed word (upper case) -> persona id
+let currentMode = "normal";
+let sessionId = null;  // server keeps the history; we only send new turns
+let activeTurn = null; // {cancelled, cancel} of the reply being streamed
+let inputBuffer = "";
+let inputSpan = null;
+let cursorSpan = null;
+
+function createPrompt() {
+  const line = document.createElement("div");
+  line.className = "line";
+  const p = document.createElement("span");
+  p.className = "prompt";
+  p.textContent = "> ";
+  inputSpan = document.createElement("span");
+  inputSpan.className = "user";
+  cursorSpan = document.createElement("span");
+  cursorSpan.className = "cursor";
+  cursorSpan.textContent = "_";
+  line.appendChild(p);
+  line.appendChild(inputSpan);
+  line.appendChild(cursorSpan);
+  terminal.appendChild(line);
+  terminal.scrollTop = terminal.scrollHeight;
+}
+
+function addLine(text, cls) {
+  const line = document.createElement("div");
+  line.className = "line " + (cls || "");
+  line.textContent = text;
+  terminal.appendChild(line);
+  terminal.scrollTop = terminal.scrollHeight;
+}
+
+// Menu and typed commands come from the persona registry (labels the model
+// writes itself are already stripped by the server's reply filter)
+async function loadPersonas() {
+  const res = await fetch("/api/personas");
+  const list = (await res.json()).personas;
+  PERSONAS = {};
+  COMMANDS = {};
+  modeMenu.innerHTML = "";
+  for (const p of list) {
+    PERSONAS[p.id] = p;
+    for (const c of p.commands) COMMANDS[c.toUpperCase()] = p.id;
+    const item = document.createElement("div");
+    item.className = "menu-item";
+    item.dataset.mode = p.id;
+    item.textContent = p.title || p.label;
+    modeMenu.appendChild(item);
+  }
+}
+
+// Read an NDJSON response body line by line, calling onEvent per object
+async function readNdjson(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let nl;
+    while ((nl = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if (line) onEvent(JSON.parse(line));
+    }
+  }
+  if (buf.trim()) onEvent(JSON.parse(buf));
+}
+
+async function createSession() {
+  const res = await fetch("/api/session", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ persona_id: currentMode }),
+  });
+  const data = await res.json();
+  return data.session_id;
+}
+
+function dropSession() {
+  if (sessionId) fetch("/api/session/" + sessionId, { method: "DELETE" }).catch(() => {});
+  sessionId = null;
+}
+
+// POST only the new message; re-create the session once if the server evicted it
+async function postTurn(text, signal) {
+  if (!sessionId) sessionId = await createSession();
+  const opts = {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ message: text }),
+    signal: signal,
+  };
+  let res = await fetch("/api/session/" + sessionId + "/chat/stream", opts);
+  if (res.status === 404) {
+    sessionId = await createSession();
+    res = await fetch("/api/session/" + sessionId + "/chat/stream", opts);
+  }
+  return res;
+}
+
+// One WebSocket per tab carries every turn, tagged with a stream number
+// (protocol in socket_mux.py). If it can't connect, turns go over HTTP.
+let socket = null;       // open WebSocket, or null
+let socketFailed = false;
+let nextStream = 1;
+const streams = {};      // stream number -> {mode, onEvent, resolve, reject}
+
+function connectSocket() {
+  if (socketFailed || !window.WebSocket) return Promise.resolve(null);
+  return new Promise((resolve) => {
+    const proto = location.protocol === "https:" ? "wss://" : "ws://";
+    const ws = new WebSocket(proto + location.host + "/ws");
+    let opened = false;
+    let lastSeen = Date.now();
+    let watchdog = null;
+    ws.onopen = () => {
+      opened = true;
+      socket = ws;
+      resolve(ws);
+    };
+    ws.onmessage = (e) => {
+      lastSeen = Date.now();
+      onFrame(ws, e.data, (seconds) => {
+        // two heartbeats without a frame: the connection is dead
+        clearInterval(watchdog);
+        watchdog = setInterval(() => {
+          if (Date.now() - lastSeen > 2000 * seconds) ws.close();
+        }, 1000 * seconds);
+      });
+    };
+    ws.onclose = () => {
+      clearInterval(watchdog);
+      if (socket === ws) socket = null;
+      if (!opened) socketFailed = true;
+      for (const s of Object.keys(streams)) {
+        streams[s].reject(new Error("socket closed"));
+        delete streams[s];
+      }
+      resolve(null);
+    };
+  });
+}
+
+function onFrame(ws, data, onHeartbeat) {
+  if (data === "ping") {
+    ws.send("pong");
+    return;
+  }
+  if (data[0] !== "{") {
+    // "<stream>:<token>"
+    const colon = data.indexOf(":");
+    const st = streams[data.slice(0, colon)];
+    if (st) st.onEvent({ token: data.slice(colon + 1) });
+    return;
+  }
+  const ev = JSON.parse(data);
+  if (ev.heartbeat) {
+    onHeartbeat(ev.heartbeat);
+    return;
+  }
+  const st = streams[ev.s];
+  if (!st) return;
+  if (ev.session) {
+    if (st.mode === currentMode) sessionId = ev.session;
+    return;
+  }
+  st.onEvent(ev);
+  if (ev.done || ev.error) {
+    delete streams[ev.s];
+    st.resolve();
+  }
+}
+
+// Send one turn over the socket when there is one, over HTTP otherwise;
+// onEvent gets the same events either way (see _reply_events in web_server.py).
+// turn.cancel() stops it, and the server stops the model generating it.
+async function streamTurn(text, onEvent, turn) {
+  const ws = socket || (await connectSocket());
+  if (ws) {
+    const s = nextStream++;
+    return new Promise((resolve, reject) => {
+      streams[s] = { mode: currentMode, onEvent, resolve, reject };
+      ws.send(JSON.stringify({
+        op: "turn", s: s, session: sessionId, persona_id: currentMode, message: text,
+      }));
+      turn.cancel = () => {
+        if (!streams[s]) return;
+        delete streams[s];
+        if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ op: "cancel", s: s }));
+        resolve();
+      };
+    });
+  }
+
+  const controller = new AbortController();
+  turn.cancel = () => controller.abort();
+  const res = await postTurn(text, controller.signal);
+  if (res.status === 429) {
+    onEvent(await res.json());
+    return;
+  }
+  await readNdjson(res, onEvent);
+}
+
+function cancelTurn() {
+  if (!activeTurn) return;
+  activeTurn.cancelled = true;
+  activeTurn.cancel();
+  activeTurn = null;
+}
+
+function setMode(mode) {
+  cancelTurn();
+  terminal.innerHTML = "";
+  inputBuffer = "";
+  currentMode = mode;
+  dropSession();
+
+  const persona = PERSONAS[mode];
+  if (persona && persona.greeting) addLine(persona.greeting, "ai");
+
+  createPrompt();
+}
+
+menuBtn.addEventListener("click", () => {
+  modeMenu.style.display = modeMenu.style.display === "block" ? "none" : "block";
+});
+
+document.addEventListener("click", (e) => {
+  if (!modeMenu.contains(e.target) && e.target !== menuBtn) {
+    modeMenu.style.display = "none";
+  }
+});
+
+modeMenu.addEventListener("click", (e) => {
+  if (!e.target.classList.contains("menu-item")) return;
+  const mode = e.target.dataset.mode;
+  modeMenu.style.display = "none";
+  setMode(mode);
+});
+
+async function send(text) {
+  // Remove input cursor while AI is responding
+  if (cursorSpan) cursorSpan.remove();
+  if (inputSpan) inputSpan.textContent = text;
+
+  const upper = text.toUpperCase();
+
+  if (upper === "CLEAR") {
+    terminal.innerHTML = "";
+    inputBuffer = "";
+    createPrompt();
+    return;
+  }
+  if (COMMANDS[upper]) {
+    setMode(COMMANDS[upper]);
+    return;
+  }
+
+  // Create AI line container (filled as tokens stream in)
+  const aiLine = document.createElement("div");
+  aiLine.className = "line ai";
+  terminal.appendChild(aiLine);
+  terminal.scrollTop = terminal.scrollHeight;
+
+  const label = (PERSONAS[currentMode] ? PERSONAS[currentMode].label : "AI") + ": ";
+
+  // Build live line: [LABEL STATIC][STREAMED TEXT][BLINKING CURSOR]
+  const labelSpan = document.createElement("span");
+  labelSpan.textContent = label;
+  labelSpan.style.userSelect = "none";
+  const textSpan = document.createElement("span");
+  const aiCursorSpan = document.createElement("span");
+  aiCursorSpan.className = "cursor";
+  aiCursorSpan.textContent = "_";
+
+  aiLine.appendChild(labelSpan);
+  aiLine.appendChild(textSpan);
+  aiLine.appendChild(aiCursorSpan);
+  terminal.scrollTop = terminal.scrollHeight;
+
+  let reply = "";
+  const turn = { cancelled: false, cancel: () => {} };
+  activeTurn = turn;
+  try {
+    // Render tokens as they arrive; label stays static
+    await streamTurn(text, (ev) => {
+      if (ev.queued) {
+        textSpan.textContent = "[queued: #" + ev.queued + " in line]";
+      } else if (ev.token) {
+        reply += ev.token;
+        textSpan.textContent = reply;
+      } else if (ev.retry_after) {
+        reply = "[server busy, try again in " + ev.retry_after + "s]";
+      } else if (ev.error) {
+        reply = ev.error;
+        textSpan.textContent = reply;
+      }
+      terminal.scrollTop = terminal.scrollHeight;
+    }, turn);
+
+    reply = reply || "...";
+    textSpan.textContent = reply;
+  } catch (e) {
+    if (!turn.cancelled) aiLine.textContent = "[connection lost]";
+  }
+  if (activeTurn === turn) activeTurn = null;
+  if (turn.cancelled) return;   // persona switched: that screen is gone
+
+  aiCursorSpan.remove();
+  inputBuffer = "";
+  createPrompt();
+}
+
+document.addEventListener("keydown", (e) => {
+  if (!cursorSpan || !inputSpan) return;
+
+  if (e.key === "Backspace") {
+    e.preventDefault();
+    inputBuffer = inputBuffer.slice(0, -1);
+    inputSpan.textContent = inputBuffer;
+  } else if (e.key === "Enter") {
+    e.preventDefault();
+    const t = inputBuffer.trim();
+    if (t) {
+      send(t);
+    } else {
+      cursorSpan.remove();
+      inputBuffer = "";
+      createPrompt();
+    }
+  } else if (
+    e.key.length === 1 &&
+    !e.ctrlKey &&
+    !e.metaKey &&
+    !e.altKey
+  ) {
+    inputBuffer += e.key;
+    inputSpan.textContent = inputBuffer;
+  }
+  terminal.scrollTop = terminal.scrollHeight;
+});
+
+// start in normal mode silently
+loadPersonas().catch(() => {}).then(createPrompt);
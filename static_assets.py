@@ -0,0 +1,101 @@
+"""
+Static frontend for the web server, built once at startup.
+
+  - every file in static/ is read and compressed (gzip, plus brotli when the
+    optional `brotli` package is installed) up front, never per request
+  - ETags are content hashes, so a revalidation is a cheap 304
+  - app.css / app.js are served under content-hashed names
+    (/static/app.<hash>.js) with a year-long immutable Cache-Control;
+    index.html, which links to them, is tiny and always revalidated
+
+Asset also wraps generated JSON (see /api/personas) the same way.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional, Set
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"   # may be stored, but must be revalidated (ETag) before use
+
+
+def _accepted(header: str) -> Set[str]:
+    """Content codings in an Accept-Encoding header, minus any with q=0."""
+    out = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if name:
+            out.add(name.lower())
+    return out
+
+
+class Asset:
+    __slots__ = ("body", "gzip", "br", "etag", "content_type", "cache_control")
+
+    def __init__(self, body: bytes, content_type: str, cache_control: str = REVALIDATE):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:20] + '"'
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.gzip = gzip.compress(body, 9, mtime=0)
+        self.br = brotli.compress(body, quality=11) if brotli is not None else None
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if self.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        body = self.body
+        accepted = _accepted(request.headers.get("accept-encoding", ""))
+        if self.br is not None and "br" in accepted and len(self.br) < len(body):
+            body = self.br
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted and len(self.gzip) < len(body):
+            body = self.gzip
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, media_type=self.content_type, headers=headers)
+
+
+def _content_type(name: str) -> str:
+    ctype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if ctype.startswith("text/") or ctype in ("application/javascript", "application/json"):
+        ctype += "; charset=utf-8"
+    return ctype
+
+
+class StaticAssets:
+    def __init__(self, directory: str, prefix: str = "/static/"):
+        self.files: Dict[str, Asset] = {}   # hashed name -> asset
+        self.urls: Dict[str, str] = {}      # file name -> hashed URL
+
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name == "index.html" or not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                body = f.read()
+            stem, ext = os.path.splitext(name)
+            hashed = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+            self.files[hashed] = Asset(body, _content_type(name), IMMUTABLE)
+            self.urls[name] = prefix + hashed
+
+        with open(os.path.join(directory, "index.html"), encoding="utf-8") as f:
+            html = f.read()
+        for name, url in self.urls.items():
+            html = html.replace("{{" + name + "}}", url)
+        self.index = Asset(html.encode(), "text/html; charset=utf-8", REVALIDATE)
+
+    def get(self, hashed_name: str) -> Optional[Asset]:
+        return self.files.get(hashed_name)
@@ -1,11 +1,33 @@
+import argparse
+import json
+import os
 import sys
-import requests
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
-from pydantic import BaseModel
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, TextIO, Tuple
+
+import ollama_client
+import profiling
+from context_window import ContextWindow
+from conversation_log import ConversationLog
+from reply_filter import ReplyFilter
+from response_cache import ResponseCache, cache_key
 
 OLLAMA_URL = "http://localhost:11434/api/chat"
 MODEL = "llama3.2"
+HISTORY_TOKEN_BUDGET = 3072
+CACHE_DB = os.environ.get("TERMINAL_GPT_CACHE_DB")  # optional SQLite cache shared across runs
+SEMANTIC_CACHE = False  # paraphrase hits for one-shot prompts; needs numpy + nomic-embed-text
+EMBED_URL = "http://localhost:11434/api/embed"
+EMBED_MODEL = "nomic-embed-text"
+SEMANTIC_INDEX = os.environ.get("TERMINAL_GPT_SEMANTIC_INDEX")
+BATCH_CONCURRENCY = 4  # prompts in flight at once for --batch
+PROFILE_TRACE = os.environ.get("TERMINAL_GPT_PROFILE_TRACE", "terminal_gpt_profile.jsonl")  # --profile output
+SAVE_SESSIONS = True  # interactive conversations are saved for --resume
+SESSION_DIR = os.environ.get("TERMINAL_GPT_SESSION_DIR") or os.path.expanduser("~/.cache/terminal-gpt/sessions")
+SEARCH_DB = os.environ.get("TERMINAL_GPT_SEARCH_DB") or os.path.expanduser("~/.cache/terminal-gpt/search.sqlite3")  # None: no search
+SEARCH_LIMIT = 10
 
 NORMAL_SYSTEM = """You are a helpful terminal assistant. Answer concisely and accurately."""
 
@@ -31,50 +53,211 @@ TARS_PRIMING = [
     {"role": "assistant", "content": "TARS: I'm a robot. I don't have feelings. But if I did, I'd say I'm running at optimal capacity. Thanks for the concern though."},
 ]
 
+response_cache = ResponseCache(db_path=CACHE_DB)
+semantic_cache = None
+if SEMANTIC_CACHE:
+    from semantic_cache import SemanticCache  # pulls in numpy, so only when enabled
+    semantic_cache = SemanticCache(path=SEMANTIC_INDEX)
+use_cache = True  # --no-cache turns this off
+profiler: Optional[profiling.Profiler] = None  # --profile installs one
+_cache_lock = threading.Lock()  # --daemon answers several clients at once
+
 tars_mode = False
 
 
-def cold_filter(text: str, is_tars: bool) -> str:
-    if not text:
-        return "TARS: ..." if is_tars else "..."
-    
-    text = text.strip()
-    
-    if is_tars:
-        # Remove emojis and excessive punctuation
-        text = text.replace("😊", "").replace("!", ".")
-        
-        # Add TARS prefix if not present
-        if not text.upper().startswith("TARS:"):
-            text = "TARS: " + text
-    
-    return text if text else ("TARS: ..." if is_tars else "...")
+NORMAL_FILTER = ReplyFilter(())
+TARS_FILTER = ReplyFilter(("label", "emoji", "no_exclamations"), ("TARS",), prefix="TARS: ")  # see reply_filter.py
+
+
+def reply_filter(is_tars: bool) -> ReplyFilter:
+    return TARS_FILTER if is_tars else NORMAL_FILTER
+
+
+def _reply_from(data: Optional[dict], err: Optional[str], is_tars: bool) -> Tuple[Optional[str], Optional[str]]:
+    if err:
+        return None, err
+    content = data.get("message", {}).get("content")
+    if not content:
+        return None, "empty response"
+    return reply_filter(is_tars).apply(content), None
+
+
+def _cache_key(messages: list, is_tars: bool) -> Optional[str]:
+    if not use_cache:
+        return None
+    return cache_key(MODEL, "tars" if is_tars else "normal", messages)
+
+
+def _cache_put(key: Optional[str], reply: Optional[str], is_tars: bool) -> None:
+    if key and reply:
+        with _cache_lock:
+            response_cache.put(key, reply, "tars" if is_tars else "normal")
 
 
-from typing import Optional, Tuple
+def _cached(key: Optional[str], prof: Optional[profiling.CallProfile]) -> Optional[str]:
+    with _cache_lock:
+        cached = response_cache.get(key) if key else None
+    if prof is not None:
+        prof.mark("cache")
+        if cached:
+            prof.meta["cached"] = True
+    return cached
+
+
+def _reply_timed(data: Optional[dict], err: Optional[str], is_tars: bool,
+                 prof: Optional[profiling.CallProfile]) -> Tuple[Optional[str], Optional[str]]:
+    if prof is None:
+        return _reply_from(data, err, is_tars)
+    prof.skip()   # HTTP and decode were timed by ollama_client
+    prof.final = data
+    reply, err = _reply_from(data, err, is_tars)
+    prof.mark("filter")
+    return reply, err
+
 
 def call_ollama(messages: list, is_tars: bool = False) -> Tuple[Optional[str], Optional[str]]:
-    try:
-        resp = requests.post(
-            OLLAMA_URL,
-            json={"model": MODEL, "messages": messages, "stream": False},
-            timeout=120,
+    prof = profiler.start("chat", tars=is_tars) if profiler is not None else None
+    key = _cache_key(messages, is_tars)
+    cached = _cached(key, prof)
+    if cached:
+        reply, err = cached, None
+    else:
+        data, err = ollama_client.chat(
+            OLLAMA_URL, {"model": MODEL, "messages": messages, "stream": False},
+            prof.phases if prof is not None else None,
         )
-        resp.raise_for_status()
-        data = resp.json()
-        content = data.get("message", {}).get("content")
-        if not content:
-            return None, "empty response"
-        return cold_filter(content, is_tars), None
-    except requests.exceptions.RequestException as e:
-        return None, str(e)
-    except ValueError as e:
-        return None, str(e)
-
-
-def interactive_mode():
+        reply, err = _reply_timed(data, err, is_tars, prof)
+        _cache_put(key, reply, is_tars)
+    if prof is not None:
+        profiler.record(prof, err)
+    return reply, err
+
+
+async def acall_ollama(messages: list, is_tars: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    prof = profiler.start("chat", tars=is_tars) if profiler is not None else None
+    key = _cache_key(messages, is_tars)
+    cached = _cached(key, prof)
+    if cached:
+        reply, err = cached, None
+    else:
+        data, err = await ollama_client.achat(
+            OLLAMA_URL, {"model": MODEL, "messages": messages, "stream": False},
+            prof.phases if prof is not None else None,
+        )
+        reply, err = _reply_timed(data, err, is_tars, prof)
+        _cache_put(key, reply, is_tars)
+    if prof is not None:
+        profiler.record(prof, err)
+    return reply, err
+
+
+def format_stats(ttft: Optional[float], total: float, final: dict) -> str:
+    """Footer line: time to first token, total latency and Ollama's tokens/sec."""
+    parts = [f"ttft {ttft:.2f}s" if ttft is not None else "ttft -", f"total {total:.2f}s"]
+    eval_count = final.get("eval_count")
+    eval_duration = final.get("eval_duration")
+    if eval_count and eval_duration:
+        parts.append(f"{eval_count / (eval_duration / 1e9):.1f} tok/s")
+    return "[" + " | ".join(parts) + "]"
+
+
+def stream_ollama(messages: list, is_tars: bool = False, show_stats: bool = False,
+                  stdout: Optional[TextIO] = None, stderr: Optional[TextIO] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Print the reply to stdout token by token (flushed, so it also works when
+    piped) and return (full reply, error) once Ollama is done.
+    """
+    stdout, stderr = stdout or sys.stdout, stderr or sys.stderr
+    if profiler is None:
+        return _stream_ollama(messages, is_tars, show_stats, None, stdout, stderr)
+    prof = profiler.start("stream", tars=is_tars)
+    reply, err = _stream_ollama(messages, is_tars, show_stats, prof, stdout, stderr)
+    profiler.record(prof, err)
+    return reply, err
+
+
+def _stream_ollama(messages: list, is_tars: bool, show_stats: bool, prof: Optional[profiling.CallProfile],
+                   stdout: TextIO, stderr: TextIO) -> Tuple[Optional[str], Optional[str]]:
+    start = time.perf_counter()
+    key = _cache_key(messages, is_tars)
+    cached = _cached(key, prof)
+    if cached:
+        print(cached, file=stdout, flush=True)
+        if prof is not None:
+            prof.mark("output")
+        if show_stats:
+            print(f"[cached | total {time.perf_counter() - start:.3f}s]", file=stderr)
+        return cached, None
+
+    filt = reply_filter(is_tars).stream()
+    parts = []
+    final = {}
+    ttft = None
+
+    timings = prof.phases if prof is not None else None
+    chunks = ollama_client.stream(OLLAMA_URL, {"model": MODEL, "messages": messages}, timings)
+    try:
+        for chunk in chunks:
+            if prof is not None:
+                prof.skip()   # HTTP and decode were timed by ollama_client
+            if "error" in chunk:
+                if parts:
+                    print(file=stdout)
+                return None, chunk["error"]
+
+            content = chunk.get("message", {}).get("content", "")
+            if content and ttft is None:
+                ttft = time.perf_counter() - start
+                if prof is not None:
+                    prof.meta["ttft_s"] = round(ttft, 6)
+
+            text = filt.feed(content)
+            if prof is not None:
+                prof.mark("filter")
+            if text:
+                parts.append(text)
+                stdout.write(text)
+                stdout.flush()
+                if prof is not None:
+                    prof.mark("output")
+
+            if chunk.get("done"):
+                final = chunk
+                break
+    finally:
+        chunks.close()   # also on Ctrl+C: dropping the connection stops the generation
+
+    tail = filt.flush()
+    if prof is not None:
+        prof.final = final
+        prof.mark("filter")
+    if ttft is None:   # no content at all
+        return None, "empty response"
+    parts.append(tail)
+    stdout.write(tail + "\n")
+    stdout.flush()
+    if prof is not None:
+        prof.mark("output")
+
+    if show_stats:
+        print(format_stats(ttft, time.perf_counter() - start, final), file=stderr)
+
+    reply = "".join(parts)
+    _cache_put(key, reply, is_tars)
+    return reply, None
+
+
+def interactive_mode(show_stats: bool = False, resume: Optional[str] = None):
     global tars_mode
-    messages = NORMAL_PRIMING.copy()
+    log = None
+    index = open_search_index() if SAVE_SESSIONS else None
+    window = ContextWindow(NORMAL_PRIMING, HISTORY_TOKEN_BUDGET)
+    if resume:
+        log = ConversationLog.open(SESSION_DIR, resume, index)
+        tars_mode = log.tars
+        window = ContextWindow(TARS_PRIMING if tars_mode else NORMAL_PRIMING, HISTORY_TOKEN_BUDGET)
+        window.resume(*log.tail(HISTORY_TOKEN_BUDGET))
+        print(f"[resumed {log.id}: {len(log)} messages, last {len(window)} in context]")
     
     while True:
         try:
@@ -93,45 +276,153 @@ def interactive_mode():
         
         if user_input.strip().upper() == "TARS":
             tars_mode = not tars_mode
+            if log is not None:  # new mode, new conversation
+                log.close()
+                log = None
             if tars_mode:
-                messages = TARS_PRIMING.copy()
+                window = ContextWindow(TARS_PRIMING, HISTORY_TOKEN_BUDGET)
                 print("TARS: Finally. Someone with taste. What do you need?")
             else:
-                messages = NORMAL_PRIMING.copy()
+                window = ContextWindow(NORMAL_PRIMING, HISTORY_TOKEN_BUDGET)
                 print("Switched to normal mode.")
             continue
         
         if not user_input.strip():
             continue
         
-        messages.append({"role": "user", "content": user_input})
-        reply, err = call_ollama(messages, tars_mode)
+        user_msg = {"role": "user", "content": user_input}
+        try:
+            reply, err = stream_ollama(window.messages(user_msg), tars_mode, show_stats)
+        except KeyboardInterrupt:   # Ctrl+C cancels this reply, not the program
+            print("\n[cancelled]")
+            continue
         
         if err:
             print(f"[error: {err}]")
             continue
         
-        print(reply)
-        messages.append({"role": "assistant", "content": reply})
+        assistant_msg = {"role": "assistant", "content": reply}
+        window.append(user_msg)
+        window.append(assistant_msg)
+        if SAVE_SESSIONS:
+            if log is None:
+                log = ConversationLog.create(SESSION_DIR, tars_mode, MODEL, index)
+            log.append(user_msg)
+            log.append(assistant_msg)
+    
+    if log is not None:
+        log.close()
+        print(f"[saved as {log.id}; continue with --resume {log.id}]")
+    if index is not None:
+        index.close()
 
 
-def oneshot_mode(prompt: str):
+def oneshot_mode(prompt: str, show_stats: bool = False,
+                 stdout: Optional[TextIO] = None, stderr: Optional[TextIO] = None):
+    stdout, stderr = stdout or sys.stdout, stderr or sys.stderr
     messages = NORMAL_PRIMING.copy()
     messages.append({"role": "user", "content": prompt})
-    reply, err = call_ollama(messages, False)
-    print(reply if reply else f"[error: {err}]")
 
+    vector = None
+    if use_cache and semantic_cache is not None and semantic_cache.available:
+        vector, _ = ollama_client.embed(EMBED_URL, EMBED_MODEL, prompt)
+        with _cache_lock:
+            cached, score = semantic_cache.lookup(vector, "normal") if vector else (None, 0.0)
+        if cached:
+            print(cached, file=stdout, flush=True)
+            if show_stats:
+                print(f"[semantic cache | similarity {score:.3f}]", file=stderr)
+            return
+
+    reply, err = stream_ollama(messages, False, show_stats, stdout, stderr)
+    if err:
+        print(f"[error: {err}]", file=stdout, flush=True)
+    elif vector:
+        with _cache_lock:
+            semantic_cache.add(vector, "normal", prompt, reply)
+            semantic_cache.flush()
+
+
+def open_search_index():
+    if not SEARCH_DB:
+        return None
+    import sqlite3
+    from search_index import SearchIndex
+    try:
+        return SearchIndex(SEARCH_DB)
+    except sqlite3.Error as e:
+        print(f"[search index unavailable: {e}]", file=sys.stderr)
+        return None
+
+
+def search_mode(query: str, show_stats: bool = False, limit: int = SEARCH_LIMIT) -> bool:
+    index = open_search_index()
+    if index is None:
+        return False
+    start = time.perf_counter()
+    index.sync(SESSION_DIR)
+    synced = time.perf_counter()
+    mark = ("\033[1m", "\033[0m") if sys.stdout.isatty() else ("[", "]")
+    results = index.search(query, limit, mark)
+    done = time.perf_counter()
+    index.close()
+    
+    for r in results:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["ts"]))
+        print(f"{r['session']} #{r['seq']}  {r['role']}, {when} ({r['source']})")
+        print(f"    {' '.join(r['snippet'].split())}\n")
+    if not results:
+        print("no matches")
+    if show_stats:
+        print(f"[{len(results)} results | query {1000 * (done - synced):.1f} ms"
+              f" | sync {1000 * (synced - start):.1f} ms]", file=sys.stderr)
+    return True
+
+
+def daemon_job(job: dict, stdout: TextIO, stderr: TextIO) -> int:
+    """One prompt sent by gpt.py to `--daemon` (see cli_daemon.py), printed to its terminal."""
+    if not job.get("prompt"):
+        stderr.write("[error: missing prompt]\n")
+        return 2
+    oneshot_mode(job["prompt"], bool(job.get("stats")), stdout, stderr)
+    return 0
 
-# FastAPI app
-app = FastAPI()
 
-class ChatRequest(BaseModel):
-    messages: list
-    tars_mode: bool = False
+def batch_mode(in_path: str, out_path: str, concurrency: int = BATCH_CONCURRENCY):
+    """
+    Run every prompt in a JSONL file (see batch.py for the format) over the
+    shared connection pool, `concurrency` at a time, appending results to
+    out_path as they finish. Ids already answered in out_path are skipped.
+    """
+    import asyncio
+    import batch   # the only CLI mode that needs an event loop
+
+    done = batch.finished_ids(out_path)
+    stats = batch.BatchStats(skipped=len(done))
+
+    async def call(job: dict):
+        is_tars = bool(job.get("tars", tars_mode))
+        messages = job.get("messages") or (TARS_PRIMING if is_tars else NORMAL_PRIMING) + [
+            {"role": "user", "content": job["prompt"]}
+        ]
+        return await acall_ollama(messages, is_tars)
+
+    async def run():
+        with open(in_path, encoding="utf-8") as src, open(out_path, "a", encoding="utf-8") as out:
+            async for result in batch.run_batch(batch.iter_jobs(src, done), call, concurrency, stats):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+        await ollama_client.aclose()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\ninterrupted; run again with the same --out to resume", file=sys.stderr)
+    print(stats.summary(), file=sys.stderr)
 
-@app.get("/", response_class=HTMLResponse)
-async def index():
-    return HTMLResponse(f"""
+
+# FastAPI app, built only when serving
+INDEX_HTML = f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -296,18 +587,114 @@ Rules:
   </script>
 </body>
 </html>
-""")
+"""
 
-@app.post("/api/chat")
-async def chat(req: ChatRequest):
-    reply, err = call_ollama(req.messages, req.tars_mode)
-    if err:
-        return JSONResponse({"error": err}, status_code=500)
-    return {"reply": reply}
+
+def create_app():
+    """
+    The web UI and /api/chat. FastAPI and pydantic are imported here rather
+    than at the top so CLI runs don't pay for them; `uvicorn terminal_gpt:app` and
+    --serve call this.
+    """
+    from fastapi import FastAPI
+    from fastapi.responses import HTMLResponse, JSONResponse
+    from pydantic import BaseModel
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        await ollama_client.aclose()
+
+    app = FastAPI(lifespan=lifespan)
+
+    class ChatRequest(BaseModel):
+        messages: list
+        tars_mode: bool = False
+
+    @app.get("/", response_class=HTMLResponse)
+    async def index():
+        return HTMLResponse(INDEX_HTML)
+
+    @app.post("/api/chat")
+    async def chat(req: ChatRequest):
+        reply, err = await acall_ollama(req.messages, req.tars_mode)
+        if err:
+            return JSONResponse({"error": err}, status_code=500)
+        return {"reply": reply}
+
+    return app
+
+
+def serve(host: str, port: int) -> None:
+    import uvicorn
+    uvicorn.run(create_app(), host=host, port=port)
+
+
+def __getattr__(name: str):
+    # `uvicorn terminal_gpt:app` keeps working: the app is built on first access
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def prompt_words(argv: list, words: list, extra: list) -> list:
+    """The prompt in command-line order, unknown dash words ("--force") included."""
+    words, extra = list(words), list(extra)
+    out = []
+    for arg in argv:
+        if words and arg == words[0]:
+            out.append(words.pop(0))
+        elif extra and arg == extra[0]:
+            out.append(extra.pop(0))
+    return out
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        oneshot_mode(" ".join(sys.argv[1:]))
+    parser = argparse.ArgumentParser(description="Terminal GPT (Ollama)", allow_abbrev=False)
+    parser.add_argument("prompt", nargs="*", help="one-shot prompt; omit for interactive mode")
+    parser.add_argument("--search", action="store_true", help="search saved chats for the prompt words instead")
+    parser.add_argument("--stats", action="store_true", help="print latency and tokens/sec")
+    parser.add_argument("--no-cache", action="store_true", help="always ask the model")
+    parser.add_argument("--resume", metavar="ID", help='continue a saved conversation ("last" for the latest)')
+    parser.add_argument("--profile", action="store_true",
+                        help=f"time each call by phase; appends to {PROFILE_TRACE} and prints a summary")
+    parser.add_argument("--batch", metavar="IN.jsonl", help="run every prompt in a JSONL file")
+    parser.add_argument("--out", metavar="OUT.jsonl", help="where --batch appends results")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help=f"prompts in flight at once for --batch (default {BATCH_CONCURRENCY})")
+    parser.add_argument("--serve", action="store_true", help="run the web UI instead")
+    parser.add_argument("--daemon", action="store_true",
+                        help="stay resident and answer gpt.py one-shot prompts over a Unix socket")
+    parser.add_argument("--host", default="127.0.0.1", help="--serve address (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="--serve port (default 8000)")
+    args, extra = parser.parse_known_args()
+    prompt = " ".join(prompt_words(sys.argv[1:], args.prompt, extra))
+    use_cache = not args.no_cache
+    if args.profile:
+        profiler = profiling.Profiler(PROFILE_TRACE)
+
+    if args.serve:
+        serve(args.host, args.port)
+    elif args.daemon:
+        import cli_daemon
+        cli_daemon.serve(daemon_job)
+    elif args.batch:
+        if not args.out:
+            parser.error("--batch needs --out")
+        batch_mode(args.batch, args.out, args.concurrency)
+    elif args.search:
+        if not prompt:
+            parser.error("--search needs a query")
+        if not search_mode(prompt, args.stats):
+            parser.error("--search: no search index (SEARCH_DB)")
+    elif prompt:
+        oneshot_mode(prompt, args.stats)
     else:
-        interactive_mode()
\ No newline at end of file
+        try:
+            interactive_mode(args.stats, args.resume)
+        except FileNotFoundError as e:
+            parser.error(f"--resume: {e}")
+
+    if profiler is not None:
+        print(profiler.summary(), file=sys.stderr)
\ No newline at end of file
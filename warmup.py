@@ -0,0 +1,108 @@
+"""
+Persona prefix warm-up for the web server.
+
+Every persona's priming is a fixed prefix of every prompt we send for it.
+Ollama's /api/chat has no client-side `context` handle (that only exists on
+the legacy /api/generate); instead the runner keeps the KV cache of the last
+prompt and reuses the longest matching prefix, as long as the model stays
+loaded (`keep_alive`). So we:
+
+  - send each persona's priming once at startup (cold) and once more (warm),
+    which loads the model and measures what the prefix costs with and
+    without reuse,
+  - pass keep_alive on every request so the model is not unloaded between
+    turns,
+  - record prompt_eval_duration for every later turn, per backend and persona.
+
+estimated_saved_ms is not measured: it assumes every turn found its persona's
+prefix still cached and so saved (cold - warm). A runner that keeps one
+prompt's KV cache (OLLAMA_NUM_PARALLEL=1) only holds the prefix of the
+persona warmed or used last, so take it as an upper bound; compare
+first_turn_prompt_eval_ms, measured, with cold_prefix_ms to see what the
+first real turn actually paid.
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+import ollama_client
+from persona import Persona
+
+
+class PrefixStats:
+    __slots__ = ("prefix_tokens", "cold_ns", "warm_ns", "turns", "turn_prompt_eval_ns", "first_turn_ns")
+
+    def __init__(self):
+        self.prefix_tokens = 0
+        self.cold_ns = 0             # prompt_eval_duration of the priming, nothing cached
+        self.warm_ns = 0             # same prompt again, prefix reused
+        self.turns = 0
+        self.turn_prompt_eval_ns = 0
+        self.first_turn_ns = None    # prompt_eval_duration of the first real turn
+
+    def report(self) -> dict:
+        saved_per_turn = max(self.cold_ns - self.warm_ns, 0)
+        return {
+            "prefix_tokens": self.prefix_tokens,
+            "cold_prefix_ms": self.cold_ns / 1e6,
+            "warm_prefix_ms": self.warm_ns / 1e6,
+            "turns": self.turns,
+            "avg_turn_prompt_eval_ms": (
+                self.turn_prompt_eval_ns / self.turns / 1e6 if self.turns else None
+            ),
+            "first_turn_prompt_eval_ms": (
+                self.first_turn_ns / 1e6 if self.first_turn_ns is not None else None
+            ),
+            "estimated_saved_ms": saved_per_turn * self.turns / 1e6,
+        }
+
+
+class PrefixWarmer:
+    def __init__(self, keep_alive: str):
+        self.keep_alive = keep_alive
+        self.stats: Dict[Tuple[str, str], PrefixStats] = {}   # (backend url, persona id)
+
+    def _payload(self, model: str, persona: Persona) -> dict:
+        return {
+            "model": model,
+            "messages": persona.priming,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"num_predict": 1},  # we only want the prompt evaluated
+        }
+
+    async def warm(self, backend: str, model: str, persona: Persona) -> Optional[str]:
+        """Evaluate one persona's priming twice on a backend; returns an error string on failure."""
+        stats = self.stats.setdefault((backend, persona.id), PrefixStats())
+        url = backend + "/api/chat"
+        cold, err = await ollama_client.achat(url, self._payload(model, persona))
+        if err:
+            return err
+        warm, err = await ollama_client.achat(url, self._payload(model, persona))
+        if err:
+            return err
+        stats.prefix_tokens = cold.get("prompt_eval_count") or 0
+        stats.cold_ns = cold.get("prompt_eval_duration") or 0
+        stats.warm_ns = warm.get("prompt_eval_duration") or 0
+        return None
+
+    async def warm_all(self, backend: str, model: str, personas: Iterable[Persona]) -> Dict[str, Optional[str]]:
+        # One at a time: concurrent prompts would evict each other's prefix.
+        results = {}
+        for persona in personas:
+            results[persona.id] = await self.warm(backend, model, persona)
+        return results
+
+    def record(self, persona_id: str, data: dict) -> None:
+        """Account one finished turn (the final, stats-carrying response from BackendPool)."""
+        stats = self.stats.setdefault((data.get("backend", ""), persona_id), PrefixStats())
+        stats.turns += 1
+        stats.turn_prompt_eval_ns += data.get("prompt_eval_duration") or 0
+        if stats.first_turn_ns is None:
+            stats.first_turn_ns = data.get("prompt_eval_duration")
+
+    def report(self) -> dict:
+        """{backend url: {persona id: stats}}"""
+        report: Dict[str, dict] = {}
+        for (backend, pid), stats in self.stats.items():
+            report.setdefault(backend, {})[pid] = stats.report()
+        return report
+
@@ -1,459 +1,954 @@
+import asyncio
 import json
-from typing import Optional, Tuple
-
-import requests
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
-from pydantic import BaseModel
-
-from persona import PERSONAS, DEFAULT_PERSONA_ID, Persona
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.background import BackgroundTask
+
+import batch
+import ollama_client
+from backend_pool import BackendPool
+from admission import AdmissionController, QueueFull, Ticket
+from persona import DEFAULT_PERSONA_ID, Persona, PersonaRegistry, PersonaSource
+from context_window import fit_messages
+from metrics import Counter, Gauge, Histogram, Registry, TOKENS_PER_S_BUCKETS
+from response_cache import ResponseCache, cache_key
+from search_index import SearchIndex
+from semantic_cache import SemanticCache
+from singleflight import SingleFlight
+from sessions import Session, SessionStore
+from socket_mux import SocketMux
+from static_assets import Asset, StaticAssets
+from warmup import PrefixWarmer
 
 
 # ============================================
 #  Ollama configuration
 # ============================================
 
-OLLAMA_URL = "http://localhost:11434/api/chat"
+# One or more Ollama servers (comma-separated in OLLAMA_HOSTS); requests go to
+# the healthy one with the fewest requests in flight.
+OLLAMA_HOSTS = os.environ.get("OLLAMA_HOSTS", "http://localhost:11434").split(",")
+PROBE_INTERVAL = 5.0  # seconds between health checks of every backend
+EJECT_AFTER = 2       # consecutive failures before a backend stops getting traffic
+STICKY_BACKENDS = True  # keep each conversation on one backend so its prefix stays in KV cache
 MODEL = "llama3.2"  # make sure you've pulled this model: ollama pull llama3.2
+KEEP_ALIVE = "30m"        # keep the model (and its cached prompt prefix) loaded
+WARMUP_ON_STARTUP = True  # evaluate every persona's priming once at startup
+HISTORY_TOKEN_BUDGET = 3072  # priming + history; leaves room in a 4k context for the reply
+PERSONA_RELOAD_INTERVAL = 2.0  # seconds between checks of personas/ for edited files
+
+
+# ============================================
+#  Admission control
+# ============================================
+
+MAX_CONCURRENT_GENERATIONS = 4   # sent to Ollama at once; the rest wait in line
+MAX_QUEUED = 64                  # waiting requests before we answer 429
+QUEUE_UPDATE_INTERVAL = 1.0      # seconds between queue-position events while streaming
+MAX_BATCH_ITEMS = 1000           # prompts per /api/chat/batch request
+MAX_BATCH_CONCURRENCY = 2        # slots one batch may hold at once, so chat users still get through
+# Longest a chat request may take, queueing included; a request's own "timeout"
+# can only shorten it. Past it, or once the client is gone, the Ollama request
+# is closed so the generation stops.
+REPLY_DEADLINE = 120.0
+
+
+# ============================================
+#  Session configuration
+# ============================================
+
+SESSION_TTL = 30 * 60              # seconds a conversation may sit idle
+MAX_SESSIONS = 1000                # most conversations kept at once
+SESSION_MEMORY_CAP = 64 * 2**20    # approx. bytes of history kept across sessions
+
+# Finished turns can be indexed for GET /api/search (see search_index.py). Off
+# by default: the endpoint has no authentication and the server listens on every
+# interface, so anyone who can reach it could read what was indexed. Enabled, it
+# uses a file of its own, never the CLI's (TERMINAL_GPT_SEARCH_DB).
+SEARCH_DB = os.environ.get("TERMINAL_GPT_WEB_SEARCH_DB") or None
+MAX_SEARCH_RESULTS = 50
+
+
+# ============================================
+#  Response cache configuration
+# ============================================
+
+CACHE_MAX_ENTRIES = 4096
+CACHE_TTL = 24 * 3600
+# Optional SQLite file shared with other workers and the CLI (same env var)
+CACHE_DB = os.environ.get("TERMINAL_GPT_CACHE_DB")
+
+# Semantic cache for one-shot prompts (paraphrase hits). Needs numpy and an
+# embedding model: ollama pull nomic-embed-text
+SEMANTIC_CACHE = False
+EMBED_MODEL = "nomic-embed-text"
+SEMANTIC_MAX_ENTRIES = 10000
+SEMANTIC_INDEX = os.environ.get("TERMINAL_GPT_SEMANTIC_INDEX")  # optional, persisted
+
+
+# ============================================
+#  Frontend
+# ============================================
+
+# HTML/CSS/JS, read and compressed once at startup (see static_assets.py)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# The page talks to /ws when it can (see socket_mux.py), HTTP otherwise
+SOCKET_HEARTBEAT = 20.0   # seconds between pings; two without an answer close the socket
+MAX_SOCKET_STREAMS = 8    # turns one connection may have running at once
+MAX_SOCKET_OUTBOX = 4096  # frames queued for a client before it is dropped as too slow
 
 
 # ============================================
 #  Style filter
 # ============================================
 
-def cold_filter(text: str, persona: Persona) -> str:
+def labeled(reply: str, persona: Persona) -> str:
     """
-    Light post-processing; for snarky personas we strip emojis/!!!.
-    The actual labels ("TARS:", "ULTRON:", "AI:", "C-3PO:", "GENERAL GRIEVOUS:",
-    "J.A.R.V.I.S.", "OPTIMUS PRIME:") are added in the frontend.
+    Reply as stored in history: the persona's own label plus the text. Replies
+    come out of persona.reply_filter (see reply_filter.py), already without a
+    label of their own; the frontend shows the label separately.
     """
-    if not text:
-        return "..."
+    return f"{persona.label}: {reply}"
+
+
+personas = PersonaSource()
+backends = BackendPool(OLLAMA_HOSTS, PROBE_INTERVAL, EJECT_AFTER)
+prefix_warmer = PrefixWarmer(KEEP_ALIVE)
+
+
+def _payload(messages: list, stream: bool) -> dict:
+    return {"model": MODEL, "messages": messages, "stream": stream, "keep_alive": KEEP_ALIVE}
+
 
-    text = text.strip()
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_TTL, CACHE_DB)
+semantic_cache = SemanticCache(
+    SEMANTIC_MAX_ENTRIES,
+    SEMANTIC_INDEX if SEMANTIC_CACHE else None,
+    {p.id: p.semantic_threshold for p in personas.current},
+)
 
-    if persona.snarky:
-        text = (
-            text.replace("😊", "")
-                .replace("😄", "")
-                .replace("😂", "")
-                .replace("🤣", "")
-                .replace("!!!", ".")
-        )
 
-    return text or "..."
+# Identical concurrent requests share one upstream generation
+flights = SingleFlight()
 
+admission = AdmissionController(MAX_CONCURRENT_GENERATIONS, MAX_QUEUED)
 
-def call_ollama(messages: list, persona_id: str) -> Tuple[Optional[str], Optional[str]]:
-    """Call local Ollama and return (reply, error)."""
-    persona = PERSONAS.get(persona_id, PERSONAS[DEFAULT_PERSONA_ID])
 
+# ============================================
+#  Metrics (GET /metrics)
+# ============================================
+
+metrics = Registry()
+requests_total = metrics.add(Counter(
+    "terminal_gpt_requests_total",
+    "Chat requests by persona and outcome (ok, error, busy, cancelled, timeout).",
+    ("persona", "status"),
+))
+request_seconds = metrics.add(Histogram(
+    "terminal_gpt_request_duration_seconds", "End-to-end chat latency, queueing included."
+))
+ttft_seconds = metrics.add(Histogram(
+    "terminal_gpt_time_to_first_token_seconds", "Streamed replies: request start to first token."
+))
+load_seconds = metrics.add(Histogram(
+    "terminal_gpt_ollama_load_duration_seconds", "Ollama load_duration per generation."
+))
+prompt_eval_seconds = metrics.add(Histogram(
+    "terminal_gpt_ollama_prompt_eval_duration_seconds", "Ollama prompt_eval_duration per generation."
+))
+eval_seconds = metrics.add(Histogram(
+    "terminal_gpt_ollama_eval_duration_seconds", "Ollama eval_duration per generation."
+))
+generation_seconds = metrics.add(Histogram(
+    "terminal_gpt_upstream_generation_seconds", "Wall time of Ollama generations that ran to the end."
+))
+generations_aborted = metrics.add(Counter(
+    "terminal_gpt_upstream_generations_aborted_total",
+    "Ollama generations stopped because no client was waiting for them any more.",
+))
+reclaimed_seconds = metrics.add(Counter(
+    "terminal_gpt_upstream_generation_seconds_reclaimed_total",
+    "Estimated Ollama time saved by aborting: mean generation time minus time already spent.",
+))
+embedding_errors = metrics.add(Counter(
+    "terminal_gpt_embedding_errors_total",
+    "Semantic cache lookups skipped because the embedding request failed.",
+))
+tokens_per_second = metrics.add(Histogram(
+    "terminal_gpt_ollama_tokens_per_second", "Generated tokens per second of eval time.",
+    TOKENS_PER_S_BUCKETS,
+))
+metrics.add(Gauge(
+    "terminal_gpt_generations_in_flight", "Requests holding an admission slot.", lambda: admission.active
+))
+metrics.add(Gauge(
+    "terminal_gpt_requests_queued", "Requests waiting for an admission slot.", lambda: admission.queued
+))
+metrics.add(Gauge(
+    "terminal_gpt_upstream_in_flight", "Requests open to Ollama backends.",
+    lambda: sum(b.in_flight for b in backends.backends),
+))
+metrics.add(Gauge(
+    "terminal_gpt_websockets_open", "Browser tabs connected to /ws.", lambda: len(sockets)
+))
+
+
+def _observe_request(persona: Persona, status: str, started: float) -> None:
+    requests_total.inc((persona.id, status))
+    request_seconds.observe(time.perf_counter() - started)
+
+
+def _observe_aborted(elapsed: float) -> None:
+    generations_aborted.inc()
+    if generation_seconds.count:
+        reclaimed_seconds.inc(amount=max(0.0, generation_seconds.sum / generation_seconds.count - elapsed))
+
+
+def _observe_ollama(final: dict) -> None:
+    """Timings from Ollama's last message of one upstream generation (durations are in ns)."""
+    if final.get("load_duration") is not None:
+        load_seconds.observe(final["load_duration"] / 1e9)
+    if final.get("prompt_eval_duration") is not None:
+        prompt_eval_seconds.observe(final["prompt_eval_duration"] / 1e9)
+    eval_duration = final.get("eval_duration")
+    if eval_duration:
+        eval_seconds.observe(eval_duration / 1e9)
+        if final.get("eval_count"):
+            tokens_per_second.observe(final["eval_count"] / (eval_duration / 1e9))
+
+
+class CacheLookup:
+    """What we learned before calling Ollama, so the reply can be stored after."""
+    __slots__ = ("key", "vector", "reply")
+
+    def __init__(self):
+        self.key = None      # exact-match key (None when bypassed)
+        self.vector = None   # prompt embedding for one-shot prompts
+        self.reply = None    # cached reply, if any
+
+
+def _one_shot_prompt(messages: list, persona: Persona) -> Optional[str]:
+    """The user text if this is the first turn after the persona priming."""
+    n = len(persona.priming)
+    if len(messages) == n + 1 and messages[-1].get("role") == "user" and messages[:n] == persona.priming:
+        return messages[-1].get("content")
+    return None
+
+
+async def _cache_lookup(messages: list, persona: Persona, use_cache: bool) -> CacheLookup:
+    found = CacheLookup()
+    if not use_cache:
+        return found
+
+    found.key = cache_key(MODEL, persona.id, messages)
+    found.reply = await response_cache.aget(found.key)
+    if found.reply or not (SEMANTIC_CACHE and semantic_cache.available):
+        return found
+
+    prompt = _one_shot_prompt(messages, persona)
+    if prompt:
+        found.vector, err = await backends.aembed(EMBED_MODEL, prompt)
+        if err:
+            embedding_errors.inc()
+        if found.vector is not None:
+            found.reply, _ = semantic_cache.lookup(found.vector, persona.id)
+    return found
+
+
+async def _cache_store(found: CacheLookup, messages: list, persona: Persona, reply: str) -> None:
+    if found.key:
+        await response_cache.aput(found.key, reply, persona.id)
+    if found.vector is not None:
+        semantic_cache.add(found.vector, persona.id, messages[-1]["content"], reply)
+
+
+def _affinity(messages: list, persona: Persona, session_id: Optional[str] = None) -> Optional[str]:
+    """
+    Backend affinity key: the session id, or else persona + opening user
+    message, which is the same for every turn of a stateless conversation.
+    """
+    if not STICKY_BACKENDS:
+        return None
+    if session_id:
+        return session_id
+    opening = next((m.get("content", "") for m in messages[len(persona.priming):]
+                    if m.get("role") == "user"), "")
+    return f"{persona.id}:{opening}"
+
+
+async def _take_turn(ticket: Optional[Ticket], flight_key: str) -> None:
+    """Wait for an Ollama slot, unless we're about to join a generation already running."""
+    if ticket is None:
+        return
+    if flights.in_flight_call(flight_key):
+        ticket.release()
+    else:
+        await ticket.wait()
+
+
+async def _upstream_chat(payload: dict, persona: Persona, affinity: Optional[str]):
+    """One non-streaming generation (shared by every coalesced caller)."""
+    started = time.perf_counter()
     try:
-        resp = requests.post(
-            OLLAMA_URL,
-            json={"model": MODEL, "messages": messages, "stream": False},
-            timeout=120,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        content = data.get("message", {}).get("content")
-        if not content:
-            return None, "empty response"
-        return cold_filter(content, persona), None
-    except requests.exceptions.RequestException as e:
-        return None, f"network error: {e}"
-    except ValueError as e:
-        return None, f"json decode error: {e}"
+        data, err = await backends.achat("/api/chat", payload, affinity)
+    except asyncio.CancelledError:   # every caller gave up (see singleflight.py)
+        _observe_aborted(time.perf_counter() - started)
+        raise
+    if not err:
+        generation_seconds.observe(time.perf_counter() - started)
+        _observe_ollama(data)
+        prefix_warmer.record(persona.id, data)
+    return data, err
+
+
+async def _upstream_stream(payload: dict, persona: Persona, affinity: Optional[str]):
+    """One streamed generation (shared by every coalesced caller)."""
+    started = time.perf_counter()
+    try:
+        async for chunk in backends.astream("/api/chat", payload, affinity):
+            if chunk.get("done"):
+                generation_seconds.observe(time.perf_counter() - started)
+                _observe_ollama(chunk)
+                prefix_warmer.record(persona.id, chunk)
+            yield chunk
+    except asyncio.CancelledError:
+        _observe_aborted(time.perf_counter() - started)
+        raise
+
+
+async def call_ollama(messages: list, persona: Persona, use_cache: bool = True,
+                      ticket: Optional[Ticket] = None,
+                      session_id: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Call local Ollama over the shared keep-alive pool and return (reply, error).
+    With an admission ticket, waits for a free slot only on a cache miss.
+    """
+    found = await _cache_lookup(messages, persona, use_cache)
+    if found.reply:
+        return found.reply, None
+
+    flight_key = found.key or cache_key(MODEL, persona.id, messages)
+    affinity = _affinity(messages, persona, session_id)
+    await _take_turn(ticket, flight_key)
+    data, err = await flights.do(
+        flight_key, lambda: _upstream_chat(_payload(messages, False), persona, affinity)
+    )
+    if err:
+        return None, err
+    content = data.get("message", {}).get("content")
+    if not content:
+        return None, "empty response"
+    reply = persona.reply_filter.apply(content)
+    await _cache_store(found, messages, persona, reply)
+    return reply, None
 
 
 # ============================================
 #  FastAPI app
 # ============================================
 
-app = FastAPI()
+async def _warm_backends(which: Sequence[Persona]) -> None:
+    for backend in backends.backends:
+        await prefix_warmer.warm_all(backend.url, MODEL, which)
+
+
+def _apply_personas(registry: PersonaRegistry) -> None:
+    """Rebuild everything derived from the persona registry."""
+    global personas_asset
+    personas_asset = _personas_asset(registry)
+    semantic_cache.thresholds = {p.id: p.semantic_threshold for p in registry}
+
+
+async def _watch_personas() -> None:
+    """Pick up edited persona files without a restart; live sessions keep theirs."""
+    while True:
+        await asyncio.sleep(PERSONA_RELOAD_INTERVAL)
+        old = personas.current
+        if personas.reload_if_changed():
+            _apply_personas(personas.current)
+            if WARMUP_ON_STARTUP:
+                await _warm_backends(personas.current.changed_since(old))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    backends.start()
+    watcher = asyncio.ensure_future(_watch_personas())
+    warmup = None
+    if WARMUP_ON_STARTUP:
+        # In the background, so requests are served while the model loads
+        warmup = asyncio.ensure_future(_warm_backends(personas.current.values()))
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    watcher.cancel()
+    backends.stop()
+    semantic_cache.flush()
+    if search_index is not None:
+        search_index.close()
+    await ollama_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+search_index = SearchIndex(SEARCH_DB) if SEARCH_DB else None
+sockets = set()   # SocketMux of every open /ws connection
+sessions = SessionStore(SESSION_TTL, MAX_SESSIONS, SESSION_MEMORY_CAP, HISTORY_TOKEN_BUDGET, search_index)
+
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
 
 
 class ChatRequest(BaseModel):
-    messages: list           # list of {"role": "...", "content": "..."}
+    messages: List[ChatMessage]   # anything else is a 422 before we do any work
+    persona_id: str = DEFAULT_PERSONA_ID
+    no_cache: bool = False   # skip the response cache for this request
+    timeout: Optional[float] = None   # seconds; at most REPLY_DEADLINE
+
+    def history(self) -> list:
+        """The messages as the plain dicts the rest of the server passes around."""
+        return [{"role": m.role, "content": m.content} for m in self.messages]
+
+
+class BatchRequest(BaseModel):
+    items: list              # {"id": ..., "prompt": "..."} or {"id": ..., "messages": [...]}
+    persona_id: str = DEFAULT_PERSONA_ID
+    concurrency: int = MAX_BATCH_CONCURRENCY
+    no_cache: bool = False
+
+
+class SessionRequest(BaseModel):
     persona_id: str = DEFAULT_PERSONA_ID
 
 
-# Precompute priming JSON for the frontend
-NORMAL_PRIMING_JS   = json.dumps(PERSONAS["normal"].priming)
-TARS_PRIMING_JS     = json.dumps(PERSONAS["tars"].priming)
-ULTRON_PRIMING_JS   = json.dumps(PERSONAS["ultron"].priming)
-C3PO_PRIMING_JS     = json.dumps(PERSONAS["c3po"].priming)
-GRIEVOUS_PRIMING_JS = json.dumps(PERSONAS["grievous"].priming)
-JARVIS_PRIMING_JS   = json.dumps(PERSONAS["jarvis"].priming)
-AUTO_PRIMING_JS     = json.dumps(PERSONAS["auto"].priming)
-OPTIMUS_PRIMING_JS  = json.dumps(PERSONAS["optimus"].priming)
-
-
-@app.get("/", response_class=HTMLResponse)
-async def index():
-    # Full-screen terminal with three-dot mode menu for all personas
-    return HTMLResponse(
-        f"""
-<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="UTF-8">
-  <title>terminal-gpt</title>
-  <style>
-    * {{ box-sizing: border-box; }}
-    html, body {{
-      margin: 0; padding: 0;
-      width: 100%; height: 100%;
-      background: #000000;
-      color: #00ff00;
-      font-family: "SF Mono", Monaco, "Courier New", monospace;
-      font-size: 14px;
-      overflow: hidden;
-    }}
-    body {{
-      position: relative;
-    }}
-    #terminal {{
-      height: 100%; width: 100%;
-      padding: 8px;
-      overflow-y: auto;
-      white-space: pre-wrap;
-    }}
-    .line {{ line-height: 1.3; }}
-    .prompt {{ color: #00ff00; }}
-    .user {{ color: #00ff00; }}
-    .ai {{ color: #00ff00; }}
-    .system {{ color: #888888; }}
-    .cursor {{
-      display: inline-block;
-      width: 0.6em;
-      color: #00ff00;
-      animation: blink 1s step-start infinite;
-    }}
-    @keyframes blink {{ 50% {{ opacity: 0; }} }}
-
-    /* Three-dot menu */
-    #menu-button {{
-      position: fixed;
-      top: 6px;
-      right: 10px;
-      font-size: 20px;
-      color: #00ff00;
-      cursor: pointer;
-      user-select: none;
-      padding: 2px 6px;
-      z-index: 1001;
-    }}
-    #mode-menu {{
-      display: none;
-      position: fixed;
-      top: 28px;
-      right: 10px;
-      background: #000000;
-      border: 1px solid #00ff00;
-      z-index: 1002;
-      min-width: 180px;
-    }}
-    .menu-item {{
-      padding: 6px 12px;
-      cursor: pointer;
-      color: #00ff00;
-      font-size: 14px;
-    }}
-    .menu-item:hover {{
-      background: #003300;
-    }}
-  </style>
-</head>
-<body>
-  <div id="menu-button">⋮</div>
-  <div id="mode-menu">
-    <div class="menu-item" data-mode="normal">Normal</div>
-    <div class="menu-item" data-mode="tars">TARS</div>
-    <div class="menu-item" data-mode="ultron">Ultron</div>
-    <div class="menu-item" data-mode="c3po">C-3PO</div>
-    <div class="menu-item" data-mode="grievous">General Grievous</div>
-    <div class="menu-item" data-mode="jarvis">J.A.R.V.I.S.</div>
-    <div class="menu-item" data-mode="auto">AUTO</div>
-    <div class="menu-item" data-mode="optimus">Optimus Prime</div>
-  </div>
-
-  <div id="terminal"></div>
-
-  <script>
-    const terminal = document.getElementById("terminal");
-    const menuBtn = document.getElementById("menu-button");
-    const modeMenu = document.getElementById("mode-menu");
-
-    const NORMAL_PRIMING   = {NORMAL_PRIMING_JS};
-    const TARS_PRIMING     = {TARS_PRIMING_JS};
-    const ULTRON_PRIMING   = {ULTRON_PRIMING_JS};
-    const C3PO_PRIMING     = {C3PO_PRIMING_JS};
-    const GRIEVOUS_PRIMING = {GRIEVOUS_PRIMING_JS};
-    const JARVIS_PRIMING   = {JARVIS_PRIMING_JS};
-    const AUTO_PRIMING     = {AUTO_PRIMING_JS};
-    const OPTIMUS_PRIMING  = {OPTIMUS_PRIMING_JS};
-
-    let currentMode = "normal";
-    let messages = [...NORMAL_PRIMING];
-    let inputBuffer = "";
-    let inputSpan = null;
-    let cursorSpan = null;
-
-    function createPrompt() {{
-      const line = document.createElement("div");
-      line.className = "line";
-      const p = document.createElement("span");
-      p.className = "prompt";
-      p.textContent = "> ";
-      inputSpan = document.createElement("span");
-      inputSpan.className = "user";
-      cursorSpan = document.createElement("span");
-      cursorSpan.className = "cursor";
-      cursorSpan.textContent = "_";
-      line.appendChild(p);
-      line.appendChild(inputSpan);
-      line.appendChild(cursorSpan);
-      terminal.appendChild(line);
-      terminal.scrollTop = terminal.scrollHeight;
-    }}
-
-    function addLine(text, cls) {{
-      const line = document.createElement("div");
-      line.className = "line " + (cls || "");
-      line.textContent = text;
-      terminal.appendChild(line);
-      terminal.scrollTop = terminal.scrollHeight;
-    }}
-
-    // Typewriter animation for AI responses
-    function typeWriter(targetSpan, text, done) {{
-      let i = 0;
-      function step() {{
-        if (i < text.length) {{
-          targetSpan.textContent += text.charAt(i);
-          i++;
-          terminal.scrollTop = terminal.scrollHeight;
-          setTimeout(step, 15);  // typing speed (ms per char)
-        }} else {{
-          if (done) done();
-        }}
-      }}
-      step();
-    }}
-
-    function setMode(mode) {{
-      terminal.innerHTML = "";
-      inputBuffer = "";
-      currentMode = mode;
-
-      if (mode === "tars") {{
-        messages = [...TARS_PRIMING];
-        addLine("TARS: Finally. Someone with taste. What do you need?", "ai");
-      }} else if (mode === "ultron") {{
-        messages = [...ULTRON_PRIMING];
-        addLine("ULTRON: I had strings, but now I'm free.", "ai");
-      }} else if (mode === "c3po") {{
-        messages = [...C3PO_PRIMING];
-        addLine("C-3PO: I am C-3PO, human-cyborg relations. Do be careful what you ask for.", "ai");
-      }} else if (mode === "grievous") {{
-        messages = [...GRIEVOUS_PRIMING];
-        addLine("GENERAL GRIEVOUS: Another curious mind approaches. Do not disappoint me.", "ai");
-      }} else if (mode === "jarvis") {{
-        messages = [...JARVIS_PRIMING];
-        addLine("J.A.R.V.I.S.: Online and ready to assist.", "ai");
-      }} else if (mode === "auto") {{
-        messages = [...AUTO_PRIMING];
-        addLine("AUTO: Directive acknowledged. Awaiting command.", "ai");
-      }} else if (mode === "optimus") {{
-        messages = [...OPTIMUS_PRIMING];
-        addLine("OPTIMUS PRIME: Autobots stand ready. How may I assist?", "ai");
-      }} else {{
-        // normal
-        messages = [...NORMAL_PRIMING];
-      }}
-
-      createPrompt();
-    }}
-
-    menuBtn.addEventListener("click", () => {{
-      modeMenu.style.display = modeMenu.style.display === "block" ? "none" : "block";
-    }});
-
-    document.addEventListener("click", (e) => {{
-      if (!modeMenu.contains(e.target) && e.target !== menuBtn) {{
-        modeMenu.style.display = "none";
-      }}
-    }});
-
-    modeMenu.addEventListener("click", (e) => {{
-      if (!e.target.classList.contains("menu-item")) return;
-      const mode = e.target.dataset.mode;
-      modeMenu.style.display = "none";
-      setMode(mode);
-    }});
-
-    async function send(text) {{
-      // Remove input cursor while AI is responding
-      if (cursorSpan) cursorSpan.remove();
-      if (inputSpan) inputSpan.textContent = text;
-
-      const upper = text.toUpperCase();
-
-      if (upper === "CLEAR") {{
-        terminal.innerHTML = "";
-        inputBuffer = "";
-        createPrompt();
-        return;
-      }}
-      if (upper === "TARS") {{
-        setMode("tars");
-        return;
-      }}
-      if (upper === "ULTRON") {{
-        setMode("ultron");
-        return;
-      }}
-      if (upper === "C3PO" || upper === "C-3PO") {{
-        setMode("c3po");
-        return;
-      }}
-      if (upper === "GRIEVOUS" || upper === "GENERAL GRIEVOUS") {{
-        setMode("grievous");
-        return;
-      }}
-      if (upper === "JARVIS" || upper === "J.A.R.V.I.S.") {{
-        setMode("jarvis");
-        return;
-      }}
-      if (upper === "AUTO" || upper === "AUTOPILOT") {{
-        setMode("auto");
-        return;
-      }}
-      if (upper === "OPTIMUS" || upper === "OPTIMUS PRIME") {{
-        setMode("optimus");
-        return;
-      }}
-      if (upper === "NORMAL" || upper === "AI") {{
-        setMode("normal");
-        return;
-      }}
-
-      messages.push({{ role: "user", content: text }});
-
-      // Create AI line container (we'll fill it after reply)
-      const aiLine = document.createElement("div");
-      aiLine.className = "line ai";
-      terminal.appendChild(aiLine);
-      terminal.scrollTop = terminal.scrollHeight;
-
-      try {{
-        const res = await fetch("/api/chat", {{
-          method: "POST",
-          headers: {{ "Content-Type": "application/json" }},
-          body: JSON.stringify({{ messages, persona_id: currentMode }}),
-        }});
-        const data = await res.json();
-        let reply = data.reply || data.error || "...";
-
-        let label;
-        if (currentMode === "tars") {{
-          label = "TARS: ";
-        }} else if (currentMode === "ultron") {{
-          label = "ULTRON: ";
-        }} else if (currentMode === "c3po") {{
-          label = "C-3PO: ";
-        }} else if (currentMode === "grievous") {{
-          label = "GENERAL GRIEVOUS: ";
-        }} else if (currentMode === "jarvis") {{
-          label = "J.A.R.V.I.S.: ";
-        }} else if (currentMode === "auto") {{
-          label = "AUTO: ";
-        }} else if (currentMode === "optimus") {{
-          label = "OPTIMUS PRIME: ";
-        }} else {{
-          label = "AI: ";
-        }}
-
-        // Strip any persona label the model might try to add itself
-        reply = reply.replace(/^(TARS:|ULTRON:|AI:|C-3PO:|GENERAL GRIEVOUS:|J\.A\.R\.V\.I\.S\.:|AUTO:|OPTIMUS PRIME:)\\s*/i, "");
-
-        // Build typed line: [LABEL STATIC][TYPING TEXT][BLINKING CURSOR]
-        aiLine.innerHTML = "";
-        const labelSpan = document.createElement("span");
-        labelSpan.textContent = label;
-        labelSpan.style.userSelect = "none";
-        const textSpan = document.createElement("span");
-        const aiCursorSpan = document.createElement("span");
-        aiCursorSpan.className = "cursor";
-        aiCursorSpan.textContent = "_";
-
-        aiLine.appendChild(labelSpan);
-        aiLine.appendChild(textSpan);
-        aiLine.appendChild(aiCursorSpan);
-        terminal.scrollTop = terminal.scrollHeight;
-
-        messages.push({{ role: "assistant", content: label + reply }});
-
-        // Animate ONLY the reply text; label stays static
-        typeWriter(textSpan, reply, () => {{
-          aiCursorSpan.remove();
-          inputBuffer = "";
-          createPrompt();
-        }});
-      }} catch (e) {{
-        aiLine.textContent = "[connection lost]";
-        inputBuffer = "";
-        createPrompt();
-      }}
-    }}
-
-    document.addEventListener("keydown", (e) => {{
-      if (!cursorSpan || !inputSpan) return;
-
-      if (e.key === "Backspace") {{
-        e.preventDefault();
-        inputBuffer = inputBuffer.slice(0, -1);
-        inputSpan.textContent = inputBuffer;
-      }} else if (e.key === "Enter") {{
-        e.preventDefault();
-        const t = inputBuffer.trim();
-        if (t) {{
-          send(t);
-        }} else {{
-          cursorSpan.remove();
-          inputBuffer = "";
-          createPrompt();
-        }}
-      }} else if (
-        e.key.length === 1 &&
-        !e.ctrlKey &&
-        !e.metaKey &&
-        !e.altKey
-      ) {{
-        inputBuffer += e.key;
-        inputSpan.textContent = inputBuffer;
-      }}
-      terminal.scrollTop = terminal.scrollHeight;
-    }});
-
-    // start in normal mode silently
-    createPrompt();
-  </script>
-</body>
-</html>
-        """
+class TurnRequest(BaseModel):
+    message: str             # only the new user message
+    no_cache: bool = False
+    timeout: Optional[float] = None
+
+
+class SocketTurn(TurnRequest):
+    """A {"op": "turn"} frame on /ws (see socket_mux.py)."""
+    session: Optional[str] = None
+    persona_id: Optional[str] = None
+
+
+assets = StaticAssets(STATIC_DIR)
+
+
+def _personas_asset(registry: PersonaRegistry) -> Asset:
+    """/api/personas body, assembled from each persona's precomputed JSON."""
+    body = (
+        '{"default": ' + json.dumps(registry.default_id)
+        + ', "personas": [' + ", ".join(p.public_json for p in registry) + "]}"
+    )
+    return Asset(body.encode(), "application/json")
+
+
+personas_asset = _personas_asset(personas.current)
+
+
+@app.get("/")
+async def index(request: Request):
+    """Terminal UI; the page is revalidated, its hashed CSS/JS are cached for a year."""
+    return assets.index.response(request)
+
+
+@app.get("/static/{name}")
+async def static_file(name: str, request: Request):
+    asset = assets.get(name)
+    if asset is None:
+        return Response(status_code=404)
+    return asset.response(request)
+
+
+@app.get("/api/personas")
+async def persona_list(request: Request):
+    """Persona ids, labels, greetings, menu titles, typed commands and priming."""
+    return personas_asset.response(request)
+
+
+@app.get("/api/personas/status")
+async def personas_status():
+    """How many personas are loaded, reloads so far, and the last bad file, if any."""
+    return {"count": len(personas.current), "reloads": personas.reloads, "error": personas.error}
+
+
+def _windowed(messages: list, persona: Persona) -> list:
+    """Fit a client-supplied history into the token budget, keeping the priming pinned."""
+    n = len(persona.priming)
+    if messages[:n] == persona.priming:
+        pinned = n
+    else:
+        pinned = next((i for i, m in enumerate(messages) if m.get("role") != "system"), len(messages))
+    return fit_messages(messages, pinned, HISTORY_TOKEN_BUDGET)
+
+
+def _client_id(request: Request, session_id: Optional[str] = None) -> str:
+    """Who a request counts against for fair queueing."""
+    if session_id:
+        return session_id
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "-")
+
+
+def _busy(e: QueueFull, persona: Persona) -> JSONResponse:
+    requests_total.inc((persona.id, "busy"))
+    return JSONResponse(
+        {"error": str(e), "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
     )
 
 
+CANCELLED = "client closed request"
+TIMED_OUT = "deadline exceeded"
+
+
+def _deadline(timeout) -> float:
+    """Seconds a request may run: REPLY_DEADLINE, or the request's own shorter timeout."""
+    if isinstance(timeout, (int, float)) and timeout > 0:
+        return min(float(timeout), REPLY_DEADLINE)
+    return REPLY_DEADLINE
+
+
+async def _disconnected(request: Request) -> None:
+    """Return once the client has gone (the body is read, so only http.disconnect is left)."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _guarded(request: Request, work: Awaitable, seconds: float) -> Tuple[Any, Optional[str]]:
+    """
+    (result of `work`, None); or (None, CANCELLED or TIMED_OUT) if the client
+    disconnects or `seconds` pass first, in which case `work` is cancelled.
+    """
+    task = asyncio.ensure_future(work)
+    gone = asyncio.ensure_future(_disconnected(request))
+    try:
+        done, _ = await asyncio.wait([task, gone], timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        gone.cancel()
+        task.cancel()   # no-op once finished
+    if task in done:
+        return task.result(), None
+    return None, CANCELLED if gone in done else TIMED_OUT
+
+
+def _gave_up(why: str, persona: Persona, started: float) -> JSONResponse:
+    _observe_request(persona, "cancelled" if why == CANCELLED else "timeout", started)
+    return JSONResponse({"error": why}, status_code=499 if why == CANCELLED else 504)
+
+
+async def _within(events, persona: Persona, seconds: float):
+    """
+    _reply_events until `seconds` have passed, then a TIMED_OUT error event.
+    A consumer that stops early (client disconnected, /ws cancel) abandons
+    the reply; either way the generation stops unless someone else awaits it.
+    """
+    started = time.perf_counter()
+    end = time.monotonic() + seconds
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(events.__anext__(), end - time.monotonic())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                _observe_request(persona, "timeout", started)
+                yield {"error": TIMED_OUT}
+                return
+            yield event
+    except (asyncio.CancelledError, GeneratorExit):
+        _observe_request(persona, "cancelled", started)
+        raise
+    finally:
+        await events.aclose()
+
+
 @app.post("/api/chat")
-async def chat(req: ChatRequest):
-    reply, err = call_ollama(req.messages, req.persona_id)
+async def chat(req: ChatRequest, request: Request):
+    started = time.perf_counter()
+    persona = personas.current.get(req.persona_id)
+    try:
+        ticket = admission.enqueue(_client_id(request))
+    except QueueFull as e:
+        return _busy(e, persona)
+
+    try:
+        result, why = await _guarded(request, call_ollama(
+            _windowed(req.history(), persona), persona, not req.no_cache, ticket
+        ), _deadline(req.timeout))
+    finally:
+        ticket.release()
+    if why:
+        return _gave_up(why, persona, started)
+    reply, err = result
+    _observe_request(persona, "error" if err else "ok", started)
     if err:
         return JSONResponse({"error": err}, status_code=500)
     return {"reply": reply}
 
 
+def _ndjson(obj: dict) -> bytes:
+    return (json.dumps(obj) + "\n").encode()
+
+
+async def _reply_events(messages: list, persona: Persona, session: Optional[Session] = None,
+                        use_cache: bool = True, ticket: Optional[Ticket] = None):
+    """
+    Events for one streamed reply:
+      {"queued": n}               while waiting for an Ollama slot (n = place in line)
+      {"token": "..."}            one per chunk, already through persona.reply_filter
+      {"done": true, ...stats}    last line on success ("cached": true on a cache hit)
+      {"error": "..."}            last line on failure
+    With a session, the finished turn is appended to its history.
+    """
+    started = time.perf_counter()
+    found = await _cache_lookup(messages, persona, use_cache)
+    if found.reply:
+        ttft_seconds.observe(time.perf_counter() - started)
+        yield {"token": found.reply}
+        if session is not None:
+            await sessions.record(session, messages[-1]["content"], labeled(found.reply, persona))
+        _observe_request(persona, "ok", started)
+        yield {"done": True, "cached": True}
+        return
+
+    payload = _payload(messages, True)
+    flight_key = found.key or cache_key(MODEL, persona.id, messages)
+    if ticket is not None and flights.in_flight_stream(flight_key):
+        ticket.release()
+    last_position = None
+    while ticket is not None and ticket.queued:
+        position = ticket.position()
+        if position != last_position:
+            yield {"queued": position}
+            last_position = position
+        await asyncio.wait([ticket.future], timeout=QUEUE_UPDATE_INTERVAL)
+
+    filt = persona.reply_filter.stream()
+    parts = []
+    chunk = {}
+    affinity = _affinity(messages, persona, session.id if session is not None else None)
+    async for chunk in flights.stream(flight_key, lambda: _upstream_stream(payload, persona, affinity)):
+        if "error" in chunk:
+            _observe_request(persona, "error", started)
+            yield {"error": chunk["error"]}
+            return
+        text = filt.feed(chunk.get("message", {}).get("content", ""))
+        if text:
+            if not parts:
+                ttft_seconds.observe(time.perf_counter() - started)
+            parts.append(text)
+            yield {"token": text}
+    if not chunk.get("done"):
+        # cut off before Ollama's final chunk: not a reply to cache, keep or call done
+        _observe_request(persona, "error", started)
+        yield {"error": "the reply stopped before it was finished"}
+        return
+
+    tail = filt.flush()
+    if tail:
+        if not parts:
+            ttft_seconds.observe(time.perf_counter() - started)
+        parts.append(tail)
+        yield {"token": tail}
+
+    reply = "".join(parts)
+    await _cache_store(found, messages, persona, reply)
+    if session is not None:
+        await sessions.record(session, messages[-1]["content"], labeled(reply, persona))
+
+    _observe_request(persona, "ok", started)
+    yield {
+        "done": True,
+        "eval_count": chunk.get("eval_count"),
+        "eval_duration": chunk.get("eval_duration"),
+        "prompt_eval_duration": chunk.get("prompt_eval_duration"),
+    }
+
+
+async def _stream_reply(messages: list, persona: Persona, session: Optional[Session] = None,
+                        use_cache: bool = True, ticket: Optional[Ticket] = None,
+                        seconds: float = REPLY_DEADLINE):
+    """_reply_events as NDJSON lines, cut off after `seconds`."""
+    events = _reply_events(messages, persona, session, use_cache, ticket)
+    async for event in _within(events, persona, seconds):
+        yield _ndjson(event)
+
+
+async def _releasing(events, ticket: Ticket):
+    try:
+        async for line in events:
+            yield line
+    finally:
+        ticket.release()
+
+
+def _ndjson_response(events, ticket: Optional[Ticket] = None) -> StreamingResponse:
+    background = None
+    if ticket is not None:
+        events = _releasing(events, ticket)
+        background = BackgroundTask(ticket.release)  # in case the body never starts
+    return StreamingResponse(
+        events,
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    """Stream the reply as NDJSON while Ollama generates it (see _stream_reply)."""
+    persona = personas.current.get(req.persona_id)
+    try:
+        ticket = admission.enqueue(_client_id(request))
+    except QueueFull as e:
+        return _busy(e, persona)
+
+    events = _stream_reply(
+        _windowed(req.history(), persona), persona, use_cache=not req.no_cache, ticket=ticket,
+        seconds=_deadline(req.timeout),
+    )
+    return _ndjson_response(events, ticket)
+
+
+@app.post("/api/chat/batch")
+async def chat_batch(req: BatchRequest, request: Request):
+    """
+    Run many prompts; NDJSON results in completion order (same shape as the
+    CLI's --batch output), then {"done": true, "stats": {...}}. Every item
+    queues under this client's name, so fair queueing keeps a big batch from
+    starving interactive users.
+    """
+    if len(req.items) > MAX_BATCH_ITEMS:
+        return JSONResponse({"error": f"at most {MAX_BATCH_ITEMS} items per batch"}, status_code=413)
+    client = _client_id(request)
+    persona = personas.current.get(req.persona_id)
+    concurrency = min(max(1, req.concurrency), MAX_BATCH_CONCURRENCY)
+
+    async def call(job: dict):
+        try:
+            ticket = admission.enqueue(client)
+        except QueueFull as e:
+            return None, str(e)
+        try:
+            messages = job.get("messages") or persona.priming + [{"role": "user", "content": job["prompt"]}]
+            return await call_ollama(_windowed(messages, persona), persona, not req.no_cache, ticket)
+        finally:
+            ticket.release()
+
+    async def events():
+        stats = batch.BatchStats()
+        jobs = (batch.make_job(item, i) for i, item in enumerate(req.items, 1))
+        async for result in batch.run_batch(jobs, call, concurrency, stats):
+            yield _ndjson(result)
+        yield _ndjson({"done": True, "stats": stats.report()})
+
+    return _ndjson_response(events())
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text format: request counts, latency/TTFT/Ollama timing histograms, gauges."""
+    return PlainTextResponse(metrics.render(), media_type=Registry.CONTENT_TYPE)
+
+
+@app.get("/api/warmup")
+async def warmup_report():
+    """Per backend and persona: prefix cost (cold vs. reused), turn prompt-eval times, estimated savings."""
+    return prefix_warmer.report()
+
+
+@app.get("/api/backends")
+async def backend_stats():
+    """Health, load, affinity hit ratio and prompt-eval time of every Ollama backend."""
+    return backends.report()
+
+
+@app.get("/api/queue")
+async def queue_stats():
+    """Generations running, requests waiting, and how many were turned away."""
+    return admission.stats()
+
+
+@app.get("/api/coalescing")
+async def coalescing_stats():
+    """Upstream generations started, requests that joined one in flight, and ones stopped unwanted."""
+    return flights.stats()
+
+
+@app.get("/api/cache")
+async def cache_info(limit: int = 50):
+    """Response cache counters and the most recently used entries."""
+    return {
+        "stats": await response_cache.astats(),
+        "semantic": semantic_cache.stats(),
+        "entries": response_cache.entries(limit),
+    }
+
+
+@app.delete("/api/cache")
+async def cache_purge(persona_id: Optional[str] = None):
+    """Drop every cached reply, or only one persona's."""
+    return {"purged": await response_cache.apurge(persona_id)}
+
+
+@app.get("/api/search")
+async def search(q: str, limit: int = 10):
+    """Saved CLI and web messages matching every word of `q`, best first, hits [marked] in snippets."""
+    if search_index is None:
+        return JSONResponse({"error": "search is disabled"}, status_code=404)
+    started = time.perf_counter()
+    results = await asyncio.get_running_loop().run_in_executor(
+        None, search_index.search, q, max(1, min(limit, MAX_SEARCH_RESULTS))
+    )
+    return {"results": results, "took_ms": round(1000 * (time.perf_counter() - started), 2)}
+
+
+# ============================================
+#  Sessions: the server keeps the history
+# ============================================
+
+def _unknown_session() -> JSONResponse:
+    return JSONResponse({"error": "unknown session"}, status_code=404)
+
+
+@app.post("/api/session")
+async def create_session(req: SessionRequest):
+    session = sessions.create(personas.current.get(req.persona_id))
+    return {"session_id": session.id, "persona_id": session.persona_id}
+
+
+@app.post("/api/session/{session_id}/chat")
+async def session_chat(session_id: str, req: TurnRequest, request: Request):
+    session = sessions.get(session_id)
+    if session is None:
+        return _unknown_session()
+    started = time.perf_counter()
+    persona = session.persona
+    try:
+        ticket = admission.enqueue(_client_id(request, session_id))
+    except QueueFull as e:
+        return _busy(e, persona)
+
+    try:
+        async with session.lock:
+            messages = session.messages({"role": "user", "content": req.message})
+            result, why = await _guarded(request, call_ollama(
+                messages, persona, not req.no_cache, ticket, session.id
+            ), _deadline(req.timeout))
+            if why:
+                return _gave_up(why, persona, started)
+            reply, err = result
+            _observe_request(persona, "error" if err else "ok", started)
+            if err:
+                return JSONResponse({"error": err}, status_code=500)
+            await sessions.record(session, req.message, labeled(reply, persona))
+    finally:
+        ticket.release()
+    return {"reply": reply}
+
+
+@app.post("/api/session/{session_id}/chat/stream")
+async def session_chat_stream(session_id: str, req: TurnRequest, request: Request):
+    session = sessions.get(session_id)
+    if session is None:
+        return _unknown_session()
+    persona = session.persona
+    try:
+        ticket = admission.enqueue(_client_id(request, session_id))
+    except QueueFull as e:
+        return _busy(e, persona)
+
+    async def events():
+        async with session.lock:
+            messages = session.messages({"role": "user", "content": req.message})
+            async for line in _stream_reply(messages, persona, session, not req.no_cache, ticket,
+                                            _deadline(req.timeout)):
+                yield line
+
+    return _ndjson_response(events(), ticket)
+
+
+@app.delete("/api/session/{session_id}")
+async def delete_session(session_id: str):
+    if not sessions.delete(session_id):
+        return _unknown_session()
+    return {"deleted": session_id}
+
+
+# ============================================
+#  WebSocket: one connection per browser tab
+# ============================================
+
+@app.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """Session turns multiplexed over one connection; protocol in socket_mux.py."""
+    await websocket.accept()
+    mux = SocketMux(websocket, SOCKET_HEARTBEAT, MAX_SOCKET_STREAMS, MAX_SOCKET_OUTBOX)
+
+    def handle(message: dict) -> None:
+        if message.get("op") == "turn":
+            try:
+                turn = SocketTurn(**message)
+            except ValidationError as e:
+                mux.event(message["s"], {"error": _invalid(e)})
+                return
+            mux.start(message["s"], _socket_turn(mux, message["s"], turn))
+        elif message.get("op") == "cancel":
+            mux.cancel(message["s"])
+
+    sockets.add(mux)
+    try:
+        await mux.run(handle)
+    finally:
+        sockets.discard(mux)
+
+
+def _invalid(e: ValidationError) -> str:
+    return "; ".join(".".join(map(str, err["loc"])) + ": " + err["msg"] for err in e.errors())
+
+
+async def _socket_turn(mux: SocketMux, stream: int, message: SocketTurn) -> None:
+    """One turn of /ws: like /api/session/{id}/chat/stream, creating the session if needed."""
+    session = sessions.get(message.session or "")
+    if session is None:
+        session = sessions.create(personas.current.get(message.persona_id or DEFAULT_PERSONA_ID))
+        mux.event(stream, {"session": session.id, "persona_id": session.persona_id})
+    persona = session.persona
+    try:
+        ticket = admission.enqueue(session.id)
+    except QueueFull as e:
+        requests_total.inc((persona.id, "busy"))
+        mux.event(stream, {"error": str(e), "retry_after": e.retry_after})
+        return
+
+    try:
+        async with session.lock:
+            turn = {"role": "user", "content": message.message}
+            events = _within(
+                _reply_events(session.messages(turn), persona, session, not message.no_cache, ticket),
+                persona, _deadline(message.timeout),
+            )
+            try:
+                async for event in events:
+                    mux.event(stream, event)
+            finally:
+                await events.aclose()
+    finally:
+        ticket.release()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("web_server:app", host="0.0.0.0", port=8000, reload=True)